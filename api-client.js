@@ -172,6 +172,12 @@ class APIClient {
         return this.request('GET', `/v1/moods?days=${days}`);
     }
 
+    // ============= BATCH SYNC ENDPOINTS (API v1) =============
+    // Replays offline-queued records in one request; every item needs a unique `key`
+    async ingestBatch({ sessions = [], moods = [], reflections = [] }) {
+        return this.request('POST', '/v1/batch', { sessions, moods, reflections });
+    }
+
     // ============= FAILURE ANALYTICS ENDPOINTS =============
     async getFailureAnalytics(days = 30) {
         return this.request('GET', `/v1/analytics/failure?days=${days}`);
@@ -182,11 +188,39 @@ class APIClient {
         return this.request('POST', '/v1/planner/generate', {});
     }
 
+    // ============= LEADERBOARD ENDPOINTS =============
+    // period: 'all' ranks by XP, 'week' by minutes studied since Monday
+    async getLeaderboard(period = 'all', limit = 10) {
+        return this.request('GET', `/v1/leaderboard?period=${period}&limit=${limit}`);
+    }
+
+    async getMyRank(period = 'all') {
+        return this.request('GET', `/v1/leaderboard/me?period=${period}`);
+    }
+
     // ============= SYNC STATUS ENDPOINTS =============
     async getSyncStatus() {
         return this.request('GET', '/v1/sync/status');
     }
 
+    async getSyncChanges(since = 0, limit = 500) {
+        return this.request('GET', `/v1/sync/changes?since=${since}&limit=${limit}`);
+    }
+
+    // Resolves with {cursor, entities} once data changes after `since` (entities is empty on timeout)
+    async waitForChanges(since, timeout = 25) {
+        return this.request('GET', `/v1/sync/wait?since=${since}&timeout=${timeout}`);
+    }
+
+    // Calls onChange({cursor, entities}) for every change; returns the EventSource (call .close() to stop)
+    subscribeToChanges(since, onChange) {
+        const source = new EventSource(
+            `${API_URL}/v1/sync/events?since=${since}&jwt=${encodeURIComponent(this.token)}`
+        );
+        source.addEventListener('change', (event) => onChange(JSON.parse(event.data)));
+        return source;
+    }
+
     async getAPIInfo() {
         return this.request('GET', '/v1/info', null);
     }
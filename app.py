@@ -1,20 +1,55 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, make_response, stream_with_context, has_request_context, request_started
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_sqlalchemy.session import Session as FlaskSession
+from flask_jwt_extended import JWTManager, create_access_token, decode_token, jwt_required, current_user
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 import os
+import io
+import csv
+import gzip
+import hmac
 import json
-from sqlalchemy import func, desc
+import base64
+import threading
+import bisect
+import time
+import click
+from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from sqlalchemy import func, desc, event, and_, or_, case, extract, literal, text, bindparam
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import make_url
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.exc import IntegrityError
+from collections import Counter, OrderedDict, defaultdict
+
+import badges
+import metrics
+import planner
+import rate_limits  # registers the sqlite:// rate-limit storage
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
 
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
 
-# Rate limiter for security
+# Rate limiter for security. Counters are kept in a SQLite file shared by every worker
+# on the host (memory:// keeps them per process; redis:// shares them across hosts).
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get(
+    'RATELIMIT_STORAGE_URI', f"sqlite:///{os.path.join(app.instance_path, 'ratelimits.db')}")
+app.config['RATELIMIT_STRATEGY'] = os.environ.get('RATELIMIT_STRATEGY', 'sliding-window-counter')
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
@@ -22,17 +57,201 @@ limiter = Limiter(
 )
 
 # Database Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///smart_study_planner.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///smart_study_planner.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
 
+# SQLite connection profile, applied to every new connection. WAL lets readers run
+# alongside the writer; busy_timeout makes writers queue instead of failing with
+# "database is locked".
+app.config['SQLITE_PRAGMAS'] = {
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # negative: KiB
+}
+
+# GET requests read through a separate, query-only engine (DATABASE_READ_URL may point at a replica)
+app.config['DATABASE_READ_ENGINE'] = os.environ.get('DATABASE_READ_ENGINE', 'true').lower() == 'true'
+READ_BIND = 'read'
+if app.config['DATABASE_READ_ENGINE'] and make_url(app.config['SQLALCHEMY_DATABASE_URI']).database not in (None, '', ':memory:'):
+    app.config['SQLALCHEMY_BINDS'] = {
+        READ_BIND: os.environ.get('DATABASE_READ_URL', app.config['SQLALCHEMY_DATABASE_URI'])
+    }
+
+# Password hashing: werkzeug method string as stored in the hash (the cost lives here),
+# plus a bounded pool so bursts of logins cannot take every core
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+app.config['PASSWORD_HASH_QUEUE_MAX'] = int(os.environ.get('PASSWORD_HASH_QUEUE_MAX', 32))
+
+# Keyset pagination for history lists
+app.config['PAGE_SIZE_DEFAULT'] = 100
+app.config['PAGE_SIZE_MAX'] = 1000
+app.config['STREAM_BATCH_SIZE'] = 500
+
+# Batch ingestion
+app.config['BATCH_MAX_ITEMS'] = 1000
+
+# Account import: lines written per transaction
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+
+# Tiered retention: `flask compact-history` folds sessions and moods older than RETENTION_DAYS
+# into study_summaries and moves the raw rows to gzip files under RETENTION_ARCHIVE_DIR
+app.config['RETENTION_DAYS'] = int(os.environ.get('RETENTION_DAYS', 365))
+app.config['RETENTION_ARCHIVE_DIR'] = os.environ.get('RETENTION_ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+
+# Delta sync page size
+app.config['SYNC_PAGE_SIZE_DEFAULT'] = 500
+app.config['SYNC_PAGE_SIZE_MAX'] = 5000
+
+# Sync notifications: long-poll/SSE limits, and how often other workers' changes are picked up
+app.config['SYNC_WAIT_TIMEOUT_DEFAULT'] = 25
+app.config['SYNC_WAIT_TIMEOUT_MAX'] = 60
+app.config['SYNC_EVENTS_HEARTBEAT'] = 20
+app.config['SYNC_EVENTS_MAX_SECONDS'] = int(os.environ.get('SYNC_EVENTS_MAX_SECONDS', 300))
+app.config['SYNC_WATCH_INTERVAL'] = float(os.environ.get('SYNC_WATCH_INTERVAL', 1.0))
+# Requests per user, shared by /sync/wait and /sync/events. Held-open requests are
+# cheap; this stops clients that reconnect in a tight loop.
+app.config['SYNC_RATE_LIMIT'] = os.environ.get('SYNC_RATE_LIMIT', '60 per minute')
+# Accept the access token as ?jwt= on /sync/events (for EventSource). Off by default:
+# URLs end up in proxy and access logs, and with them a token valid for 30 days.
+app.config['SYNC_EVENTS_QUERY_TOKEN'] = os.environ.get('SYNC_EVENTS_QUERY_TOKEN', 'false').lower() == 'true'
+
+# Leaderboards
+app.config['LEADERBOARD_SIZE_DEFAULT'] = 10
+app.config['LEADERBOARD_SIZE_MAX'] = 100
+app.config['LEADERBOARD_WEEKLY_TTL'] = float(os.environ.get('LEADERBOARD_WEEKLY_TTL', 60))
+
+# Weekly planner time budgets (minutes per day)
+app.config['PLANNER_DAILY_MINUTES'] = int(os.environ.get('PLANNER_DAILY_MINUTES', 180))
+app.config['PLANNER_EXAM_DAILY_MINUTES'] = int(os.environ.get('PLANNER_EXAM_DAILY_MINUTES', 300))
+app.config['PLANNER_REST_DAY'] = 'Sunday'
+
+# Maintain the per-user analytics rollup (user_stats) on every write
+app.config['USER_STATS_ROLLUP'] = os.environ.get('USER_STATS_ROLLUP', 'true').lower() == 'true'
+
+# Process-wide cache of User + Gamification rows used to resolve the JWT identity
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 60))
+
+# Per-endpoint latency / SQL metrics at /api/v1/metrics (Prometheus text format). The
+# scraper sends `Authorization: Bearer <METRICS_TOKEN>`; without a token the endpoint
+# refuses every request unless METRICS_PUBLIC opens it explicitly.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['METRICS_PUBLIC'] = os.environ.get('METRICS_PUBLIC', 'false').lower() == 'true'
+app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 10))
+
+# JSON encoder for responses: 'orjson' (default when installed) or 'stdlib'
+app.config['JSON_PROVIDER'] = os.environ.get('JSON_PROVIDER', 'orjson' if orjson else 'stdlib')
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """Flask's json-module provider, writing datetimes as ISO 8601 like the models' to_dict"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(IsoJSONProvider):
+    """orjson-backed provider: same output (sorted keys, ISO datetimes), encoded in C"""
+    
+    def _encode(self, obj, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+    
+    def dumps(self, obj, **kwargs):
+        return self._encode(obj, pretty=bool(kwargs.get('indent'))).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self._encode(obj, pretty) + b'\n', mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {'stdlib': IsoJSONProvider, 'orjson': OrjsonProvider}
+if app.config['JSON_PROVIDER'] == 'orjson' and orjson is None:
+    raise RuntimeError('JSON_PROVIDER=orjson needs orjson: pip install orjson')
+app.json = JSON_PROVIDERS[app.config['JSON_PROVIDER']](app)
+
+
+
+class RoutingSession(FlaskSession):
+    """Session that sends the SELECTs of GET requests to the read engine.
+    
+    Once a GET request writes (lazily rebuilt rollups, cached plans), the rest of
+    its transaction stays on the writer so it reads its own changes.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engines = self._db.engines
+        if bind is None and READ_BIND in engines and has_request_context() and request.method in ('GET', 'HEAD'):
+            if not self._flushing and getattr(clause, 'is_select', False) and not self.info.get('writing'):
+                return engines[READ_BIND]
+            self.info['writing'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def reset_read_routing(session, transaction):
+    # Committed changes are visible to the read engine again
+    if transaction.parent is None:
+        session.info.pop('writing', None)
+
+
+def sqlite_pragmas(read_only):
+    """Connect-event listener applying SQLITE_PRAGMAS (and query_only for the read engine)"""
+    pragmas = list(app.config['SQLITE_PRAGMAS'].items())
+    if read_only:
+        pragmas.append(('query_only', 'ON'))
+    
+    def apply(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return apply
+
+
 # Initialize extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 jwt = JWTManager(app)
 
+with app.app_context():
+    for bind_key, engine in db.engines.items():
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', sqlite_pragmas(read_only=bind_key == READ_BIND))
+
+
+def read_engine():
+    """Engine for reads outside the request session"""
+    return db.engines.get(READ_BIND, db.engine)
+
 # ============= DATABASE MODELS =============
 
+def list_values(obj):
+    """An ORM object's list_columns() values, shaped like a row from a list query"""
+    return tuple(getattr(obj, column.key) for column in obj.list_columns())
+
+
+def isoformat_values(row):
+    """A serialized row with its datetimes as ISO 8601 strings, for encoders other than app.json"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in row.items()}
+
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -49,10 +268,10 @@ class User(db.Model):
     study_sessions = db.relationship('StudySession', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return password_hasher.verify(self.password, password)
     
     def to_dict(self):
         return {
@@ -87,27 +306,40 @@ class Subject(db.Model):
     is_deleted = db.Column(db.Boolean, default=False, index=True)
     deleted_at = db.Column(db.DateTime)
     
+    @classmethod
+    def list_columns(cls):
+        """Table columns list queries select (as plain tuples, no ORM objects) for `serialize`"""
+        c = cls.__table__.c
+        return (c.id, c.name, c.chapters, c.completed_chapters, c.difficulty, c.priority,
+                c.deadline, c.sessions_completed, c.total_time_minutes)
+    
+    @staticmethod
+    def serialize(rows):
+        """API dicts for list_columns() rows; datetimes are left to app.json"""
+        now = datetime.utcnow()
+        return [{
+            'id': id,
+            'name': name,
+            'chapters': chapters,
+            'completed_chapters': completed,
+            'difficulty': difficulty,
+            'priority': priority,
+            'deadline': deadline,
+            'days_left': max(0, (deadline - now).days),
+            'sessions_completed': sessions_completed,
+            'total_time_minutes': total_time_minutes,
+            'completion_percentage': round((completed / chapters) * 100, 1) if chapters > 0 else 0
+        } for id, name, chapters, completed, difficulty, priority, deadline, sessions_completed, total_time_minutes in rows]
+    
     def to_dict(self):
-        days_left = (self.deadline - datetime.utcnow()).days
-        return {
-            'id': self.id,
-            'name': self.name,
-            'chapters': self.chapters,
-            'completed_chapters': self.completed_chapters,
-            'difficulty': self.difficulty,
-            'priority': self.priority,
-            'deadline': self.deadline.isoformat(),
-            'days_left': max(0, days_left),
-            'sessions_completed': self.sessions_completed,
-            'total_time_minutes': self.total_time_minutes,
-            'completion_percentage': round((self.completed_chapters / self.chapters) * 100, 1) if self.chapters > 0 else 0
-        }
+        return isoformat_values(self.serialize([list_values(self)])[0])
 
 
 class Gamification(db.Model):
     __tablename__ = 'gamification'
     __table_args__ = (
         db.Index('idx_user_gamification', 'user_id'),
+        db.Index('idx_gamification_xp', db.desc('xp'), 'user_id'),
     )
     
     id = db.Column(db.Integer, primary_key=True)
@@ -117,18 +349,17 @@ class Gamification(db.Model):
     streak = db.Column(db.Integer, default=0)
     total_minutes_studied = db.Column(db.Integer, default=0)
     last_study_date = db.Column(db.DateTime)
-    badges_earned = db.Column(db.String(500), default='[]')  # JSON array of badge IDs
+    badges_earned = db.Column(db.String(500), default='[]')  # legacy: JSON ids outside the badge registry
+    badges_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')  # one bit per registry badge
     current_mode = db.Column(db.String(20), default='normal')  # normal, exam
+    utc_offset_minutes = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # user's timezone, for streak days
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def get_badges(self):
-        return json.loads(self.badges_earned) if self.badges_earned else []
-    
-    def add_badge(self, badge_id):
-        badges = self.get_badges()
-        if badge_id not in badges:
-            badges.append(badge_id)
-            self.badges_earned = json.dumps(badges)
+        earned = badges.decode(self.badges_mask or 0)
+        if self.badges_earned and self.badges_earned != '[]':
+            earned += json.loads(self.badges_earned)
+        return earned
     
     def to_dict(self):
         return {
@@ -144,6 +375,10 @@ class Gamification(db.Model):
 
 class StudySession(db.Model):
     __tablename__ = 'study_sessions'
+    __table_args__ = (
+        db.Index('idx_user_session_date', 'user_id', 'date', 'id'),
+        db.Index('idx_session_date_user', 'date', 'user_id', 'duration_minutes'),  # weekly leaderboard
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -152,18 +387,31 @@ class StudySession(db.Model):
     date = db.Column(db.DateTime, default=datetime.utcnow)
     pomodoro_count = db.Column(db.Integer, default=1)
     
+    @classmethod
+    def list_columns(cls):
+        c = cls.__table__.c
+        return (c.id, c.subject_id, c.duration_minutes, c.date, c.pomodoro_count)
+    
+    @staticmethod
+    def serialize(rows):
+        return [{
+            'id': id,
+            'subject_id': subject_id,
+            'duration_minutes': duration_minutes,
+            'date': date,
+            'pomodoro_count': pomodoro_count
+        } for id, subject_id, duration_minutes, date, pomodoro_count in rows]
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'subject_id': self.subject_id,
-            'duration_minutes': self.duration_minutes,
-            'date': self.date.isoformat(),
-            'pomodoro_count': self.pomodoro_count
-        }
+        return isoformat_values(self.serialize([list_values(self)])[0])
 
 
 class Reflection(db.Model):
     __tablename__ = 'reflections'
+    __table_args__ = (
+        db.Index('idx_user_reflection_date', 'user_id', 'date', 'id'),
+        db.Index('idx_user_reflection_reason', 'user_id', 'date', 'reason_idx', 'subject_id'),  # covers failure analytics
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -172,18 +420,31 @@ class Reflection(db.Model):
     reason_text = db.Column(db.String(255))
     date = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @classmethod
+    def list_columns(cls):
+        c = cls.__table__.c
+        return (c.id, c.subject_id, c.reason_idx, c.reason_text, c.date)
+    
+    @staticmethod
+    def serialize(rows):
+        return [{
+            'id': id,
+            'subject_id': subject_id,
+            'reason_idx': reason_idx,
+            'reason_text': reason_text,
+            'date': date
+        } for id, subject_id, reason_idx, reason_text, date in rows]
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'subject_id': self.subject_id,
-            'reason_idx': self.reason_idx,
-            'reason_text': self.reason_text,
-            'date': self.date.isoformat()
-        }
+        return isoformat_values(self.serialize([list_values(self)])[0])
 
 
 class StudyMood(db.Model):
     __tablename__ = 'study_moods'
+    __table_args__ = (
+        db.Index('idx_user_mood_time', 'user_id', 'time', 'id'),
+        db.Index('idx_user_mood_effectiveness', 'user_id', 'time', 'effectiveness'),  # covers best study hours
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -193,14 +454,854 @@ class StudyMood(db.Model):
     effectiveness = db.Column(db.Integer)  # 1-5 rating of productivity
     session_id = db.Column(db.Integer, db.ForeignKey('study_sessions.id'))
     
+    @classmethod
+    def list_columns(cls):
+        c = cls.__table__.c
+        return (c.id, c.mood, c.time, c.duration_minutes, c.effectiveness)
+    
+    @staticmethod
+    def serialize(rows):
+        return [{
+            'id': id,
+            'mood': mood,
+            'time': time,
+            'duration_minutes': duration_minutes,
+            'effectiveness': effectiveness
+        } for id, mood, time, duration_minutes, effectiveness in rows]
+    
     def to_dict(self):
-        return {
-            'id': self.id,
-            'mood': self.mood,
-            'time': self.time.isoformat(),
-            'duration_minutes': self.duration_minutes,
-            'effectiveness': self.effectiveness
-        }
+        return isoformat_values(self.serialize([list_values(self)])[0])
+
+
+class UserStats(db.Model):
+    """Per-user analytics rollup, kept in step with subjects/sessions/reflections on every flush"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    subject_count = db.Column(db.Integer, default=0, nullable=False)
+    chapters_total = db.Column(db.Integer, default=0, nullable=False)
+    chapters_completed = db.Column(db.Integer, default=0, nullable=False)
+    low_count = db.Column(db.Integer, default=0, nullable=False)
+    low_chapters = db.Column(db.Integer, default=0, nullable=False)
+    low_completed = db.Column(db.Integer, default=0, nullable=False)
+    medium_count = db.Column(db.Integer, default=0, nullable=False)
+    medium_chapters = db.Column(db.Integer, default=0, nullable=False)
+    medium_completed = db.Column(db.Integer, default=0, nullable=False)
+    high_count = db.Column(db.Integer, default=0, nullable=False)
+    high_chapters = db.Column(db.Integer, default=0, nullable=False)
+    high_completed = db.Column(db.Integer, default=0, nullable=False)
+    session_count = db.Column(db.Integer, default=0, nullable=False)
+    session_minutes = db.Column(db.Integer, default=0, nullable=False)
+    reflection_count = db.Column(db.Integer, default=0, nullable=False)
+    subjects_completed = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    subjects_half_done = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    heatmap_ready = db.Column(db.Boolean, default=False, nullable=False)  # study_heatmap holds full history
+
+
+class StudyHeatmapBucket(db.Model):
+    """Minutes studied per user, day and hour, kept in step with study_sessions on every flush"""
+    __tablename__ = 'study_heatmap'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)  # 0-23
+    minutes = db.Column(db.Integer, default=0, nullable=False)
+    sessions = db.Column(db.Integer, default=0, nullable=False)
+
+
+HOURS_ZERO = json.dumps([0] * 24)
+
+
+class StudySummary(db.Model):
+    """Study sessions and moods past the retention window, compacted to one row per user and day (UTC).
+    
+    Totals are plain columns. The hourly_* columns are JSON lists of 24 counts,
+    index = hour of day, which is all the heatmap and best study hours need.
+    """
+    __tablename__ = 'study_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    sessions = db.Column(db.Integer, default=0, nullable=False)
+    minutes = db.Column(db.Integer, default=0, nullable=False)
+    pomodoros = db.Column(db.Integer, default=0, nullable=False)
+    moods = db.Column(db.Integer, default=0, nullable=False)
+    tired_moods = db.Column(db.Integer, default=0, nullable=False)
+    normal_moods = db.Column(db.Integer, default=0, nullable=False)
+    energetic_moods = db.Column(db.Integer, default=0, nullable=False)
+    mood_minutes = db.Column(db.Integer, default=0, nullable=False)
+    effectiveness_total = db.Column(db.Integer, default=0, nullable=False)  # mean = total / count
+    effectiveness_count = db.Column(db.Integer, default=0, nullable=False)
+    hourly_sessions = db.Column(db.Text, default=HOURS_ZERO, nullable=False)
+    hourly_minutes = db.Column(db.Text, default=HOURS_ZERO, nullable=False)
+    hourly_moods = db.Column(db.Text, default=HOURS_ZERO, nullable=False)
+    hourly_effectiveness_total = db.Column(db.Text, default=HOURS_ZERO, nullable=False)
+    hourly_effectiveness_count = db.Column(db.Text, default=HOURS_ZERO, nullable=False)
+
+
+class WeeklyPlan(db.Model):
+    """Last generated weekly plan per user, valid while plan_version matches subjects_version"""
+    __tablename__ = 'weekly_plans'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    subjects_version = db.Column(db.Integer, default=0, nullable=False)  # bumped when subjects or study mode change
+    plan_version = db.Column(db.Integer)  # subjects_version the stored plan was built from
+    plan_date = db.Column(db.Date)
+    mode = db.Column(db.String(20))
+    daily_minutes = db.Column(db.Integer)  # None = configured default
+    payload = db.Column(db.Text)  # JSON response body
+    generated_at = db.Column(db.DateTime)
+
+
+
+class IngestReceipt(db.Model):
+    """Client idempotency key of a record created through /api/v1/batch"""
+    __tablename__ = 'ingest_receipts'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # sessions, moods, reflections
+    record_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ChangeLogEntry(db.Model):
+    """One row per create/update/delete of a synced record; the id is the sync cursor"""
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        db.Index('idx_user_change', 'user_id', 'id'),
+        {'sqlite_autoincrement': True},  # cursors must never be reused after pruning
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # subjects, sessions, reflections, moods, gamification
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert, delete
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# ============= CURRENT USER RESOLUTION =============
+
+class UserCache:
+    """Bounded LRU cache of detached User rows (with Gamification loaded), expiring after a TTL.
+    
+    Each entry keeps the user's data version (newest change-log id) read in the
+    same statement, so conditional GETs can tell when another process wrote since.
+    """
+    
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, user_id):
+        """(user, version) or None"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, version, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user, version
+    
+    def put(self, user_id, user, version):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[user_id] = (user, version, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+def issue_access_token(user):
+    """Create a JWT whose claims carry the user id so lookups can skip the email index"""
+    return create_access_token(identity=user.email, additional_claims={'uid': user.id})
+
+
+def select_user_with_version(*criteria):
+    """One statement for a User, its Gamification row and its data version, all from one snapshot"""
+    version = db.select(func.coalesce(func.max(ChangeLogEntry.id), 0)).where(
+        ChangeLogEntry.user_id == User.id
+    ).scalar_subquery()
+    return db.select(User, version).options(joinedload(User.gamification)).where(*criteria)
+
+
+def _load_detached_user(*criteria):
+    """(user, version) detached from any session, or (None, 0)"""
+    with Session(read_engine()) as session:
+        row = session.execute(select_user_with_version(*criteria)).first()
+        session.expunge_all()
+    return tuple(row) if row else (None, 0)
+
+
+@jwt.user_lookup_loader
+def load_current_user(jwt_header, jwt_data):
+    """Resolve the JWT to a User attached to the request session.
+    
+    flask_jwt_extended calls this once per request and memoizes the result, and the
+    process-wide cache means most requests attach the user without any SELECT.
+    """
+    user_id = jwt_data.get('uid')
+    
+    # Tokens issued before the uid claim only carry the email
+    if user_id is None:
+        user, version = _load_detached_user(User.email == jwt_data['sub'])
+        if user is None:
+            return None
+        user_cache.put(user.id, user, version)
+    else:
+        cached = user_cache.get(user_id)
+        if cached is None:
+            cached = _load_detached_user(User.id == user_id)
+            if cached[0] is None:
+                return None
+            user_cache.put(user_id, *cached)
+        user, version = cached
+    
+    # conditional_get compares this with the current version before trusting the cached rows
+    g.user_version = version
+    # Copy the cached (never mutated) instances into this request's session without a SELECT
+    return db.session.merge(user, load=False)
+
+
+@jwt.user_lookup_error_loader
+def user_lookup_error(jwt_header, jwt_data):
+    return jsonify({'error': 'User not found'}), 404
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_users(session, flush_context):
+    """Invalidate cached users whose User or Gamification rows were written"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            user_cache.invalidate(obj.id)
+            session.info.setdefault('changed_user_ids', set()).add(obj.id)
+        elif isinstance(obj, Gamification) and obj.user_id is not None:
+            user_cache.invalidate(obj.user_id)
+            session.info.setdefault('changed_user_ids', set()).add(obj.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_changed_users(session):
+    # Invalidate again so a lookup racing the commit cannot leave a pre-commit row cached
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_users(session):
+    session.info.pop('changed_user_ids', None)
+
+
+# ============= PAGINATION HELPERS =============
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor for a (timestamp, id) keyset position"""
+    raw = f'{timestamp.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    timestamp, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+    return datetime.fromisoformat(timestamp), int(row_id)
+
+
+def paginated_list(model, query, time_col, id_col, key):
+    """Serve a newest-first history list with keyset pagination or as streamed NDJSON.
+    
+    Query parameters:
+    - limit: page size (default PAGE_SIZE_DEFAULT, capped at PAGE_SIZE_MAX)
+    - before: cursor; return rows older than it (use next_cursor from a page)
+    - after: cursor; return rows newer than it (use prev_cursor from a page)
+    - format=ndjson: stream every matching row, one JSON object per line
+    
+    `query` is a Core select of model.list_columns(); rows go straight to
+    model.serialize without building ORM objects.
+    """
+    before = request.args.get('before')
+    after = request.args.get('after')
+    try:
+        if before:
+            ts, row_id = decode_cursor(before)
+            query = query.filter(or_(time_col < ts, and_(time_col == ts, id_col < row_id)))
+        if after:
+            ts, row_id = decode_cursor(after)
+            query = query.filter(or_(time_col > ts, and_(time_col == ts, id_col > row_id)))
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    if request.args.get('format') == 'ndjson':
+        statement = query.order_by(time_col.desc(), id_col.desc()).execution_options(
+            yield_per=app.config['STREAM_BATCH_SIZE'])
+        
+        def generate():
+            for rows in db.session.execute(statement).partitions():
+                yield ''.join(app.json.dumps(row) + '\n' for row in model.serialize(rows))
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    limit = request.args.get('limit', app.config['PAGE_SIZE_DEFAULT'], type=int)
+    limit = max(1, min(limit, app.config['PAGE_SIZE_MAX']))
+    
+    # Walk towards newer rows when only `after` is given, then flip back to newest-first
+    if after and not before:
+        rows = db.session.execute(query.order_by(time_col.asc(), id_col.asc()).limit(limit + 1)).all()
+        has_more_newer, has_more_older = len(rows) > limit, True
+        rows = rows[:limit][::-1]
+    else:
+        rows = db.session.execute(query.order_by(time_col.desc(), id_col.desc()).limit(limit + 1)).all()
+        has_more_newer, has_more_older = bool(before), len(rows) > limit
+        rows = rows[:limit]
+    
+    def cursor_of(row):
+        return encode_cursor(getattr(row, time_col.key), row.id)
+    
+    return jsonify({
+        key: model.serialize(rows),
+        'count': len(rows),
+        'next_cursor': cursor_of(rows[-1]) if rows and has_more_older else None,
+        'prev_cursor': cursor_of(rows[0]) if rows and has_more_newer else None
+    }), 200
+
+
+# ============= CHANGE TRACKING =============
+
+SYNCED_ENTITIES = {
+    Subject: 'subjects',
+    StudySession: 'sessions',
+    Reflection: 'reflections',
+    StudyMood: 'moods',
+    Gamification: 'gamification'
+}
+ENTITY_MODELS = {name: model for model, name in SYNCED_ENTITIES.items()}
+
+
+@event.listens_for(Session, 'after_flush')
+def record_changes(session, flush_context):
+    """Append a change-log row for every synced record written in this flush"""
+    now = datetime.utcnow()
+    rows = []
+    for op, objects in (('upsert', session.new), ('upsert', session.dirty), ('delete', session.deleted)):
+        for obj in objects:
+            entity = SYNCED_ENTITIES.get(type(obj))
+            if entity is None or obj.id is None or (objects is session.dirty and not session.is_modified(obj)):
+                continue
+            rows.append({'user_id': obj.user_id, 'entity': entity, 'entity_id': obj.id, 'op': op, 'changed_at': now})
+    
+    if rows:
+        session.connection().execute(ChangeLogEntry.__table__.insert(), rows)
+        session.info.setdefault('notify_user_ids', set()).update(row['user_id'] for row in rows)
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_changes(session):
+    user_ids = session.info.pop('notify_user_ids', None)
+    if user_ids:
+        change_notifier.publish(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_published_changes(session):
+    session.info.pop('notify_user_ids', None)
+
+
+class ChangeNotifier:
+    """In-process pub/sub that wakes sync listeners when a user's data changes.
+    
+    Commits in this worker publish directly. Commits from other workers and CLI
+    jobs are picked up by a watcher thread, which polls the change log's newest
+    id every SYNC_WATCH_INTERVAL seconds while anyone is subscribed. It stands in
+    for a shared broker such as Redis pub/sub. Waiting listeners cost no CPU.
+    """
+    
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._listening = threading.Event()
+        self._watcher = None
+    
+    def publish(self, user_ids):
+        with self._lock:
+            callbacks = [callback for user_id in user_ids for callback in self._subscribers.get(user_id, ())]
+        for callback in callbacks:
+            callback()
+    
+    @contextmanager
+    def subscribe(self, user_id, callback):
+        """Call `callback` (from any thread) on every change to the user's data while inside the block"""
+        with self._lock:
+            self._subscribers[user_id].add(callback)
+            self._listening.set()
+            if self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name='change-watcher', daemon=True)
+                self._watcher.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(callback)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+                if not self._subscribers:
+                    self._listening.clear()
+    
+    def _watch(self):
+        cursor = None
+        while True:
+            if not self._listening.is_set():
+                cursor = None
+                self._listening.wait()
+            time.sleep(self.interval)
+            try:
+                with app.app_context():
+                    newest = db.session.query(func.max(ChangeLogEntry.id)).scalar() or 0
+                    if cursor is not None and newest > cursor:
+                        self.publish({user_id for (user_id,) in db.session.query(ChangeLogEntry.user_id).filter(
+                            ChangeLogEntry.id > cursor, ChangeLogEntry.id <= newest
+                        ).distinct()})
+                    cursor = newest
+            except Exception:
+                app.logger.exception('Change watcher failed')
+
+
+change_notifier = ChangeNotifier(app.config['SYNC_WATCH_INTERVAL'])
+
+
+def changes_since(user_id, since):
+    """Statement: newest change-log id per entity type among the user's rows after `since`"""
+    return db.select(ChangeLogEntry.entity, func.max(ChangeLogEntry.id)).where(
+        ChangeLogEntry.user_id == user_id,
+        ChangeLogEntry.id > since
+    ).group_by(ChangeLogEntry.entity)
+
+
+def summarize_changes(rows, since):
+    return {
+        'cursor': max((cursor for entity, cursor in rows), default=since),
+        'entities': sorted(entity for entity, cursor in rows)
+    }
+
+
+def pending_changes(user_id, since):
+    """{'cursor', 'entities'} for the user's changes after `since`"""
+    return summarize_changes(db.session.execute(changes_since(user_id, since)).all(), since)
+
+
+def latest_change_cursor(user_id):
+    """The user's data version: position of their newest change-log row (one index seek)"""
+    return db.session.query(func.max(ChangeLogEntry.id)).filter(ChangeLogEntry.user_id == user_id).scalar() or 0
+
+
+def data_etag(user_id, version):
+    return f'{user_id}.{version}.{datetime.utcnow().date().isoformat()}'
+
+
+def conditional_get(view):
+    """Answer If-None-Match with 304 when the user's data version has not moved.
+    
+    The ETag combines the data version with today's date (responses include
+    day-relative fields such as days_left) and is checked before the view runs,
+    so a revalidation costs one indexed lookup. Users with no change history
+    (or whose history was pruned) are served normally without an ETag.
+    
+    When the version differs from the one cached with current_user (another
+    worker or a CLI job wrote), the user and gamification rows are reloaded
+    after reading the version, so the body is never older than its ETag.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user = current_user
+        version = latest_change_cursor(user.id)
+        if version != g.get('user_version'):
+            fresh, fresh_version = _load_detached_user(User.id == user.id)
+            if fresh is not None:
+                user_cache.put(user.id, fresh, fresh_version)
+                db.session.merge(fresh, load=False)
+        if not version:
+            return view(*args, **kwargs)
+        
+        etag = data_etag(user.id, version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+
+# ============= ANALYTICS ROLLUPS =============
+
+PRIORITIES = ['low', 'medium', 'high']
+STATS_COLUMNS = [c.name for c in UserStats.__table__.columns if c.name not in ('user_id', 'heatmap_ready')]
+
+
+def previous_value(obj, attr):
+    """An attribute's value before the pending flush changed it"""
+    history = sa_inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+def _stats_contribution(obj, previous=False):
+    """What one row adds to its owner's user_stats; previous=True uses pre-flush values"""
+    def value(attr):
+        return previous_value(obj, attr) if previous else getattr(obj, attr)
+    
+    return stats_contribution(type(obj), value)
+
+
+def stats_contribution(model, value):
+    """What one `model` row adds to user_stats, reading its columns through `value(attr)`"""
+    contribution = Counter()
+    if model is Subject:
+        chapters = value('chapters') or 0
+        completed = value('completed_chapters') or 0
+        contribution.update(
+            subject_count=1, chapters_total=chapters, chapters_completed=completed,
+            subjects_completed=int(chapters > 0 and completed >= chapters),
+            subjects_half_done=int(chapters > 0 and completed * 2 >= chapters)
+        )
+        priority = value('priority')
+        if priority in PRIORITIES:
+            contribution.update({f'{priority}_count': 1, f'{priority}_chapters': chapters, f'{priority}_completed': completed})
+    elif model is StudySession:
+        contribution.update(session_count=1, session_minutes=value('duration_minutes') or 0)
+    elif model is StudySummary:
+        contribution.update(session_count=value('sessions'), session_minutes=value('minutes'))
+    elif model is Reflection:
+        contribution.update(reflection_count=1)
+    return contribution
+
+
+@event.listens_for(Session, 'after_flush')
+def maintain_user_stats(session, flush_context):
+    """Apply row-level deltas to user_stats inside the flushing transaction"""
+    if not app.config['USER_STATS_ROLLUP']:
+        return
+    
+    deltas = defaultdict(Counter)
+    for obj in session.new:
+        if isinstance(obj, (Subject, StudySession, Reflection)):
+            deltas[obj.user_id].update(_stats_contribution(obj))
+    for obj in session.deleted:
+        if isinstance(obj, (Subject, StudySession, Reflection)):
+            deltas[obj.user_id].subtract(_stats_contribution(obj, previous=True))
+    for obj in session.dirty:
+        if isinstance(obj, (Subject, StudySession, Reflection)) and session.is_modified(obj):
+            deltas[obj.user_id].update(_stats_contribution(obj))
+            deltas[obj.user_id].subtract(_stats_contribution(obj, previous=True))
+    
+    apply_stats_deltas(session.connection(), deltas)
+
+
+def apply_stats_deltas(connection, deltas):
+    """Add {user_id: Counter of user_stats columns} to the rollup rows"""
+    table = UserStats.__table__
+    for user_id, delta in deltas.items():
+        values = {name: table.c[name] + amount for name, amount in delta.items() if amount}
+        if values:
+            # Users without a rollup row yet are backfilled from scratch on first read
+            connection.execute(table.update().where(table.c.user_id == user_id).values(**values))
+
+
+def compute_user_stats(user_id):
+    """Aggregate a user's rollup values with GROUP BY queries instead of loading rows"""
+    stats = dict.fromkeys(STATS_COLUMNS, 0)
+    
+    has_chapters = Subject.chapters > 0
+    subject_rows = db.session.query(
+        Subject.priority,
+        func.count(Subject.id),
+        func.coalesce(func.sum(Subject.chapters), 0),
+        func.coalesce(func.sum(Subject.completed_chapters), 0),
+        func.coalesce(func.sum(case((and_(has_chapters, Subject.completed_chapters >= Subject.chapters), 1), else_=0)), 0),
+        func.coalesce(func.sum(case((and_(has_chapters, Subject.completed_chapters * 2 >= Subject.chapters), 1), else_=0)), 0)
+    ).filter(Subject.user_id == user_id).group_by(Subject.priority).all()
+    
+    for priority, count, chapters, completed, subjects_completed, subjects_half_done in subject_rows:
+        stats['subject_count'] += count
+        stats['chapters_total'] += chapters
+        stats['chapters_completed'] += completed
+        stats['subjects_completed'] += subjects_completed
+        stats['subjects_half_done'] += subjects_half_done
+        if priority in PRIORITIES:
+            stats[f'{priority}_count'] = count
+            stats[f'{priority}_chapters'] = chapters
+            stats[f'{priority}_completed'] = completed
+    
+    # Sessions past the retention window only survive as study_summaries totals
+    session_count, session_minutes, compacted_count, compacted_minutes, reflection_count = db.session.query(
+        db.session.query(func.count(StudySession.id)).filter(StudySession.user_id == user_id).scalar_subquery(),
+        db.session.query(func.coalesce(func.sum(StudySession.duration_minutes), 0)).filter(StudySession.user_id == user_id).scalar_subquery(),
+        db.session.query(func.coalesce(func.sum(StudySummary.sessions), 0)).filter(StudySummary.user_id == user_id).scalar_subquery(),
+        db.session.query(func.coalesce(func.sum(StudySummary.minutes), 0)).filter(StudySummary.user_id == user_id).scalar_subquery(),
+        db.session.query(func.count(Reflection.id)).filter(Reflection.user_id == user_id).scalar_subquery()
+    ).one()
+    stats.update(session_count=session_count + compacted_count, session_minutes=session_minutes + compacted_minutes,
+                 reflection_count=reflection_count)
+    return stats
+
+
+def get_user_stats(user_id):
+    """Read the user's rollup row, backfilling it from aggregates when it does not exist yet"""
+    if not app.config['USER_STATS_ROLLUP']:
+        return compute_user_stats(user_id)
+    
+    row = db.session.get(UserStats, user_id)
+    if row is not None:
+        return {name: getattr(row, name) for name in STATS_COLUMNS}
+    
+    row = UserStats(user_id=user_id)
+    try:
+        # Insert the empty row before aggregating: the insert takes the write lock, so
+        # no session can commit rows the aggregates miss and the rollup hooks skip
+        db.session.add(row)
+        db.session.flush()
+    except IntegrityError:
+        # A concurrent request backfilled it first; its row is equally correct
+        db.session.rollback()
+        row = db.session.get(UserStats, user_id)
+        return {name: getattr(row, name) for name in STATS_COLUMNS}
+    
+    stats = compute_user_stats(user_id)
+    for name, value in stats.items():
+        setattr(row, name, value)
+    db.session.commit()
+    return stats
+
+
+def day_of(column):
+    """Calendar day of a datetime column; SQLite returns it as an ISO string"""
+    return func.date(column)
+
+
+def hour_of(column):
+    """Hour (0-23) of a datetime column; SQLAlchemy compiles extract() per dialect"""
+    return extract('hour', column)
+
+
+def as_date(value):
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+@event.listens_for(Session, 'after_flush')
+def maintain_heatmap(session, flush_context):
+    """Apply study session deltas to the per-day/hour heatmap buckets"""
+    if not app.config['USER_STATS_ROLLUP']:
+        return
+    
+    deltas = defaultdict(Counter)
+    for obj in session.new:
+        if isinstance(obj, StudySession):
+            heatmap_delta(deltas, obj.user_id, obj.date, obj.duration_minutes, 1)
+    for obj in session.deleted:
+        if isinstance(obj, StudySession):
+            heatmap_delta(deltas, obj.user_id, previous_value(obj, 'date'), previous_value(obj, 'duration_minutes'), -1)
+    for obj in session.dirty:
+        if isinstance(obj, StudySession) and session.is_modified(obj):
+            heatmap_delta(deltas, obj.user_id, previous_value(obj, 'date'), previous_value(obj, 'duration_minutes'), -1)
+            heatmap_delta(deltas, obj.user_id, obj.date, obj.duration_minutes, 1)
+    
+    apply_heatmap_deltas(session.connection(), deltas)
+
+
+def heatmap_delta(deltas, user_id, when, minutes, sign):
+    """Count one study session (sign=1) or take it back (sign=-1) in `deltas`"""
+    if when is not None:
+        key = (user_id, when.date(), when.hour)
+        deltas[key].update(minutes=sign * (minutes or 0), sessions=sign)
+
+
+def apply_heatmap_deltas(connection, deltas):
+    """Add {(user_id, day, hour): Counter(minutes, sessions)} to the buckets, creating missing ones"""
+    table = StudyHeatmapBucket.__table__
+    changed = {key: delta for key, delta in deltas.items() if delta['minutes'] or delta['sessions']}
+    if not changed:
+        return
+    
+    # One executemany UPDATE; its rowcount is the total, so only a shortfall needs a lookup
+    result = connection.execute(
+        table.update().where(and_(
+            table.c.user_id == bindparam('key_user_id'), table.c.day == bindparam('key_day'),
+            table.c.hour == bindparam('key_hour')
+        )).values(minutes=table.c.minutes + bindparam('add_minutes'), sessions=table.c.sessions + bindparam('add_sessions')),
+        [
+            {'key_user_id': user_id, 'key_day': day, 'key_hour': hour,
+             'add_minutes': delta['minutes'], 'add_sessions': delta['sessions']}
+            for (user_id, day, hour), delta in changed.items()
+        ]
+    )
+    if result.rowcount == len(changed):
+        return
+    added = [
+        {'user_id': user_id, 'day': day, 'hour': hour, 'minutes': delta['minutes'], 'sessions': delta['sessions']}
+        for (user_id, day, hour), delta in changed.items() if delta['sessions'] > 0
+    ]
+    if len(changed) == 1:
+        if added:
+            connection.execute(table.insert(), added)
+        return
+    # Several buckets, some new: create the ones the UPDATE found missing
+    bucket = db.select(table.c.user_id).where(
+        table.c.user_id == bindparam('user_id'), table.c.day == bindparam('day'), table.c.hour == bindparam('hour'))
+    columns = ['user_id', 'day', 'hour', 'minutes', 'sessions']
+    if added:
+        connection.execute(
+            table.insert().from_select(columns, db.select(*(bindparam(name) for name in columns)).where(~bucket.exists())),
+            added
+        )
+
+
+def compute_heatmap_buckets(user_id, start=None, end=None):
+    """(day, hour, minutes, sessions) from raw sessions (one GROUP BY) plus compacted study_summaries"""
+    day, hour = day_of(StudySession.date), hour_of(StudySession.date)
+    query = db.session.query(
+        day, hour, func.sum(StudySession.duration_minutes), func.count(StudySession.id)
+    ).filter(StudySession.user_id == user_id)
+    compacted = db.session.query(
+        StudySummary.day, StudySummary.hourly_minutes, StudySummary.hourly_sessions
+    ).filter(StudySummary.user_id == user_id, StudySummary.sessions > 0)
+    if start is not None:
+        query = query.filter(StudySession.date >= datetime.combine(start, datetime.min.time()))
+        compacted = compacted.filter(StudySummary.day >= start)
+    if end is not None:
+        query = query.filter(StudySession.date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+        compacted = compacted.filter(StudySummary.day <= end)
+    
+    buckets = {(as_date(d), int(h)): (int(m or 0), s) for d, h, m, s in query.group_by(day, hour)}
+    for d, hourly_minutes, hourly_sessions in compacted:
+        for h, (m, s) in enumerate(zip(json.loads(hourly_minutes), json.loads(hourly_sessions))):
+            if m or s:
+                raw_minutes, raw_sessions = buckets.get((d, h), (0, 0))
+                buckets[d, h] = (raw_minutes + m, raw_sessions + s)
+    return [(d, h, m, s) for (d, h), (m, s) in buckets.items()]
+
+
+def ensure_heatmap(user_id):
+    """Backfill a user's heatmap buckets from raw sessions the first time they are read"""
+    stats_row = db.session.get(UserStats, user_id)
+    if stats_row is None:
+        get_user_stats(user_id)
+        stats_row = db.session.get(UserStats, user_id)
+    if stats_row is None or stats_row.heatmap_ready:
+        return
+    
+    StudyHeatmapBucket.query.filter_by(user_id=user_id).delete()
+    db.session.add_all([
+        StudyHeatmapBucket(user_id=user_id, day=d, hour=h, minutes=m, sessions=s)
+        for d, h, m, s in compute_heatmap_buckets(user_id)
+    ])
+    stats_row.heatmap_ready = True
+    db.session.commit()
+
+
+def get_heatmap_buckets(user_id, start, end):
+    if not app.config['USER_STATS_ROLLUP']:
+        return sorted(compute_heatmap_buckets(user_id, start, end))
+    
+    ensure_heatmap(user_id)
+    return db.session.query(
+        StudyHeatmapBucket.day, StudyHeatmapBucket.hour, StudyHeatmapBucket.minutes, StudyHeatmapBucket.sessions
+    ).filter(
+        StudyHeatmapBucket.user_id == user_id,
+        StudyHeatmapBucket.day >= start,
+        StudyHeatmapBucket.day <= end
+    ).order_by(StudyHeatmapBucket.day, StudyHeatmapBucket.hour).all()
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute every user's analytics rollup from the raw tables."""
+    for (user_id,) in db.session.query(User.id).all():
+        stats = compute_user_stats(user_id)
+        row = db.session.get(UserStats, user_id)
+        if row is None:
+            db.session.add(UserStats(user_id=user_id, **stats))
+        else:
+            for name, value in stats.items():
+                setattr(row, name, value)
+            row.heatmap_ready = False
+        db.session.commit()
+        ensure_heatmap(user_id)
+    print('User stats rebuilt')
+
+
+# ============= PASSWORD HASHING =============
+
+class HashingBusy(Exception):
+    """Raised when the password hashing queue is full"""
+
+
+class PasswordHasher:
+    """Runs password hashing on a small thread pool behind a bounded queue.
+    
+    PBKDF2 and scrypt release the GIL, so request threads just wait while a
+    capped number of hashing threads use the CPU. A login burst therefore leaves
+    cores for everything else, and once the queue is full further logins get
+    503 instead of piling up.
+    """
+    
+    def __init__(self, method, workers, queue_max):
+        self.method = method
+        # Werkzeug fills in omitted parameters ('scrypt' is stored as 'scrypt:32768:8:1'),
+        # so the prefix to compare stored hashes against comes from a real hash
+        self.prefix = generate_password_hash('', method).split('$', 1)[0]
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue_max)
+    
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future.result()
+    
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+    
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+    
+    def needs_rehash(self, pwhash):
+        """True when the hash was made with a different method or cost than configured"""
+        return pwhash.split('$', 1)[0] != self.prefix
+
+
+password_hasher = PasswordHasher(
+    app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE_MAX']
+)
+
+
+def hashing_busy_response():
+    response = jsonify({'error': 'Server busy, please retry'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 
 # ============= AUTH ROUTES =============
@@ -219,19 +1320,28 @@ def register():
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'error': 'Email already registered'}), 409
         
+        utc_offset = data.get('utc_offset_minutes', 0)
+        if not valid_utc_offset(utc_offset):
+            return jsonify({'error': 'Invalid utc_offset_minutes'}), 400
+        
+        # Hand the pooled connection back while the password hashes; hashing can queue
+        db.session.close()
+        
         # Create user
         user = User(name=data['name'], email=data['email'])
         user.set_password(data['password'])
         
-        # Create gamification record
-        gamification = Gamification(user=user)
+        # Create gamification record and empty analytics rollup
+        gamification = Gamification(user=user, utc_offset_minutes=utc_offset)
         
         db.session.add(user)
         db.session.add(gamification)
+        db.session.flush()
+        db.session.add(UserStats(user_id=user.id, heatmap_ready=True))
         db.session.commit()
         
         # Create JWT token
-        access_token = create_access_token(identity=user.email)
+        access_token = issue_access_token(user)
         
         return jsonify({
             'status': 'success',
@@ -240,6 +1350,9 @@ def register():
             'user': user.to_dict()
         }), 201
     
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -255,33 +1368,45 @@ def login():
             return jsonify({'error': 'Missing email or password'}), 400
         
         user = User.query.filter_by(email=data['email']).first()
+        # Hand the pooled connection back while the password hashes; the loaded user stays usable
+        db.session.close()
         
         if not user or not user.check_password(data['password']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
-        access_token = create_access_token(identity=user.email)
+        access_token = issue_access_token(user)
+        user_data = user.to_dict()
+        
+        # Upgrade hashes made with an older method or cost while the password is at hand
+        if password_hasher.needs_rehash(user.password):
+            try:
+                user.set_password(data['password'])
+                db.session.add(user)
+                db.session.commit()
+            except HashingBusy:
+                pass  # keep the old hash; the next login tries again
         
         return jsonify({
             'status': 'success',
             'message': 'Login successful',
             'access_token': access_token,
-            'user': user.to_dict()
+            'user': user_data
         }), 200
     
+    except HashingBusy:
+        return hashing_busy_response()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/user', methods=['GET'])
 @jwt_required()
+@conditional_get
 def get_user():
     """Get current user info"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
         return jsonify({
             'user': user.to_dict(),
@@ -296,18 +1421,17 @@ def get_user():
 
 @app.route('/api/subjects', methods=['GET'])
 @jwt_required()
+@conditional_get
 def get_subjects():
     """Get all subjects for logged-in user"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
-        subjects = Subject.query.filter_by(user_id=user.id).all()
+        subjects = db.session.execute(
+            db.select(*Subject.list_columns()).where(Subject.__table__.c.user_id == user.id)
+        ).all()
         return jsonify({
-            'subjects': [s.to_dict() for s in subjects],
+            'subjects': Subject.serialize(subjects),
             'count': len(subjects)
         }), 200
     
@@ -320,11 +1444,7 @@ def get_subjects():
 def add_subject():
     """Add a new subject"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
         data = request.json
         
@@ -348,7 +1468,8 @@ def add_subject():
         return jsonify({
             'status': 'success',
             'message': 'Subject added',
-            'subject': subject.to_dict()
+            'subject': subject.to_dict(),
+            'badges_awarded': newly_awarded_badges(user)
         }), 201
     
     except Exception as e:
@@ -361,8 +1482,7 @@ def add_subject():
 def update_subject(subject_id):
     """Update subject progress"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         subject = Subject.query.filter_by(id=subject_id, user_id=user.id).first()
         
         if not subject:
@@ -387,7 +1507,8 @@ def update_subject(subject_id):
         return jsonify({
             'status': 'success',
             'message': 'Subject updated',
-            'subject': subject.to_dict()
+            'subject': subject.to_dict(),
+            'badges_awarded': newly_awarded_badges(user)
         }), 200
     
     except Exception as e:
@@ -400,8 +1521,7 @@ def update_subject(subject_id):
 def delete_subject(subject_id):
     """Delete a subject"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         subject = Subject.query.filter_by(id=subject_id, user_id=user.id).first()
         
         if not subject:
@@ -422,15 +1542,115 @@ def delete_subject(subject_id):
 
 # ============= GAMIFICATION ROUTES =============
 
+def write_gamification(session, user_id, *conditions, **values):
+    """Apply one atomic UPDATE ... RETURNING to a user's gamification row; None if `conditions` did not match.
+    
+    Values may be SQL expressions over the stored row (xp = xp + n), so concurrent
+    requests never overwrite each other's increments. Core statements skip the
+    flush hooks, so the change-log row and cache invalidation happen here.
+    """
+    table = Gamification.__table__
+    connection = session.connection()
+    row = connection.execute(
+        table.update()
+        .where(table.c.user_id == user_id, *conditions)
+        .values(**values)
+        .returning(*table.c)
+    ).first()
+    if row is None:
+        return None
+    
+    connection.execute(ChangeLogEntry.__table__.insert(), {
+        'user_id': user_id, 'entity': 'gamification', 'entity_id': row.id,
+        'op': 'upsert', 'changed_at': datetime.utcnow()
+    })
+    user_cache.invalidate(user_id)
+    session.info.setdefault('changed_user_ids', set()).add(user_id)
+    session.info.setdefault('notify_user_ids', set()).add(user_id)
+    return row
+
+
+def update_gamification(gamif, *conditions, **values):
+    """write_gamification() for a loaded row: copies the new values onto `gamif` and queues a badge check.
+    
+    Returns False when `conditions` did not match (e.g. already studied today).
+    """
+    row = write_gamification(db.session, gamif.user_id, *conditions, **values)
+    if row is None:
+        return False
+    
+    for name, value in row._mapping.items():
+        set_committed_value(gamif, name, value)
+    db.session.info.setdefault('badge_user_ids', set()).add(gamif.user_id)
+    return True
+
+
+def valid_utc_offset(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -720 <= value <= 840
+
+
+def local_day_start(now, utc_offset_minutes):
+    """UTC time at which the local day containing `now` began, for a user at the given UTC offset"""
+    offset = timedelta(minutes=utc_offset_minutes)
+    return datetime.combine((now + offset).date(), datetime.min.time()) - offset
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_badge_users(session, flush_context):
+    """Users whose subjects or sessions changed get their badge rules re-checked at commit"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Subject, StudySession, Gamification)) and obj.user_id is not None:
+            session.info.setdefault('badge_user_ids', set()).add(obj.user_id)
+        if isinstance(obj, Subject) and obj.user_id is not None:
+            session.info.setdefault('badge_subject_user_ids', set()).add(obj.user_id)
+
+
+@event.listens_for(Session, 'before_commit')
+def award_badges(session):
+    """Evaluate every badge rule in one pass for each user this transaction touched"""
+    session.flush()
+    user_ids = session.info.pop('badge_user_ids', None)
+    subject_user_ids = session.info.pop('badge_subject_user_ids', set())
+    if not user_ids:
+        return
+    
+    stats_columns = [UserStats.subject_count, UserStats.subjects_completed, UserStats.subjects_half_done]
+    rows = session.query(
+        Gamification.user_id, Gamification.xp, Gamification.level, Gamification.streak,
+        Gamification.total_minutes_studied, Gamification.badges_mask, *stats_columns
+    ).outerjoin(UserStats, UserStats.user_id == Gamification.user_id).filter(
+        Gamification.user_id.in_(user_ids)
+    ).all()
+    
+    for row in rows:
+        facts = row._asdict()
+        if row.subject_count is None or not app.config['USER_STATS_ROLLUP']:
+            # Without a rollup row, only aggregate subjects when they actually changed
+            if row.user_id in subject_user_ids:
+                facts.update(compute_user_stats(row.user_id))
+            else:
+                facts.update(subject_count=0, subjects_completed=0, subjects_half_done=0)
+        earned = badges.evaluate(facts) & ~row.badges_mask
+        if earned:
+            write_gamification(session, row.user_id, badges_mask=Gamification.badges_mask.op('|')(earned))
+            session.info.setdefault('badges_awarded', {})[row.user_id] = badges.decode(earned)
+
+
+def newly_awarded_badges(user):
+    """Badge ids the last commit awarded to the user (read without refreshing the expired instance)"""
+    user_id = sa_inspect(user).identity[0]
+    return db.session.info.get('badges_awarded', {}).pop(user_id, [])
+
+
 @app.route('/api/gamification', methods=['GET'])
 @jwt_required()
+@conditional_get
 def get_gamification():
     """Get user gamification stats"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user or not user.gamification:
+        if not user.gamification:
             return jsonify({'error': 'Gamification data not found'}), 404
         
         return jsonify(user.gamification.to_dict()), 200
@@ -444,31 +1664,33 @@ def get_gamification():
 def add_xp():
     """Add XP and check level up"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user or not user.gamification:
+        if not user.gamification:
             return jsonify({'error': 'User not found'}), 404
         
         data = request.json
         xp_earned = int(data.get('xp', 0))
         
+        # Increment and level (every 100 XP = 1 level) in one statement
         gamif = user.gamification
-        gamif.xp += xp_earned
-        
-        # Check level up (every 100 XP = 1 level)
-        new_level = gamif.xp // 100 + 1
-        leveled_up = new_level > gamif.level
-        gamif.level = new_level
+        update_gamification(
+            gamif,
+            xp=Gamification.xp + xp_earned,
+            level=(Gamification.xp + xp_earned) // 100 + 1
+        )
+        total_xp, level = gamif.xp, gamif.level
+        leveled_up = level > (total_xp - xp_earned) // 100 + 1
         
         db.session.commit()
         
         return jsonify({
             'status': 'success',
             'xp_earned': xp_earned,
-            'total_xp': gamif.xp,
-            'level': gamif.level,
-            'leveled_up': leveled_up
+            'total_xp': total_xp,
+            'level': level,
+            'leveled_up': leveled_up,
+            'badges_awarded': newly_awarded_badges(user)
         }), 200
     
     except Exception as e:
@@ -481,40 +1703,50 @@ def add_xp():
 def update_streak():
     """Update study streak"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user or not user.gamification:
+        if not user.gamification:
             return jsonify({'error': 'User not found'}), 404
         
         gamif = user.gamification
-        today = datetime.utcnow().date()
-        
-        if gamif.last_study_date:
-            last_date = gamif.last_study_date.date()
-            if last_date == today:
-                # Already studied today
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Already studied today',
-                    'streak': gamif.streak
-                }), 200
-            elif (today - last_date).days == 1:
-                # Streak continues
-                gamif.streak += 1
-            else:
-                # Streak broken
-                gamif.streak = 1
-        else:
-            gamif.streak = 1
+        data = request.get_json(silent=True) or {}
+        utc_offset = data.get('utc_offset_minutes')
+        if utc_offset is None:
+            # The stored offset, not the cached one: another worker may have changed it
+            utc_offset = db.session.query(Gamification.utc_offset_minutes).filter_by(user_id=user.id).scalar()
+        if not valid_utc_offset(utc_offset):
+            return jsonify({'error': 'Invalid utc_offset_minutes'}), 400
+        
+        now = datetime.utcnow()
+        today_start = local_day_start(now, utc_offset)
+        
+        # Continue the streak from yesterday or restart it, unless already studied today
+        updated = update_gamification(
+            gamif,
+            or_(Gamification.last_study_date.is_(None), Gamification.last_study_date < today_start),
+            streak=case(
+                (Gamification.last_study_date >= today_start - timedelta(days=1), Gamification.streak + 1),
+                else_=1
+            ),
+            last_study_date=now,
+            utc_offset_minutes=utc_offset
+        )
+        streak = gamif.streak
+        
+        if not updated:
+            return jsonify({
+                'status': 'success',
+                'message': 'Already studied today',
+                'streak': streak
+            }), 200
         
-        gamif.last_study_date = datetime.utcnow()
         db.session.commit()
         
         return jsonify({
             'status': 'success',
-            'streak': gamif.streak,
-            'message': f'Streak: {gamif.streak} days!'
+            'streak': streak,
+            'message': f'Streak: {streak} days!',
+            'badges_awarded': newly_awarded_badges(user)
         }), 200
     
     except Exception as e:
@@ -527,10 +1759,9 @@ def update_streak():
 def award_badge():
     """Award a badge to user"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user or not user.gamification:
+        if not user.gamification:
             return jsonify({'error': 'User not found'}), 404
         
         data = request.json
@@ -539,13 +1770,19 @@ def award_badge():
         if not badge_id:
             return jsonify({'error': 'Badge ID required'}), 400
         
-        user.gamification.add_badge(badge_id)
+        bit = badges.BADGE_BITS.get(badge_id)
+        if bit is None:
+            return jsonify({'error': 'Unknown badge'}), 400
+        
+        gamif = user.gamification
+        update_gamification(gamif, badges_mask=Gamification.badges_mask.op('|')(bit))
+        earned = gamif.get_badges()
         db.session.commit()
         
         return jsonify({
             'status': 'success',
             'message': f'Badge {badge_id} awarded',
-            'badges': user.gamification.get_badges()
+            'badges': earned + newly_awarded_badges(user)
         }), 200
     
     except Exception as e:
@@ -558,10 +1795,9 @@ def award_badge():
 def set_mode():
     """Set study mode (normal/exam)"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user or not user.gamification:
+        if not user.gamification:
             return jsonify({'error': 'User not found'}), 404
         
         data = request.json
@@ -570,7 +1806,8 @@ def set_mode():
         if mode not in ['normal', 'exam']:
             return jsonify({'error': 'Invalid mode'}), 400
         
-        user.gamification.current_mode = mode
+        # Always write: the cached row may not show a mode another worker set since
+        update_gamification(user.gamification, current_mode=mode)
         db.session.commit()
         
         return jsonify({
@@ -583,24 +1820,67 @@ def set_mode():
         return jsonify({'error': str(e)}), 500
 
 
+def reset_expired_streaks(now=None, chunk_size=50000):
+    """Zero the streak of every user who studied neither today nor yesterday in their own timezone.
+    
+    Walks the gamification table in id ranges with one UPDATE per range. Each
+    row's cutoff comes from a CASE over the few distinct UTC offsets in use,
+    so the statement stays set-based and portable. Commits between chunks keep
+    each write lock short. Returns the number of streaks reset.
+    """
+    now = now or datetime.utcnow()
+    table = Gamification.__table__
+    offsets = [offset for (offset,) in db.session.query(Gamification.utc_offset_minutes).distinct()]
+    if not offsets:
+        return 0
+    cutoff = case(
+        {offset: local_day_start(now, offset) - timedelta(days=1) for offset in offsets},
+        value=table.c.utc_offset_minutes
+    )
+    
+    last_id = db.session.query(func.max(Gamification.id)).scalar() or 0
+    log = ChangeLogEntry.__table__
+    reset = 0
+    for start in range(0, last_id, chunk_size):
+        lapsed = and_(
+            table.c.id > start, table.c.id <= start + chunk_size, table.c.streak > 0,
+            or_(table.c.last_study_date.is_(None), table.c.last_study_date < cutoff)
+        )
+        # Log first, then reset the same rows; the transaction's write lock keeps both in step
+        db.session.execute(log.insert().from_select(
+            ['user_id', 'entity', 'entity_id', 'op', 'changed_at'],
+            db.select(table.c.user_id, literal('gamification'), table.c.id, literal('upsert'), literal(now)).where(lapsed)
+        ))
+        result = db.session.execute(table.update().where(lapsed).values(streak=0))
+        db.session.commit()
+        reset += result.rowcount
+    
+    if reset:
+        user_cache.clear()
+    return reset
+
+
+@app.cli.command('reset-streaks')
+@click.option('--chunk-size', default=50000, show_default=True, help='Gamification rows per UPDATE')
+def reset_streaks_command(chunk_size):
+    """Reset lapsed study streaks for all users (run nightly)."""
+    started = time.perf_counter()
+    reset = reset_expired_streaks(chunk_size=chunk_size)
+    print(f'Reset {reset} expired streaks in {time.perf_counter() - started:.1f}s')
+
+
 # ============= STUDY SESSION ROUTES =============
 
 @app.route('/api/sessions', methods=['GET'])
 @jwt_required()
 def get_sessions():
-    """Get all study sessions for user"""
+    """Get study sessions for user, newest first (keyset paginated)"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        sessions = StudySession.query.filter_by(user_id=user.id).order_by(StudySession.date.desc()).all()
-        return jsonify({
-            'sessions': [s.to_dict() for s in sessions],
-            'count': len(sessions)
-        }), 200
+        table = StudySession.__table__
+        query = db.select(*StudySession.list_columns()).where(table.c.user_id == user.id)
+        return paginated_list(StudySession, query, table.c.date, table.c.id, 'sessions')
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -611,11 +1891,7 @@ def get_sessions():
 def record_session():
     """Record a new study session"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
         data = request.json
         
@@ -626,16 +1902,20 @@ def record_session():
             pomodoro_count=int(data.get('pomodoro_count', 1))
         )
         
-        # Update gamification
-        user.gamification.total_minutes_studied += session.duration_minutes
-        
         db.session.add(session)
+        
+        # Update gamification
+        update_gamification(
+            user.gamification,
+            total_minutes_studied=Gamification.total_minutes_studied + session.duration_minutes
+        )
         db.session.commit()
         
         return jsonify({
             'status': 'success',
             'message': 'Session recorded',
-            'session': session.to_dict()
+            'session': session.to_dict(),
+            'badges_awarded': newly_awarded_badges(user)
         }), 201
     
     except Exception as e:
@@ -648,19 +1928,13 @@ def record_session():
 @app.route('/api/reflections', methods=['GET'])
 @jwt_required()
 def get_reflections():
-    """Get all reflections for user"""
+    """Get reflections for user, newest first (keyset paginated)"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
-        reflections = Reflection.query.filter_by(user_id=user.id).order_by(Reflection.date.desc()).all()
-        return jsonify({
-            'reflections': [r.to_dict() for r in reflections],
-            'count': len(reflections)
-        }), 200
+        table = Reflection.__table__
+        query = db.select(*Reflection.list_columns()).where(table.c.user_id == user.id)
+        return paginated_list(Reflection, query, table.c.date, table.c.id, 'reflections')
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -671,11 +1945,7 @@ def get_reflections():
 def record_reflection():
     """Record a missed-task reflection"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+        user = current_user
         
         data = request.json
         
@@ -704,45 +1974,40 @@ def record_reflection():
 
 @app.route('/api/analytics/summary', methods=['GET'])
 @jwt_required()
+@conditional_get
 def get_analytics_summary():
     """Get study analytics summary"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        subjects = Subject.query.filter_by(user_id=user.id).all()
-        sessions = StudySession.query.filter_by(user_id=user.id).all()
-        reflections = Reflection.query.filter_by(user_id=user.id).all()
+        stats = get_user_stats(user.id)
         
         # Calculate stats
-        total_chapters = sum(s.chapters for s in subjects)
-        completed_chapters = sum(s.completed_chapters for s in subjects)
+        total_chapters = stats['chapters_total']
+        completed_chapters = stats['chapters_completed']
         avg_completion = (completed_chapters / total_chapters * 100) if total_chapters > 0 else 0
         
-        total_study_minutes = sum(s.duration_minutes for s in sessions)
-        total_sessions = len(sessions)
+        total_study_minutes = stats['session_minutes']
+        total_sessions = stats['session_count']
         
         # By priority
         priority_stats = {}
-        for priority in ['low', 'medium', 'high']:
-            priority_subjects = [s for s in subjects if s.priority == priority]
+        for priority in PRIORITIES:
+            chapters = stats[f'{priority}_chapters']
             priority_stats[priority] = {
-                'count': len(priority_subjects),
-                'avg_completion': sum(s.completed_chapters for s in priority_subjects) / sum(s.chapters for s in priority_subjects) * 100 if priority_subjects else 0
+                'count': stats[f'{priority}_count'],
+                'avg_completion': stats[f'{priority}_completed'] / chapters * 100 if chapters > 0 else 0
             }
         
         return jsonify({
-            'total_subjects': len(subjects),
+            'total_subjects': stats['subject_count'],
             'total_chapters': total_chapters,
             'completed_chapters': completed_chapters,
             'overall_completion_percentage': round(avg_completion, 1),
             'total_study_minutes': total_study_minutes,
             'total_sessions': total_sessions,
             'avg_session_minutes': round(total_study_minutes / total_sessions, 1) if total_sessions > 0 else 0,
-            'total_reflections': len(reflections),
+            'total_reflections': stats['reflection_count'],
             'priority_breakdown': priority_stats
         }), 200
     
@@ -752,34 +2017,41 @@ def get_analytics_summary():
 
 @app.route('/api/analytics/heatmap', methods=['GET'])
 @jwt_required()
+@conditional_get
 def get_study_heatmap():
-    """Get study heatmap data (by day/hour)"""
+    """Get study heatmap data: per-day vectors of minutes studied in each hour"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        sessions = StudySession.query.filter_by(user_id=user.id).all()
-        
-        # Build heatmap data
-        heatmap = {}
-        for session in sessions:
-            date_key = session.date.strftime('%Y-%m-%d')
-            hour_key = session.date.strftime('%H')
-            
-            if date_key not in heatmap:
-                heatmap[date_key] = {}
-            
-            if hour_key not in heatmap[date_key]:
-                heatmap[date_key][hour_key] = 0
-            
-            heatmap[date_key][hour_key] += session.duration_minutes
+        user = current_user
+        
+        try:
+            end = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow().date()
+            start = date.fromisoformat(request.args['from']) if request.args.get('from') else end - timedelta(days=364)
+        except ValueError:
+            return jsonify({'error': 'Invalid date range'}), 400
+        
+        if start > end:
+            return jsonify({'error': 'Invalid date range'}), 400
+        
+        # One row per active day: 24 minute counts, index = hour of day
+        days, minutes = [], []
+        total_minutes = total_entries = 0
+        for day, hour, bucket_minutes, bucket_sessions in get_heatmap_buckets(user.id, start, end):
+            if not bucket_minutes and not bucket_sessions:
+                continue
+            if not days or days[-1] != day.isoformat():
+                days.append(day.isoformat())
+                minutes.append([0] * 24)
+            minutes[-1][hour] += bucket_minutes
+            total_minutes += bucket_minutes
+            total_entries += bucket_sessions
         
         return jsonify({
-            'heatmap': heatmap,
-            'total_entries': len(sessions)
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'days': days,
+            'minutes': minutes,
+            'total_minutes': total_minutes,
+            'total_entries': total_entries
         }), 200
     
     except Exception as e:
@@ -788,17 +2060,19 @@ def get_study_heatmap():
 
 # ============= MOOD TRACKING ROUTES (API v1) =============
 
+MOOD_VALUES = ['tired', 'normal', 'energetic']
+
+
 @app.route('/api/v1/moods', methods=['POST'])
 @jwt_required()
 @limiter.limit("10 per hour")
 def record_mood():
     """Record study mood and effectiveness"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
         data = request.json
-        if not data.get('mood') or data.get('mood') not in ['tired', 'normal', 'energetic']:
+        if not data.get('mood') or data.get('mood') not in MOOD_VALUES:
             return jsonify({'error': 'Invalid mood value'}), 400
         
         mood = StudyMood(
@@ -826,86 +2100,857 @@ def record_mood():
 @app.route('/api/v1/moods', methods=['GET'])
 @jwt_required()
 def get_moods():
-    """Get mood history for analytics"""
+    """Get mood history for analytics, newest first (keyset paginated)"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
         days = request.args.get('days', 7, type=int)
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        moods = StudyMood.query.filter(
-            StudyMood.user_id == user.id,
-            StudyMood.time >= cutoff_date
-        ).order_by(StudyMood.time.desc()).all()
+        table = StudyMood.__table__
+        query = db.select(*StudyMood.list_columns()).where(
+            table.c.user_id == user.id,
+            table.c.time >= cutoff_date
+        )
+        return paginated_list(StudyMood, query, table.c.time, table.c.id, 'moods')
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# ============= BATCH INGESTION ROUTES (API v1) =============
+
+
+def _parse_timestamp(value):
+    """Naive UTC datetime for an ISO 8601 string; values with an offset are converted to UTC"""
+    if not value:
+        return datetime.utcnow()
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _build_session(user_id, item):
+    return StudySession(
+        user_id=user_id,
+        subject_id=item.get('subject_id'),
+        duration_minutes=int(item.get('duration_minutes', 25)),
+        pomodoro_count=int(item.get('pomodoro_count', 1)),
+        date=_parse_timestamp(item.get('date'))
+    )
+
+
+def _build_mood(user_id, item):
+    if item.get('mood') not in MOOD_VALUES:
+        raise ValueError('Invalid mood value')
+    return StudyMood(
+        user_id=user_id,
+        mood=item['mood'],
+        duration_minutes=int(item.get('duration_minutes', 0)),
+        effectiveness=int(item.get('effectiveness', 3)),
+        session_id=item.get('session_id'),
+        time=_parse_timestamp(item.get('time'))
+    )
+
+
+def _build_reflection(user_id, item):
+    return Reflection(
+        user_id=user_id,
+        subject_id=item.get('subject_id'),
+        reason_idx=int(item.get('reason_idx', 0)),
+        reason_text=item.get('reason_text', ''),
+        date=_parse_timestamp(item.get('date'))
+    )
+
+
+BATCH_BUILDERS = {
+    'sessions': _build_session,
+    'moods': _build_mood,
+    'reflections': _build_reflection
+}
+
+
+def _batch_key(item, field='key'):
+    """An item's idempotency key as text, or None when it has none"""
+    value = item.get(field) if isinstance(item, dict) else None
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise TypeError(f'{field} must be a string or an integer')
+    return str(value)
+
+
+@app.route('/api/v1/batch', methods=['POST'])
+@jwt_required()
+@limiter.limit("60 per hour")
+def ingest_batch():
+    """Replay offline-queued sessions, moods and reflections in one transaction.
+    
+    Every item carries a client-generated `key` (string or integer); items whose
+    key was already ingested, or came earlier in the batch, are reported as
+    duplicates with the id of the first record instead of being inserted twice. Moods
+    may reference a session from the same (or an earlier) batch via `session_key`.
+    """
+    try:
+        user = current_user
+        data = request.get_json(silent=True) or {}
+        
+        batches = {kind: data.get(kind) or [] for kind in BATCH_BUILDERS}
+        if not all(isinstance(items, list) for items in batches.values()):
+            return jsonify({'error': 'sessions, moods and reflections must be arrays'}), 400
+        if sum(len(items) for items in batches.values()) > app.config['BATCH_MAX_ITEMS']:
+            return jsonify({'error': f"Batch exceeds {app.config['BATCH_MAX_ITEMS']} items"}), 413
+        
+        # One lookup for every key this batch mentions
+        try:
+            mentioned = {_batch_key(item) for items in batches.values() for item in items}
+            mentioned |= {_batch_key(item, 'session_key') for item in batches['moods']}
+        except TypeError as e:
+            return jsonify({'error': str(e)}), 400
+        mentioned.discard(None)
+        known = {}
+        if mentioned:
+            known = {
+                r.key: (r.kind, r.record_id)
+                for r in IngestReceipt.query.filter(IngestReceipt.user_id == user.id, IngestReceipt.key.in_(mentioned))
+            }
+        
+        results = {kind: [] for kind in BATCH_BUILDERS}
+        pending = []  # (kind, key, record, item, result)
+        first = {}  # key -> result of the item in this batch that creates it
+        repeats = []  # (result, first result) for keys repeated within this batch
+        
+        for kind, build in BATCH_BUILDERS.items():
+            for item in batches[kind]:
+                key = _batch_key(item)
+                result = {'key': key}
+                results[kind].append(result)
+                
+                if key is None or len(key) > 64:
+                    result.update(status='error', error='Missing or invalid key')
+                    continue
+                if key in known:
+                    result.update(status='duplicate', id=known[key][1])
+                    continue
+                if key in first:
+                    result.update(status='duplicate')
+                    repeats.append((result, first[key]))
+                    continue
+                
+                try:
+                    record = build(user.id, item)
+                except (TypeError, ValueError) as e:
+                    result.update(status='error', error=str(e))
+                    continue
+                first[key] = result
+                pending.append((kind, key, record, item, result))
+        
+        # Sessions go first so moods in the same batch can point at them. Going through
+        # the unit of work (rather than Core inserts) keeps the rollup hooks in play.
+        db.session.add_all([record for kind, key, record, item, result in pending if kind == 'sessions'])
+        db.session.flush()
+        session_ids = {key: record.id for kind, key, record, item, result in pending if kind == 'sessions'}
+        session_ids.update({k: record_id for k, (kind, record_id) in known.items() if kind == 'sessions'})
+        
+        for kind, key, record, item, result in pending:
+            if kind == 'moods' and record.session_id is None:
+                record.session_id = session_ids.get(_batch_key(item, 'session_key'))
+        
+        db.session.add_all([record for kind, key, record, item, result in pending if kind != 'sessions'])
+        db.session.flush()
+        
+        db.session.add_all([
+            IngestReceipt(user_id=user.id, key=key, kind=kind, record_id=record.id)
+            for kind, key, record, item, result in pending
+        ])
+        for kind, key, record, item, result in pending:
+            result.update(status='created', id=record.id)
+        for result, first_result in repeats:
+            result['id'] = first_result['id']
+        
+        # Gamification is touched once per batch, as a single atomic increment
+        total_minutes = sum(record.duration_minutes for kind, key, record, item, result in pending if kind == 'sessions')
+        if total_minutes and user.gamification:
+            update_gamification(
+                user.gamification,
+                total_minutes_studied=Gamification.total_minutes_studied + total_minutes
+            )
         
+        db.session.commit()
+        
+        statuses = Counter(r['status'] for items in results.values() for r in items)
         return jsonify({
-            'moods': [{'id': m.id, 'mood': m.mood, 'effectiveness': m.effectiveness, 'time': m.time.isoformat(), 'duration_minutes': m.duration_minutes} for m in moods],
-            'total_count': len(moods)
+            'status': 'success',
+            'created': statuses['created'],
+            'duplicates': statuses['duplicate'],
+            'errors': statuses['error'],
+            'results': results,
+            'badges_awarded': newly_awarded_badges(user)
         }), 200
     
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'A concurrent batch used the same keys; retry'}), 409
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+# ============= ACCOUNT EXPORT / IMPORT ROUTES (API v1) =============
+
+EXPORT_FORMAT_VERSION = 1
+
+# Record types in file order: every record comes after the subjects and sessions it refers to
+TRANSFER_MODELS = {
+    'gamification': Gamification,
+    'subjects': Subject,
+    'sessions': StudySession,
+    'moods': StudyMood,
+    'reflections': Reflection,
+    'summaries': StudySummary
+}
+
+
+def transfer_columns(model):
+    """Columns an export carries for `model`: everything except the owner and write bookkeeping"""
+    skipped = {'user_id'} | ({'id', 'updated_at'} if model is Gamification else set())
+    return [column for column in model.__table__.c if column.key not in skipped]
+
+
+TRANSFER_COLUMNS = {entity: transfer_columns(model) for entity, model in TRANSFER_MODELS.items()}
+CSV_FIELDS = ['type'] + list(dict.fromkeys(column.key for columns in TRANSFER_COLUMNS.values() for column in columns))
+
+# Export order per type, each matching an index on (user_id, ...) so no rows are sorted in memory
+EXPORT_ORDER = {
+    'gamification': ('id',),
+    'subjects': ('id',),
+    'sessions': ('date', 'id'),
+    'moods': ('time', 'id'),
+    'reflections': ('date', 'id'),
+    'summaries': ('day',)
+}
+
+
+def export_rows(user_id):
+    """(entity, rows) partitions of everything the user owns, read through server-side cursors"""
+    for entity, model in TRANSFER_MODELS.items():
+        table = model.__table__
+        statement = db.select(*TRANSFER_COLUMNS[entity]).where(table.c.user_id == user_id).order_by(
+            *(table.c[key] for key in EXPORT_ORDER[entity])
+        ).execution_options(yield_per=app.config['STREAM_BATCH_SIZE'])
+        for rows in db.session.execute(statement).partitions():
+            yield entity, rows
+
+
+def ndjson_export(user):
+    yield app.json.dumps({
+        'type': 'export', 'version': EXPORT_FORMAT_VERSION, 'exported_at': datetime.utcnow(),
+        'user': {'name': user.name, 'email': user.email}
+    }) + '\n'
+    for entity, rows in export_rows(user.id):
+        keys = ('type', *(column.key for column in TRANSFER_COLUMNS[entity]))
+        yield ''.join(app.json.dumps(dict(zip(keys, (entity, *row)))) + '\n' for row in rows)
+
+
+def csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def csv_export(user):
+    """One CSV table for every record type: a `type` column, then the union of their columns"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+    for entity, rows in export_rows(user.id):
+        positions = [CSV_FIELDS.index(column.key) for column in TRANSFER_COLUMNS[entity]]
+        for row in rows:
+            line = [entity] + [''] * (len(CSV_FIELDS) - 1)
+            for position, value in zip(positions, row):
+                line[position] = csv_value(value)
+            writer.writerow(line)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_export, 'application/x-ndjson'),
+    'csv': (csv_export, 'text/csv')
+}
+
+
+def transfer_parser(column):
+    """Function reading `column` from an export line, where values are JSON scalars or CSV text"""
+    if isinstance(column.type, db.String):
+        return lambda value: None if value is None else str(value)
+    if isinstance(column.type, db.DateTime):
+        convert = datetime.fromisoformat
+    elif isinstance(column.type, db.Date):
+        convert = date.fromisoformat
+    elif isinstance(column.type, db.Boolean):
+        convert = lambda value: value in (True, 1, 'true', 'True', '1')
+    elif isinstance(column.type, db.Integer):
+        convert = int
+    else:
+        convert = str
+    return lambda value: None if value is None or value == '' else convert(value)
+
+
+# Resolved once: a 1M-line import parses a few million values
+TRANSFER_PARSERS = {
+    entity: [(column, transfer_parser(column)) for column in columns]
+    for entity, columns in TRANSFER_COLUMNS.items()
+}
+
+
+def import_row(entity, values):
+    """Insert values for one export line; raises ValueError when the line cannot be stored"""
+    row = {}
+    for column, parse in TRANSFER_PARSERS[entity]:
+        value = parse(values.get(column.key))
+        if value is None and column.key != 'id':
+            if column.default is not None:
+                value = column.default.arg(None) if column.default.is_callable else column.default.arg
+            elif column.server_default is not None:
+                continue
+            elif not column.nullable:
+                raise ValueError(f'{entity}: {column.key} is required')
+        row[column.key] = value
+    if entity == 'moods' and row['mood'] not in MOOD_VALUES:
+        raise ValueError('Invalid mood value')
+    if entity == 'summaries':
+        for name in SUMMARY_HOURLY:
+            row[f'hourly_{name}'] = json.dumps(summary_hours(row[f'hourly_{name}']))
+    return row
+
+
+class AccountImport:
+    """Writes export lines into one user's account, committing every `batch_size` records.
+    
+    Records get new ids. The exported ids of subjects and sessions are mapped to
+    them so that later lines (sessions, moods, reflections) keep pointing at the
+    right parent; a reference to a record missing from the file becomes null.
+    Summaries of compacted history are added to any the account already has.
+    Rows go in with Core inserts, which skip the flush hooks, so each batch
+    writes its own change-log rows and rollup deltas.
+    """
+    
+    def __init__(self, user_id, batch_size):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.pending = {entity: [] for entity in TRANSFER_MODELS if entity != 'gamification'}
+        self.buffered = 0
+        self.new_ids = {'subjects': {}, 'sessions': {}}  # exported id -> id in this database
+        self.gamification = None
+        self.imported = Counter()  # committed records per type
+    
+    def add(self, values):
+        if not isinstance(values, dict):
+            raise ValueError('Expected an object')
+        entity = values.get('type')
+        if entity == 'export':
+            if values.get('version') != EXPORT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version {values.get('version')!r}")
+            return
+        if entity not in TRANSFER_MODELS:
+            raise ValueError(f'Unknown record type {entity!r}')
+        
+        row = import_row(entity, values)
+        if entity == 'gamification':
+            self.gamification = row
+            return
+        self.pending[entity].append(row)
+        self.buffered += 1
+        if self.buffered >= self.batch_size:
+            self.commit()
+    
+    def _insert(self, entity, rows):
+        """Insert one type's buffered rows; returns their new ids in row order"""
+        table = TRANSFER_MODELS[entity].__table__
+        old_ids = [row.pop('id', None) for row in rows]
+        for row in rows:
+            row['user_id'] = self.user_id
+            if 'subject_id' in row:
+                row['subject_id'] = self.new_ids['subjects'].get(row['subject_id'])
+            if 'session_id' in row:
+                row['session_id'] = self.new_ids['sessions'].get(row['session_id'])
+        new_ids = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        if entity in self.new_ids:
+            self.new_ids[entity].update((old, new) for old, new in zip(old_ids, new_ids) if old is not None)
+        return new_ids
+    
+    def _add_summaries(self, rows):
+        days = defaultdict(Counter)
+        for row in rows:
+            days[row['day']].update(summary_delta(row))
+        add_summaries(db.session.connection(), self.user_id, days)
+    
+    def _merge_gamification(self):
+        """Keep the higher of the stored and imported progress; take the imported preferences"""
+        table = Gamification.__table__
+        imported = self.gamification
+        values = {
+            key: case((table.c[key] < imported[key], imported[key]), else_=table.c[key])
+            for key in ('xp', 'level', 'streak', 'total_minutes_studied')
+            if imported.get(key) is not None
+        }
+        if imported.get('last_study_date') is not None:
+            values['last_study_date'] = case(
+                (or_(table.c.last_study_date.is_(None), table.c.last_study_date < imported['last_study_date']),
+                 imported['last_study_date']),
+                else_=table.c.last_study_date
+            )
+        if imported.get('badges_mask'):
+            values['badges_mask'] = table.c.badges_mask.op('|')(imported['badges_mask'])
+        for key in ('current_mode', 'utc_offset_minutes'):
+            if imported.get(key) is not None:
+                values[key] = imported[key]
+        if values:
+            write_gamification(db.session, self.user_id, **values)
+    
+    def commit(self):
+        """Write everything buffered in one transaction, parents before the records that refer to them"""
+        now = datetime.utcnow()
+        counts = Counter()
+        changes = []
+        stats = Counter()
+        heatmap = defaultdict(Counter)
+        for entity, rows in self.pending.items():
+            if not rows:
+                continue
+            model = TRANSFER_MODELS[entity]
+            for row in rows:
+                stats.update(stats_contribution(model, row.get))
+                if model is StudySession:
+                    heatmap_delta(heatmap, self.user_id, row['date'], row['duration_minutes'], 1)
+                elif model is StudySummary:
+                    hourly = zip(json.loads(row['hourly_minutes']), json.loads(row['hourly_sessions']))
+                    for hour, (minutes, sessions) in enumerate(hourly):
+                        if minutes or sessions:
+                            heatmap[self.user_id, row['day'], hour].update(minutes=minutes, sessions=sessions)
+            if model is StudySummary:
+                self._add_summaries(rows)
+            else:
+                changes += [
+                    {'user_id': self.user_id, 'entity': entity, 'entity_id': new_id, 'op': 'upsert', 'changed_at': now}
+                    for new_id in self._insert(entity, rows)
+                ]
+            counts[entity] = len(rows)
+            rows.clear()
+        self.buffered = 0
+        
+        if app.config['USER_STATS_ROLLUP']:
+            connection = db.session.connection()
+            apply_stats_deltas(connection, {self.user_id: stats})
+            apply_heatmap_deltas(connection, heatmap)
+        if changes:
+            db.session.execute(ChangeLogEntry.__table__.insert(), changes)
+            if counts['subjects']:
+                plans = WeeklyPlan.__table__
+                db.session.execute(plans.update().where(plans.c.user_id == self.user_id).values(
+                    subjects_version=plans.c.subjects_version + 1))
+            db.session.info.setdefault('notify_user_ids', set()).add(self.user_id)
+        db.session.commit()
+        self.imported.update(counts)
+    
+    def finish(self):
+        if self.gamification is not None:
+            self._merge_gamification()
+            self.imported['gamification'] = 1
+        db.session.info.setdefault('badge_user_ids', set()).add(self.user_id)
+        self.commit()
+
+
+@app.route('/api/v1/export', methods=['GET'])
+@jwt_required()
+@limiter.limit("10 per hour")
+def export_account():
+    """Stream every subject, session, mood, reflection, study summary and the gamification row as NDJSON or CSV.
+    
+    Rows are read in STREAM_BATCH_SIZE partitions from one read transaction, so
+    the file is a consistent snapshot and memory stays flat however large the
+    account is. The output is what /api/v1/import accepts.
+    """
+    try:
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({'error': 'format must be ndjson or csv'}), 400
+        
+        generate, mimetype = EXPORT_FORMATS[fmt]
+        filename = f"study-planner-export-{datetime.utcnow():%Y-%m-%d}.{fmt}"
+        return Response(stream_with_context(generate(current_user)), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename="{filename}"'
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/v1/import', methods=['POST'])
+@jwt_required()
+@limiter.limit("10 per hour")
+def import_account():
+    """Load an /api/v1/export file (NDJSON, or CSV with ?format=csv or a text/csv body) into the account.
+    
+    The body is read line by line and committed every IMPORT_BATCH_SIZE
+    records. On a bad line the response names it; the batches before it stay
+    imported, and `imported` counts them. Records are added alongside existing
+    ones, so importing the same file twice duplicates them.
+    """
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    user = current_user
+    importer = AccountImport(user.id, app.config['IMPORT_BATCH_SIZE'])
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    reader = csv.DictReader(stream) if fmt == 'csv' else None
+    line_number = 0
+    try:
+        if reader is not None:
+            for values in reader:
+                importer.add(values)
+        else:
+            for line_number, line in enumerate(stream, 1):
+                if line.strip():
+                    importer.add(app.json.loads(line))
+        importer.finish()
+        
+        return jsonify({
+            'status': 'success',
+            'imported': importer.imported,
+            'badges_awarded': newly_awarded_badges(user)
+        }), 200
+    
+    except (ValueError, TypeError, csv.Error) as e:
+        db.session.rollback()
+        line_number = reader.line_num if reader is not None else line_number
+        return jsonify({'error': f'Line {line_number}: {e}', 'imported': importer.imported}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'imported': importer.imported}), 500
+
+
+# ============= DATA RETENTION =============
+
+# The weekly leaderboard sums raw sessions since Monday, so at least that much stays raw
+MIN_RETENTION_DAYS = 8
+
+
+class HistoryArchive:
+    """One user's gzip NDJSON archive for a compaction run, in the export's record format.
+    
+    Each chunk is its own gzip member (readers see one stream), flushed to disk
+    before the rows are deleted. A chunk whose transaction fails is cut off again.
+    """
+    
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self.file = None
+    
+    def append(self, records):
+        """Write records as one member; returns the offset to pass to discard() if the chunk fails"""
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'xb')
+            self._write_member([self.header])
+            self.header_end = self.file.tell()
+        offset = self.file.tell()
+        self._write_member(records)
+        return offset
+    
+    def _write_member(self, records):
+        with gzip.GzipFile(fileobj=self.file, mode='wb') as member:
+            member.write(''.join(app.json.dumps(record) + '\n' for record in records).encode())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def discard(self, offset):
+        self.file.seek(offset)
+        self.file.truncate()
+    
+    def close(self):
+        if self.file is not None:
+            empty = self.file.tell() == self.header_end
+            self.file.close()
+            if empty:
+                os.remove(self.path)
+
+
+SUMMARY_TOTALS = [
+    'sessions', 'minutes', 'pomodoros', 'moods', 'tired_moods', 'normal_moods', 'energetic_moods',
+    'mood_minutes', 'effectiveness_total', 'effectiveness_count'
+]
+SUMMARY_HOURLY = ['sessions', 'minutes', 'moods', 'effectiveness_total', 'effectiveness_count']
+
+
+def summary_hours(value):
+    """An hourly_* value (JSON text or a list) as 24 integers"""
+    hours = json.loads(value) if isinstance(value, str) else value
+    if not isinstance(hours, list) or len(hours) != 24 or not all(isinstance(n, int) for n in hours):
+        raise ValueError('hourly values must be a list of 24 integers')
+    return hours
+
+
+def add_to_summary(days, entity, row):
+    """Count one archived session or mood in `days`: {day: Counter of totals and (name, hour) counts}"""
+    if entity == 'sessions':
+        when, minutes = row['date'], row['duration_minutes'] or 0
+        days[when.date()].update({
+            'sessions': 1, 'minutes': minutes, 'pomodoros': row['pomodoro_count'] or 0,
+            ('sessions', when.hour): 1, ('minutes', when.hour): minutes
+        })
+        return
+    when = row['time']
+    delta = days[when.date()]
+    delta.update({'moods': 1, 'mood_minutes': row['duration_minutes'] or 0, ('moods', when.hour): 1})
+    if row['mood'] in MOOD_VALUES:
+        delta[f"{row['mood']}_moods"] += 1
+    effectiveness = row['effectiveness']
+    if effectiveness is not None:
+        delta.update({
+            'effectiveness_total': effectiveness, 'effectiveness_count': 1,
+            ('effectiveness_total', when.hour): effectiveness, ('effectiveness_count', when.hour): 1
+        })
+
+
+def summary_delta(row):
+    """An imported summary row as the Counter add_summaries expects"""
+    delta = Counter({name: row[name] for name in SUMMARY_TOTALS})
+    for name in SUMMARY_HOURLY:
+        delta.update({(name, hour): n for hour, n in enumerate(json.loads(row[f'hourly_{name}'])) if n})
+    return delta
+
+
+def add_summaries(connection, user_id, days):
+    """Add {day: Counter} (as built by add_to_summary) to the user's summary rows, creating missing days"""
+    table = StudySummary.__table__
+    stored = {row['day']: row for row in connection.execute(
+        db.select(table).where(table.c.user_id == user_id, table.c.day.in_(list(days)))
+    ).mappings()}
+    inserts, updates = [], []
+    for day, delta in days.items():
+        current = stored.get(day)
+        values = {name: delta[name] + (current[name] if current else 0) for name in SUMMARY_TOTALS}
+        for name in SUMMARY_HOURLY:
+            hours = json.loads(current[f'hourly_{name}']) if current else [0] * 24
+            values[f'hourly_{name}'] = json.dumps([n + delta[name, hour] for hour, n in enumerate(hours)])
+        if current:
+            updates.append({'key_day': day, **values})
+        else:
+            inserts.append({'user_id': user_id, 'day': day, **values})
+    if updates:
+        connection.execute(table.update().where(table.c.user_id == user_id, table.c.day == bindparam('key_day')), updates)
+    if inserts:
+        connection.execute(table.insert(), inserts)
+
+
+def summary_hour_totals(rows, first_day, first_hour):
+    """Per-hour sums of each hourly_* column in `rows` of (day, *columns), from `first_hour` of `first_day` on"""
+    rows = list(rows)
+    if not rows:
+        return []
+    totals = []
+    for column in range(1, len(rows[0])):
+        # One decode per column: the day arrays joined into a single JSON array
+        days = app.json.loads('[' + ','.join(row[column] for row in rows) + ']')
+        for row, hours in zip(rows, days):
+            if row[0] == first_day:
+                hours[:first_hour] = [0] * first_hour
+        totals.append(list(map(sum, zip(*days))))
+    return totals
+
+
+def compact_user_history(user_id, cutoff, archive, chunk_size):
+    """Move one user's sessions and moods from before `cutoff` into study_summaries and `archive`.
+    
+    Oldest rows first, `chunk_size` per transaction. Each transaction starts by
+    writing (DELETE ... RETURNING), so SQLite takes its write lock before
+    anything is read and the rows deleted are exactly the rows archived and
+    summarized. The rollups already count every row, so they stay as they are.
+    Moods go first; afterwards only retained moods can still point at an
+    archived session, and those links are cleared. These Core statements bypass
+    record_changes, so the same transaction logs the deletes and the relinked
+    moods itself. Returns rows compacted per type.
+    """
+    compacted = Counter()
+    moods = StudyMood.__table__
+    for entity in ('moods', 'sessions'):
+        table = TRANSFER_MODELS[entity].__table__
+        when = table.c[EXPORT_ORDER[entity][0]]
+        oldest = db.select(table.c.id).where(table.c.user_id == user_id, when < cutoff).order_by(when, table.c.id).limit(chunk_size)
+        while True:
+            offset = None
+            try:
+                relinked = []
+                if entity == 'sessions':
+                    relinked = db.session.execute(moods.update().where(
+                        moods.c.user_id == user_id, moods.c.session_id.in_(oldest)
+                    ).values(session_id=None).returning(moods.c.id)).scalars().all()
+                rows = db.session.execute(
+                    table.delete().where(table.c.id.in_(oldest)).returning(*TRANSFER_COLUMNS[entity])
+                ).mappings().all()
+                if not rows:
+                    db.session.rollback()
+                    break
+                rows.sort(key=lambda row: (row[when.key], row['id']))
+                days = defaultdict(Counter)
+                for row in rows:
+                    add_to_summary(days, entity, row)
+                offset = archive.append({'type': entity, **row} for row in rows)
+                add_summaries(db.session.connection(), user_id, days)
+                now = datetime.utcnow()
+                db.session.execute(ChangeLogEntry.__table__.insert(), [
+                    {'user_id': user_id, 'entity': entity, 'entity_id': row['id'], 'op': 'delete', 'changed_at': now}
+                    for row in rows
+                ] + [
+                    {'user_id': user_id, 'entity': 'moods', 'entity_id': mood_id, 'op': 'upsert', 'changed_at': now}
+                    for mood_id in relinked
+                ])
+                db.session.info.setdefault('notify_user_ids', set()).add(user_id)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                if offset is not None:
+                    archive.discard(offset)
+                raise
+            compacted[entity] += len(rows)
+    return compacted
+
+
+def compact_history(retention_days, archive_dir, chunk_size=5000, now=None):
+    """Compact every user's sessions and moods older than `retention_days` (counted from UTC midnight).
+    
+    Only users with rows to compact are visited, found through the time
+    indexes, so a nightly run costs about what it moves. Each user's raw rows go
+    to <archive_dir>/<user_id>/<run time>.ndjson.gz. Returns rows compacted per type.
+    """
+    if retention_days < MIN_RETENTION_DAYS:
+        raise ValueError(f'Retention must be at least {MIN_RETENTION_DAYS} days')
+    now = now or datetime.utcnow()
+    cutoff = datetime.combine(now.date() - timedelta(days=retention_days), datetime.min.time())
+    user_ids = db.session.execute(
+        db.select(StudySession.user_id).where(StudySession.date < cutoff).union(
+            db.select(StudyMood.user_id).where(StudyMood.time < cutoff))
+    ).scalars().all()
+    
+    compacted = Counter()
+    for user_id in sorted(user_ids):
+        archive = HistoryArchive(
+            os.path.join(archive_dir, str(user_id), f'{now:%Y%m%dT%H%M%S}.ndjson.gz'),
+            {'type': 'archive', 'version': EXPORT_FORMAT_VERSION, 'user_id': user_id,
+             'archived_at': now, 'before': cutoff}
+        )
+        try:
+            compacted.update(compact_user_history(user_id, cutoff, archive, chunk_size))
+        finally:
+            archive.close()
+    return compacted
+
+
+@app.cli.command('compact-history')
+@click.option('--days', type=int, help='Keep this many days of raw sessions and moods  [default: RETENTION_DAYS]')
+@click.option('--chunk-size', default=5000, show_default=True, help='Rows archived and deleted per transaction')
+def compact_history_command(days, chunk_size):
+    """Fold old study sessions and moods into study_summaries and archive the raw rows (run nightly)."""
+    days = app.config['RETENTION_DAYS'] if days is None else days
+    if days < MIN_RETENTION_DAYS:
+        raise click.BadParameter(f'must be at least {MIN_RETENTION_DAYS}', param_hint='--days')
+    started = time.perf_counter()
+    compacted = compact_history(days, app.config['RETENTION_ARCHIVE_DIR'], chunk_size)
+    print(f"Compacted {compacted['sessions']} sessions and {compacted['moods']} moods older than {days} days "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
 # ============= FAILURE ANALYTICS ROUTES =============
 
+REFLECTION_REASONS = {
+    0: 'Too Tired',
+    1: 'Lost Motivation',
+    2: 'Distracted',
+    3: 'Difficult Topic',
+    4: 'Skipped',
+    5: 'Not Covered'
+}
+SKIPPED_REASON = 4
+
 @app.route('/api/v1/analytics/failure', methods=['GET'])
 @jwt_required()
 @limiter.limit("20 per hour")
+@conditional_get
 def get_failure_analytics():
     """Get failure analytics: skipped subjects, reasons, best study times"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
+        user = current_user
         
         days = request.args.get('days', 30, type=int)
         cutoff_date = datetime.utcnow() - timedelta(days=days)
         
-        # Get skipped subjects from reflections
-        skipped_subjects = db.session.query(
-            Reflection.subject_idx,
-            func.count(Reflection.id).label('skip_count')
-        ).filter(
-            Reflection.user_id == user.id,
-            Reflection.time >= cutoff_date,
-            Reflection.reason_idx == 4  # Assuming 4 is "skipped" reason
-        ).group_by(Reflection.subject_idx).order_by(func.count(Reflection.id).desc()).all()
-        
-        # Get most common failure reasons
-        failure_reasons = db.session.query(
+        # One pass over the window: counts per (reason, subject) feed both the
+        # reason histogram and the skipped-subject ranking
+        reason_subject_counts = db.session.query(
             Reflection.reason_idx,
-            func.count(Reflection.id).label('reason_count')
+            Reflection.subject_id,
+            func.count(Reflection.id)
         ).filter(
             Reflection.user_id == user.id,
-            Reflection.time >= cutoff_date,
+            Reflection.date >= cutoff_date,
             Reflection.reason_idx.isnot(None)
-        ).group_by(Reflection.reason_idx).order_by(func.count(Reflection.id).desc()).all()
-        
-        # Get best study times (hours with highest effectiveness)
-        best_study_times = db.session.query(
-            func.hour(StudyMood.time).label('hour'),
-            func.avg(StudyMood.effectiveness).label('avg_effectiveness'),
-            func.count(StudyMood.id).label('session_count')
+        ).group_by(Reflection.reason_idx, Reflection.subject_id).all()
+        
+        reason_counts = Counter()
+        skip_counts = Counter()
+        for reason_idx, subject_id, count in reason_subject_counts:
+            reason_counts[reason_idx] += count
+            if reason_idx == SKIPPED_REASON:
+                skip_counts[subject_id] += count
+        
+        # Get best study times (hours with highest effectiveness). Moods past the
+        # retention window are read from study_summaries, to the hour.
+        hour = hour_of(StudyMood.time)
+        raw_hours = db.session.query(
+            hour, func.sum(StudyMood.effectiveness), func.count(StudyMood.effectiveness), func.count(StudyMood.id)
         ).filter(
             StudyMood.user_id == user.id,
             StudyMood.time >= cutoff_date
-        ).group_by(func.hour(StudyMood.time)).order_by(func.avg(StudyMood.effectiveness).desc()).all()
-        
-        # Reason mappings
-        reason_map = {
-            0: 'Too Tired',
-            1: 'Lost Motivation',
-            2: 'Distracted',
-            3: 'Difficult Topic',
-            4: 'Skipped',
-            5: 'Not Covered'
-        }
+        ).group_by(hour)
+        compacted_days = db.session.query(
+            StudySummary.day, StudySummary.hourly_effectiveness_total,
+            StudySummary.hourly_effectiveness_count, StudySummary.hourly_moods
+        ).filter(
+            StudySummary.user_id == user.id,
+            StudySummary.day >= cutoff_date.date(),
+            StudySummary.moods > 0
+        )
+        
+        hours = defaultdict(lambda: [0, 0, 0])  # effectiveness total, rated moods, moods
+        for h, total, rated, moods in raw_hours:
+            hours[int(h or 0)] = [int(total or 0), rated, moods]
+        compacted = summary_hour_totals(compacted_days, cutoff_date.date(), cutoff_date.hour)
+        for h, counts in enumerate(zip(*compacted)):
+            if counts[2]:
+                hours[h] = [a + b for a, b in zip(hours[h], counts)]
+        best_study_times = sorted(
+            ((h, total / rated if rated else 0, moods) for h, (total, rated, moods) in hours.items()),
+            key=lambda hour_stats: hour_stats[1], reverse=True
+        )
         
         return jsonify({
-            'skipped_subjects': [{'subject_idx': s[0], 'skip_count': s[1]} for s in skipped_subjects[:10]],
-            'failure_reasons': [{'reason': reason_map.get(r[0], 'Unknown'), 'count': r[1]} for r in failure_reasons],
-            'best_study_hours': [{'hour': int(b[0] or 0), 'effectiveness': round(float(b[1] or 0), 2), 'sessions': int(b[2] or 0)} for b in best_study_times]
+            'skipped_subjects': [{'subject_idx': s, 'skip_count': n} for s, n in skip_counts.most_common(10)],
+            'failure_reasons': [{'reason': REFLECTION_REASONS.get(r, 'Unknown'), 'count': n} for r, n in reason_counts.most_common()],
+            'best_study_hours': [{'hour': h, 'effectiveness': round(float(e), 2), 'sessions': n} for h, e, n in best_study_times]
         }), 200
     
     except Exception as e:
@@ -914,86 +2959,396 @@ def get_failure_analytics():
 
 # ============= WEEKLY AUTO-PLANNER ROUTES =============
 
+@event.listens_for(Session, 'after_flush')
+def invalidate_weekly_plans(session, flush_context):
+    """Bump the plan input version for users whose subjects changed (a stored plan also records its mode)"""
+    user_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Subject) and (obj in session.new or obj in session.deleted or session.is_modified(obj)):
+            user_ids.add(obj.user_id)
+    
+    if user_ids:
+        table = WeeklyPlan.__table__
+        session.connection().execute(
+            table.update().where(table.c.user_id.in_(user_ids)).values(subjects_version=table.c.subjects_version + 1)
+        )
+
+
+def build_plan_payload(user_id, mode, daily_minutes, now):
+    """Run the planner engine over the user's active subjects and return the response body"""
+    # Only the columns the planner needs
+    subjects = db.session.query(
+        Subject.id, Subject.name, Subject.chapters, Subject.completed_chapters,
+        Subject.difficulty, Subject.priority, Subject.deadline
+    ).filter(
+        Subject.user_id == user_id,
+        Subject.is_deleted == False
+    ).all()
+    
+    if not subjects:
+        return {'plan': []}
+    
+    today = now.date()
+    
+    # Keep the rest day free in normal mode; it absorbs overflow
+    budgets = [
+        0 if mode != 'exam' and planner.DAYS[(today + timedelta(days=offset)).weekday()] == app.config['PLANNER_REST_DAY'] else daily_minutes
+        for offset in range(7)
+    ]
+    
+    plan, plan_dates, overflow = planner.build_weekly_plan(subjects, today, budgets, mode=mode)
+    
+    return {
+        'plan': plan,
+        'plan_dates': plan_dates,
+        'overflow': overflow,
+        'mode': mode,
+        'daily_minutes': daily_minutes,
+        'generated_at': now.isoformat(),
+        'subject_count': len(subjects),
+        'optimization_notes': 'Chapters are spread in proportion to urgency within each day\'s time budget and finish before each deadline. Recommend studying Sunday for overflow.'
+    }
+
+
+def load_weekly_plan(user_id):
+    """(stored WeeklyPlan or None, study mode) in one statement.
+    
+    The mode is read from the database rather than the cached current_user, so a
+    mode set through another worker takes effect at once.
+    """
+    row = db.session.execute(
+        db.select(WeeklyPlan, Gamification.current_mode)
+        .outerjoin(WeeklyPlan, WeeklyPlan.user_id == Gamification.user_id)
+        .where(Gamification.user_id == user_id)
+    ).first()
+    if row is None:
+        return db.session.get(WeeklyPlan, user_id), 'normal'
+    return row[0], row[1] or 'normal'
+
+
+def refresh_weekly_plan(user_id, daily_minutes=None, force=False):
+    """Return the user's plan as JSON text, regenerating and storing it when stale.
+    
+    The stored plan is reused while its inputs version, date and mode still match.
+    Writing it back is a compare-and-set on subjects_version, so a plan computed
+    from subjects that changed mid-generation is never stored as current.
+    """
+    row, mode = load_weekly_plan(user_id)
+    if row is None:
+        # Create the row first so concurrent subject edits have a version to bump
+        try:
+            db.session.add(WeeklyPlan(user_id=user_id, subjects_version=0))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+        row, mode = load_weekly_plan(user_id)
+    
+    now = datetime.utcnow()
+    if (not force and row.payload is not None and row.plan_version == row.subjects_version
+            and row.plan_date == now.date() and row.mode == mode):
+        return row.payload
+    
+    if daily_minutes is None:
+        daily_minutes = row.daily_minutes if not force else None
+    budget = daily_minutes or app.config['PLANNER_EXAM_DAILY_MINUTES' if mode == 'exam' else 'PLANNER_DAILY_MINUTES']
+    
+    version = row.subjects_version
+    payload = json.dumps(build_plan_payload(user_id, mode, budget, now))
+    WeeklyPlan.query.filter_by(user_id=user_id, subjects_version=version).update({
+        'plan_version': version,
+        'plan_date': now.date(),
+        'mode': mode,
+        'daily_minutes': daily_minutes,
+        'payload': payload,
+        'generated_at': now
+    }, synchronize_session=False)
+    db.session.commit()
+    return payload
+
+
+EMPTY_PLAN = json.dumps({'plan': []})
+
+
+def plan_response(payload, created):
+    status = 201 if created and payload != EMPTY_PLAN else 200
+    return Response(payload, status=status, mimetype='application/json')
+
+
+@app.route('/api/v1/planner', methods=['GET'])
+@jwt_required()
+@limiter.limit("120 per hour")
+def get_weekly_plan():
+    """Get the stored weekly plan, regenerating it only if its inputs changed"""
+    try:
+        user = current_user
+        
+        return plan_response(refresh_weekly_plan(user.id), created=False)
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/v1/planner/generate', methods=['POST'])
 @jwt_required()
 @limiter.limit("5 per hour")
 def generate_weekly_plan():
-    """Generate optimized weekly study plan using workload distribution algorithm"""
+    """Generate a capacity-aware weekly study plan for the next seven days"""
     try:
-        email = get_jwt_identity()
-        user = User.query.filter_by(email=email).first()
-        
-        # Get all active subjects (not soft-deleted)
-        subjects = Subject.query.filter(
-            Subject.user_id == user.id,
-            Subject.is_deleted == False
+        user = current_user
+        data = request.get_json(silent=True) or {}
+        
+        daily_minutes = data.get('daily_minutes')
+        if daily_minutes is not None:
+            try:
+                daily_minutes = int(daily_minutes)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid daily_minutes'}), 400
+            if not 0 < daily_minutes <= 24 * 60:
+                return jsonify({'error': 'Invalid daily_minutes'}), 400
+        
+        return plan_response(refresh_weekly_plan(user.id, daily_minutes, force=True), created=True)
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def _regenerate_plans(user_ids):
+    """Process-pool worker: rebuild plans for a chunk of users"""
+    with app.app_context():
+        for user_id in user_ids:
+            refresh_weekly_plan(user_id)
+        db.session.remove()
+    return len(user_ids)
+
+
+def _init_plan_worker():
+    # Forked workers must not reuse the parent's pooled SQLite connections
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+@app.cli.command('regenerate-plans')
+@click.option('--workers', default=os.cpu_count() or 1, show_default=True, help='Worker processes')
+@click.option('--chunk-size', default=200, show_default=True, help='Users per task')
+def regenerate_plans_command(workers, chunk_size):
+    """Regenerate stale weekly plans for every user (e.g. nightly from cron)."""
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).order_by(User.id)]
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    db.session.remove()
+    for engine in db.engines.values():
+        engine.dispose()
+    
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_plan_worker) as pool:
+        done = sum(pool.map(_regenerate_plans, chunks))
+    print(f'Refreshed plans for {done} users in {time.perf_counter() - started:.1f}s')
+
+
+# ============= LEADERBOARD ROUTES (API v1) =============
+
+class Standings:
+    """Users ordered by score (highest first, ties to the lower user id) with binary-search rank lookups.
+    
+    Each entry is packed into one int, user_id - (score << 32), so a plain sorted
+    list of ints keeps the order compactly.
+    """
+    
+    def __init__(self, scores=()):
+        self.scores = dict(scores)
+        self.keys = sorted(self._key(user_id, score) for user_id, score in self.scores.items())
+    
+    @staticmethod
+    def _key(user_id, score):
+        return user_id - (score << 32)
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def set(self, user_id, score):
+        self.discard(user_id)
+        self.scores[user_id] = score
+        bisect.insort(self.keys, self._key(user_id, score))
+    
+    def discard(self, user_id):
+        score = self.scores.pop(user_id, None)
+        if score is not None:
+            del self.keys[bisect.bisect_left(self.keys, self._key(user_id, score))]
+    
+    def rank(self, user_id):
+        """(1-based rank, score), or None for users without an entry"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect.bisect_left(self.keys, self._key(user_id, score)) + 1, score
+    
+    def top(self, n):
+        return [(key & 0xFFFFFFFF, self.scores[key & 0xFFFFFFFF]) for key in self.keys[:n]]
+
+
+class XpLeaderboard:
+    """Process-wide XP standings, caught up from the change log before each read.
+    
+    The first read loads every user in (xp DESC, user_id) index order. Later reads
+    re-fetch only the users whose gamification rows were logged since then (by
+    add_xp in any worker), so a refresh costs the amount of change. After a prune
+    or a burst of changes too large to apply one by one, it reloads.
+    """
+    
+    MAX_INCREMENTAL = 10000
+    
+    def __init__(self):
+        self._standings = None
+        self._cursor = 0
+        self._lock = threading.Lock()
+    
+    def _load(self, cursor):
+        rows = db.session.query(Gamification.user_id, Gamification.xp).order_by(
+            Gamification.xp.desc(), Gamification.user_id
         ).all()
+        self._standings = Standings((user_id, xp or 0) for user_id, xp in rows)
+        self._cursor = cursor
+    
+    def refresh(self):
+        with self._lock:
+            cursor = db.session.query(func.max(ChangeLogEntry.id)).scalar() or 0
+            if self._standings is None:
+                return self._load(cursor)
+            if cursor == self._cursor:
+                return
+            
+            oldest = db.session.query(func.min(ChangeLogEntry.id)).scalar()
+            changed = {user_id for (user_id,) in db.session.query(ChangeLogEntry.user_id).filter(
+                ChangeLogEntry.id > self._cursor,
+                ChangeLogEntry.id <= cursor,
+                ChangeLogEntry.entity == 'gamification'
+            ).distinct().limit(self.MAX_INCREMENTAL + 1)}
+            if len(changed) > self.MAX_INCREMENTAL or (oldest is not None and self._cursor < oldest - 1):
+                return self._load(cursor)
+            
+            if changed:
+                current = dict(db.session.query(Gamification.user_id, Gamification.xp).filter(
+                    Gamification.user_id.in_(changed)
+                ))
+                for user_id in changed:
+                    if user_id in current:
+                        self._standings.set(user_id, current[user_id] or 0)
+                    else:
+                        self._standings.discard(user_id)
+            self._cursor = cursor
+    
+    def read(self, user_id, limit):
+        """(top entries, the user's (rank, xp) or None, total users) from a consistent view"""
+        self.refresh()
+        with self._lock:
+            return self._standings.top(limit), self._standings.rank(user_id), len(self._standings)
+
+
+xp_leaderboard = XpLeaderboard()
+_weekly_standings = {}
+_weekly_lock = threading.Lock()
+
+
+def weekly_standings(now):
+    """Minutes studied per user since Monday 00:00 UTC, cached for LEADERBOARD_WEEKLY_TTL seconds"""
+    week_start = datetime.combine(now.date() - timedelta(days=now.weekday()), datetime.min.time())
+    with _weekly_lock:
+        cached = _weekly_standings.get(week_start)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
         
-        if not subjects:
-            return jsonify({'plan': []}), 200
+        rows = db.session.query(StudySession.user_id, func.sum(StudySession.duration_minutes)).filter(
+            StudySession.date >= week_start
+        ).group_by(StudySession.user_id).all()
+        standings = Standings((user_id, minutes or 0) for user_id, minutes in rows)
+        _weekly_standings.clear()
+        _weekly_standings[week_start] = (time.monotonic() + app.config['LEADERBOARD_WEEKLY_TTL'], standings)
+        return standings
+
+
+def read_leaderboard(period, user_id, limit):
+    if period == 'week':
+        standings = weekly_standings(datetime.utcnow())
+        return standings.top(limit), standings.rank(user_id), len(standings)
+    return xp_leaderboard.read(user_id, limit)
+
+
+LEADERBOARD_SCORES = {'all': 'xp', 'week': 'minutes'}
+
+
+@app.route('/api/v1/leaderboard', methods=['GET'])
+@jwt_required()
+def get_leaderboard():
+    """Get the top users by XP, or by minutes studied this week with period=week"""
+    try:
+        user = current_user
         
-        # Algorithm: Sort by deadline + difficulty + priority
-        def subject_score(subj):
-            days_left = max(1, (subj.deadline - datetime.utcnow()).days)
-            chapters_left = subj.chapters - subj.completed_chapters
-            difficulty_weight = {'easy': 1, 'medium': 2, 'hard': 3}.get(subj.difficulty, 2)
-            priority_weight = {'low': 1, 'medium': 2, 'high': 3}.get(subj.priority, 2)
-            
-            # Score: chapters_left / days_left * difficulty * priority
-            urgency = chapters_left / days_left
-            score = urgency * difficulty_weight * priority_weight
-            return score
+        period = request.args.get('period', 'all')
+        if period not in LEADERBOARD_SCORES:
+            return jsonify({'error': 'Invalid period'}), 400
+        limit = request.args.get('limit', app.config['LEADERBOARD_SIZE_DEFAULT'], type=int)
+        limit = max(1, min(limit, app.config['LEADERBOARD_SIZE_MAX']))
         
-        sorted_subjects = sorted(subjects, key=subject_score, reverse=True)
+        top, mine, total = read_leaderboard(period, user.id, limit)
+        names = dict(db.session.query(User.id, User.name).filter(User.id.in_([user_id for user_id, score in top])))
+        score_key = LEADERBOARD_SCORES[period]
         
-        # Distribute across 7 days with buffer
-        plan = {day: [] for day in ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']}
-        days_list = list(plan.keys())
+        return jsonify({
+            'period': period,
+            'total_users': total,
+            'entries': [
+                {'rank': rank, 'user_id': user_id, 'name': names.get(user_id), score_key: score}
+                for rank, (user_id, score) in enumerate(top, start=1)
+            ],
+            'my_rank': mine[0] if mine else None
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/v1/leaderboard/me', methods=['GET'])
+@jwt_required()
+def get_my_rank():
+    """Get the current user's leaderboard rank"""
+    try:
+        user = current_user
         
-        for idx, subject in enumerate(sorted_subjects):
-            chapters_left = subject.chapters - subject.completed_chapters
-            if chapters_left <= 0:
-                continue
-            
-            # Distribute chapters across days
-            day_idx = idx % 6  # Use first 6 days, leave Sunday free
-            daily_chapters = max(1, chapters_left // 2)
-            
-            plan[days_list[day_idx]].append({
-                'subject_name': subject.name,
-                'subject_id': subject.id,
-                'chapters': daily_chapters,
-                'difficulty': subject.difficulty,
-                'priority': subject.priority,
-                'recommended_duration_mins': daily_chapters * 30
-            })
+        period = request.args.get('period', 'all')
+        if period not in LEADERBOARD_SCORES:
+            return jsonify({'error': 'Invalid period'}), 400
+        
+        top, mine, total = read_leaderboard(period, user.id, 0)
+        rank, score = mine if mine else (None, 0)
         
         return jsonify({
-            'plan': plan,
-            'generated_at': datetime.utcnow().isoformat(),
-            'subject_count': len(sorted_subjects),
-            'optimization_notes': 'Plan prioritizes urgent deadlines and high-difficulty subjects. Recommend studying Sunday for overflow.'
-        }), 201
+            'period': period,
+            'rank': rank,
+            LEADERBOARD_SCORES[period]: score,
+            'total_users': total
+        }), 200
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
-# ============= SYNC STATUS ROUTES =============
+# ============= SYNC ROUTES =============
 
 @app.route('/api/v1/sync/status', methods=['GET'])
 @jwt_required()
 def get_sync_status():
-    """Get sync status for offline-first PWA indicator"""
+    """Get sync status for offline-first PWA indicator, with the latest change cursor"""
     try:
-        email = get_jwt_identity()
+        user = current_user
         
         # If we reached here, user is authenticated and synced
         return jsonify({
             'status': 'synced',
             'timestamp': datetime.utcnow().isoformat(),
-            'message': 'All data synced'
+            'message': 'All data synced',
+            'cursor': latest_change_cursor(user.id)
         }), 200
     
     except Exception as e:
@@ -1003,6 +3358,177 @@ def get_sync_status():
         }), 200
 
 
+@app.route('/api/v1/sync/changes', methods=['GET'])
+@jwt_required()
+def get_sync_changes():
+    """Get records created, updated or deleted since a sync cursor.
+    
+    Clients bootstrap by reading `cursor` from /api/v1/sync/status, loading the
+    full lists, then polling this route with `since=<cursor>` and storing the
+    returned cursor. Only the latest state of each changed record is returned;
+    deletes come back as tombstone ids.
+    """
+    try:
+        user = current_user
+        
+        since = request.args.get('since', 0, type=int)
+        limit = request.args.get('limit', app.config['SYNC_PAGE_SIZE_DEFAULT'], type=int)
+        limit = max(1, min(limit, app.config['SYNC_PAGE_SIZE_MAX']))
+        
+        # Entries before the oldest retained one may have been pruned
+        oldest = db.session.query(func.min(ChangeLogEntry.id)).scalar()
+        if since and oldest is not None and since < oldest - 1:
+            return jsonify({'resync_required': True, 'cursor': latest_change_cursor(user.id)}), 410
+        
+        entries = db.session.query(
+            ChangeLogEntry.id, ChangeLogEntry.entity, ChangeLogEntry.entity_id, ChangeLogEntry.op
+        ).filter(
+            ChangeLogEntry.user_id == user.id,
+            ChangeLogEntry.id > since
+        ).order_by(ChangeLogEntry.id).limit(limit + 1).all()
+        
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        
+        # Collapse to the last operation per record
+        latest_ops = {}
+        for entry_id, entity, entity_id, op in entries:
+            latest_ops[(entity, entity_id)] = op
+        
+        changed = defaultdict(list)
+        deleted = defaultdict(list)
+        for (entity, entity_id), op in latest_ops.items():
+            (deleted if op == 'delete' else changed)[entity].append(entity_id)
+        
+        records = {}
+        for entity, ids in changed.items():
+            model = ENTITY_MODELS[entity]
+            rows = model.query.filter(model.user_id == user.id, model.id.in_(ids)).all()
+            records[entity] = [row.to_dict() for row in rows]
+            if entity == 'gamification':
+                records[entity] = records[entity][0] if records[entity] else None
+        
+        return jsonify({
+            'changes': records,
+            'deleted': dict(deleted),
+            'cursor': entries[-1][0] if entries else since,
+            'has_more': has_more
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def sync_wait_timeout():
+    timeout = request.args.get('timeout', app.config['SYNC_WAIT_TIMEOUT_DEFAULT'], type=float)
+    return max(0.0, min(timeout, app.config['SYNC_WAIT_TIMEOUT_MAX']))
+
+
+def sync_events_since():
+    """Resume point for an event stream: the browser's Last-Event-ID, else ?since="""
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return last_event_id if last_event_id is not None else request.args.get('since', 0, type=int)
+
+
+def sync_rate_limit_key():
+    """Rate-limit the sync routes per user (the token's subject), else per client address"""
+    token = request.headers.get('Authorization', '')
+    if token.startswith('Bearer '):
+        token = token[len('Bearer '):]
+    elif app.config['SYNC_EVENTS_QUERY_TOKEN'] and request.endpoint == 'sync_events':
+        token = request.args.get(app.config['JWT_QUERY_STRING_NAME'], '')
+    try:
+        return f"user:{decode_token(token)['sub']}"
+    except Exception:
+        return get_remote_address()
+
+
+# One budget for both notification routes; asgi.py applies it to its native versions too
+sync_rate_limit = limiter.shared_limit(app.config['SYNC_RATE_LIMIT'], scope='sync', key_func=sync_rate_limit_key)
+
+
+def sse_change_event(changes):
+    return f'id: {changes["cursor"]}\nevent: change\ndata: {json.dumps(changes)}\n\n'
+
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+SSE_RETRY_MS = 3000
+
+
+@app.route('/api/v1/sync/wait', methods=['GET'])
+@sync_rate_limit
+@jwt_required()
+def wait_for_changes():
+    """Long-poll: answer as soon as the user's data changes after `since`, or after `timeout` seconds"""
+    try:
+        user_id = current_user.id
+        since = request.args.get('since', 0, type=int)
+        
+        deadline = time.monotonic() + sync_wait_timeout()
+        woken = threading.Event()
+        with change_notifier.subscribe(user_id, woken.set):
+            while True:
+                woken.clear()
+                changes = pending_changes(user_id, since)
+                # Hand the pooled connection back while waiting
+                db.session.close()
+                remaining = deadline - time.monotonic()
+                if changes['entities'] or remaining <= 0 or not woken.wait(remaining):
+                    break
+        
+        return jsonify(changes), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/v1/sync/events', methods=['GET'])
+@sync_rate_limit
+@jwt_required(locations=['headers', 'query_string'] if app.config['SYNC_EVENTS_QUERY_TOKEN'] else ['headers'])
+def sync_events():
+    """Server-Sent Events: one `change` event per batch of changes, naming the entity types.
+    
+    EventSource cannot send headers, so with SYNC_EVENTS_QUERY_TOKEN the token may
+    also come as ?jwt=. The stream closes after SYNC_EVENTS_MAX_SECONDS and the
+    browser reconnects with Last-Event-ID, so no change is skipped.
+    """
+    try:
+        user_id = current_user.id
+        since = sync_events_since()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    def generate():
+        cursor = since
+        heartbeat = app.config['SYNC_EVENTS_HEARTBEAT']
+        deadline = time.monotonic() + app.config['SYNC_EVENTS_MAX_SECONDS']
+        woken = threading.Event()
+        with change_notifier.subscribe(user_id, woken.set):
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            while time.monotonic() < deadline:
+                woken.clear()
+                changes = pending_changes(user_id, cursor)
+                db.session.close()
+                if changes['entities']:
+                    cursor = changes['cursor']
+                    yield sse_change_event(changes)
+                elif not woken.wait(min(heartbeat, max(0.0, deadline - time.monotonic()))):
+                    yield ': keep-alive\n\n'
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+
+@app.cli.command('prune-changes')
+@click.option('--days', default=90, show_default=True, help='Keep this many days of change history')
+def prune_changes_command(days):
+    """Delete old change-log rows; clients with older cursors are told to resync."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    last_old = db.session.query(func.max(ChangeLogEntry.id)).filter(ChangeLogEntry.changed_at < cutoff).scalar()
+    deleted = ChangeLogEntry.query.filter(ChangeLogEntry.id <= last_old).delete() if last_old else 0
+    db.session.commit()
+    print(f'Pruned {deleted} change-log rows')
+
+
 # ============= API VERSION INFO =============
 
 @app.route('/api/v1/info', methods=['GET'])
@@ -1017,17 +3543,58 @@ def api_info():
             'Reflections and analytics',
             'Failure analysis',
             'Weekly auto-planner',
-            'Offline-first sync'
+            'Offline-first sync',
+            'Delta sync',
+            'Sync notifications (SSE, long-poll)',
+            'Leaderboards',
+            'Prometheus metrics',
+            'Account export/import (NDJSON, CSV)'
         ],
         'rate_limits': {
             'global': '200 per day, 50 per hour',
             'moods': '10 per hour',
+            'batch': '60 per hour',
             'analytics': '20 per hour',
-            'planner': '5 per hour'
+            'planner': '5 per hour',
+            'planner_read': '120 per hour'
         }
     }), 200
 
 
+# ============= REQUEST METRICS =============
+
+request_metrics = metrics.RequestMetrics(app.config['METRICS_N_PLUS_ONE_THRESHOLD'], app.logger)
+
+if app.config['METRICS_ENABLED']:
+    # request_started fires before any before_request hook, so rate-limited requests are timed too
+    request_started.connect(request_metrics.start, app)
+    
+    @app.after_request
+    def record_request_metrics(response):
+        request_metrics.finish(request.endpoint, request.method, response.status_code)
+        return response
+    
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', request_metrics.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', request_metrics.after_cursor_execute)
+
+
+@app.route('/api/v1/metrics', methods=['GET'])
+@limiter.exempt
+def get_metrics():
+    """Request and SQL metrics of this worker process, in Prometheus text format"""
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+    elif not app.config['METRICS_PUBLIC']:
+        return jsonify({'error': 'Set METRICS_TOKEN (or METRICS_PUBLIC=true) to expose metrics'}), 403
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # ============= ERROR HANDLERS =============
 
 @app.errorhandler(404)
@@ -1043,14 +3610,59 @@ def internal_error(error):
 
 # ============= DATABASE INITIALIZATION =============
 
+def init_db():
+    """Create missing tables and add columns introduced after a database was created.
+    
+    Only additive changes are handled: new columns must be nullable or carry a
+    server_default so existing rows stay valid. Data that depends on a new column
+    is converted here too.
+    """
+    db.create_all()
+    inspector = sa_inspect(db.engine)
+    added = set()
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                    added.add((table.name, column.name))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+        
+        # Rollup rows missing a new counter are rebuilt lazily on first read
+        if any(table_name == UserStats.__tablename__ for table_name, column_name in added):
+            connection.execute(UserStats.__table__.delete())
+        
+        # Move JSON badge lists into the bitmask, keeping ids the registry does not know
+        table = Gamification.__table__
+        rows = connection.execute(
+            db.select(table.c.id, table.c.badges_earned).where(table.c.badges_earned.notin_(['', '[]']))
+        ).all()
+        for row_id, badges_earned in rows:
+            mask, unknown = badges.encode(json.loads(badges_earned))
+            if mask:
+                connection.execute(table.update().where(table.c.id == row_id).values(
+                    badges_mask=table.c.badges_mask.op('|')(mask), badges_earned=json.dumps(unknown)
+                ))
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables and add any new columns to an existing database."""
+    init_db()
+    print('Database schema is up to date')
+
+
 @app.shell_context_processor
 def make_shell_context():
-    return {'db': db, 'User': User, 'Subject': Subject, 'Gamification': Gamification}
+    return {'db': db, 'User': User, 'Subject': Subject, 'Gamification': Gamification, 'UserStats': UserStats}
 
 
 # ============= MAIN =============
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
     app.run(debug=True, port=5000)
@@ -0,0 +1,428 @@
+"""ASGI entry point: serves the same /api surface from an event loop.
+
+    pip install uvicorn aiosqlite
+    uvicorn asgi:application --port 5000
+
+The routes clients poll (current user, subjects, gamification, sync status)
+and the sync notification routes (long-poll and server-sent events) are
+answered on the loop with an AsyncSession, so an open connection costs a
+coroutine instead of a worker thread. Every other request runs through the
+Flask app on a bounded thread pool (ASGI_WSGI_THREADS). Password hashing and
+plan generation keep their own executors there.
+
+Native routes still go through Flask's request hooks (rate limits, CORS, metrics) and
+JSON encoding. Whenever a native route cannot answer directly (no valid token,
+or a user that is not in the database), it runs the Flask view instead, so
+responses match the WSGI deployment exactly.
+"""
+
+import asyncio
+import contextvars
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Response, jsonify, request, request_started
+from flask_jwt_extended import decode_token
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload
+
+from app import (
+    SSE_HEADERS, SSE_RETRY_MS, ChangeLogEntry, Subject, User, app, change_notifier, changes_since, data_etag,
+    read_engine, request_metrics, select_user_with_version, sqlite_pragmas, sse_change_event, summarize_changes,
+    sync_events_since, sync_rate_limit, sync_wait_timeout, user_cache
+)
+
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 32))
+
+
+def make_async_engine():
+    """Async twin of the read engine (ASYNC_DATABASE_URL overrides it for other databases)"""
+    url = os.environ.get('ASYNC_DATABASE_URL')
+    if url:
+        return create_async_engine(url)
+
+    with app.app_context():
+        url = read_engine().url
+    if url.get_backend_name() != 'sqlite':
+        raise RuntimeError('Set ASYNC_DATABASE_URL to an async driver URL for this database')
+    try:
+        import aiosqlite  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError('ASGI mode needs aiosqlite: pip install aiosqlite') from e
+
+    engine = create_async_engine(url.set(drivername='sqlite+aiosqlite'))
+    event.listen(engine.sync_engine, 'connect', sqlite_pragmas(read_only=True))
+    return engine
+
+
+def count_statements(engine):
+    """Attribute the async engine's SQL to the request running it, like the Flask engines"""
+    if app.config['METRICS_ENABLED']:
+        event.listen(engine.sync_engine, 'before_cursor_execute', request_metrics.before_cursor_execute)
+        event.listen(engine.sync_engine, 'after_cursor_execute', request_metrics.after_cursor_execute)
+
+
+async_engine = make_async_engine()
+count_statements(async_engine)
+AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+# ============= NATIVE ROUTES =============
+
+async def authenticate(query_token=False):
+    """(user, version) behind the request's access token, or None to let Flask answer"""
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        token = auth[len('Bearer '):]
+    elif query_token and request.args.get(app.config['JWT_QUERY_STRING_NAME']):
+        token = request.args[app.config['JWT_QUERY_STRING_NAME']]
+    else:
+        return None
+    try:
+        claims = decode_token(token)
+    except Exception:
+        return None
+    user_id = claims.get('uid')
+    if claims.get('type') != 'access' or user_id is None:
+        return None
+
+    cached = user_cache.get(user_id)
+    if cached is None:
+        async with AsyncSession() as session:
+            cached = (await session.execute(select_user_with_version(User.id == user_id))).first()
+            if cached is None:
+                return None
+            session.expunge_all()
+        cached = tuple(cached)
+        user_cache.put(user_id, *cached)
+    return cached
+
+
+async def current_user_view(session, user, version):
+    return {
+        'user': user.to_dict(),
+        'gamification': user.gamification.to_dict() if user.gamification else None
+    }, 200
+
+
+async def subjects_view(session, user, version):
+    subjects = (await session.execute(select(*Subject.list_columns()).where(Subject.user_id == user.id))).all()
+    return {
+        'subjects': Subject.serialize(subjects),
+        'count': len(subjects)
+    }, 200
+
+
+async def gamification_view(session, user, version):
+    if not user.gamification:
+        return {'error': 'Gamification data not found'}, 404
+    return user.gamification.to_dict(), 200
+
+
+async def sync_status_view(session, user, version):
+    return {
+        'status': 'synced',
+        'timestamp': datetime.utcnow().isoformat(),
+        'message': 'All data synced',
+        'cursor': version
+    }, 200
+
+
+async def pending_changes(session, user_id, since):
+    return summarize_changes((await session.execute(changes_since(user_id, since))).all(), since)
+
+
+def wake_on_change(user_id, woken):
+    """Subscribe an asyncio.Event to the user's changes (publishers run on other threads)"""
+    loop = asyncio.get_running_loop()
+    return change_notifier.subscribe(user_id, lambda: loop.call_soon_threadsafe(woken.set))
+
+
+def check_sync_rate_limit():
+    """Count the request against the sync routes' shared limit, as their Flask decorator does"""
+    with sync_rate_limit:
+        pass
+
+
+async def wait_for_changes_view(session, user, version):
+    check_sync_rate_limit()
+    since = request.args.get('since', 0, type=int)
+    deadline = time.monotonic() + sync_wait_timeout()
+    woken = asyncio.Event()
+    with wake_on_change(user.id, woken):
+        while True:
+            woken.clear()
+            changes = await pending_changes(session, user.id, since)
+            await session.close()
+            remaining = deadline - time.monotonic()
+            if changes['entities'] or remaining <= 0:
+                return changes, 200
+            try:
+                await asyncio.wait_for(woken.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+# path -> (view, answers If-None-Match like @conditional_get)
+NATIVE_ROUTES = {
+    '/api/user': (current_user_view, True),
+    '/api/subjects': (subjects_view, True),
+    '/api/gamification': (gamification_view, True),
+    '/api/v1/sync/status': (sync_status_view, False),
+    '/api/v1/sync/wait': (wait_for_changes_view, False),
+}
+EVENTS_ROUTE = '/api/v1/sync/events'
+
+
+
+async def native_response(view, conditional):
+    """Response for a native route, or None when the Flask view should answer"""
+    authenticated = await authenticate()
+    if authenticated is None:
+        return None
+    user, cached_version = authenticated
+
+    async with AsyncSession() as session:
+        version = await session.scalar(
+            select(func.max(ChangeLogEntry.id)).where(ChangeLogEntry.user_id == user.id)
+        ) or 0
+        if version != cached_version:
+            # Written since it was cached (another process): reload after reading the version,
+            # so the body is never older than its ETag
+            user_cache.invalidate(user.id)
+            user = await session.scalar(
+                select(User).options(joinedload(User.gamification)).where(User.id == user.id)
+            )
+            if user is None:
+                return None
+        etag = data_etag(user.id, version) if conditional and version else None
+        if etag and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            payload, status = await view(session, user, version)
+            response = jsonify(payload)
+            response.status_code = status
+            if status != 200:
+                return response
+    if etag:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def flask_view():
+    """Run the matched Flask view for the current request context (on the thread pool)"""
+    try:
+        return app.make_response(app.dispatch_request())
+    except Exception as e:
+        return app.make_response(app.handle_user_exception(e))
+
+
+async def run_flask_view():
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(wsgi_pool, context.run, flask_view)
+
+
+def error_response(e):
+    """Flask's answer to an exception: its error handlers first (a 429 stays a 429), else a 500"""
+    try:
+        return app.make_response(app.handle_user_exception(e))
+    except Exception as unhandled:
+        return app.make_response(app.handle_exception(unhandled))
+
+
+async def serve_native(scope, body, send, view, conditional):
+    ctx = app.request_context(wsgi_environ(scope, body))
+    ctx.push()
+    try:
+        try:
+            request_started.send(app)
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await native_response(view, conditional)
+            if rv is None:
+                rv = await run_flask_view()
+            response = app.process_response(app.make_response(rv))
+        except Exception as e:
+            response = error_response(e)
+        await send(response_start(response.status_code, response.headers.to_wsgi_list()))
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+    finally:
+        ctx.pop()
+
+
+async def serve_events(scope, body, receive, send):
+    """Server-sent events on the loop; mirrors the Flask sync_events view"""
+    ctx = app.request_context(wsgi_environ(scope, body))
+    ctx.push()
+    try:
+        try:
+            user = None
+            request_started.send(app)
+            rv = app.preprocess_request()
+            if rv is None:
+                authenticated = await authenticate(query_token=app.config['SYNC_EVENTS_QUERY_TOKEN'])
+                user = authenticated[0] if authenticated else None
+                if user is not None:
+                    check_sync_rate_limit()
+            if user is None:
+                # Only error answers are left here, so the Flask response is never a stream
+                response = app.process_response(app.make_response(rv if rv is not None else await run_flask_view()))
+        except Exception as e:
+            user, response = None, error_response(e)
+        if user is None:
+            await send(response_start(response.status_code, response.headers.to_wsgi_list()))
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+            return
+        
+        since = sync_events_since()
+        response = app.process_response(Response(mimetype='text/event-stream', headers=SSE_HEADERS))
+        headers = [(name, value) for name, value in response.headers.to_wsgi_list() if name.lower() != 'content-length']
+        await send(response_start(200, headers))
+        await stream_events(user.id, since, receive, send)
+    finally:
+        ctx.pop()
+
+
+async def stream_events(user_id, cursor, receive, send):
+    async def emit(text):
+        await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+    
+    heartbeat = app.config['SYNC_EVENTS_HEARTBEAT']
+    deadline = time.monotonic() + app.config['SYNC_EVENTS_MAX_SECONDS']
+    disconnected = asyncio.ensure_future(receive())
+    woken = asyncio.Event()
+    try:
+        with wake_on_change(user_id, woken):
+            await emit(f'retry: {SSE_RETRY_MS}\n\n')
+            while not disconnected.done() and time.monotonic() < deadline:
+                woken.clear()
+                async with AsyncSession() as session:
+                    changes = await pending_changes(session, user_id, cursor)
+                if changes['entities']:
+                    cursor = changes['cursor']
+                    await emit(sse_change_event(changes))
+                    continue
+                waiter = asyncio.ensure_future(woken.wait())
+                done, _ = await asyncio.wait(
+                    {waiter, disconnected}, timeout=min(heartbeat, max(0.0, deadline - time.monotonic())),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                waiter.cancel()
+                if not done:
+                    await emit(': keep-alive\n\n')
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+
+
+# ============= WSGI BRIDGE =============
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+    }
+
+
+async def serve_wsgi(scope, body, send):
+    """Run the Flask app on the thread pool, streaming its body back chunk by chunk"""
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    iterable = await loop.run_in_executor(wsgi_pool, app, wsgi_environ(scope, body), start_response)
+    try:
+        chunks = iter(iterable)
+        chunk = await loop.run_in_executor(wsgi_pool, next, chunks, None)
+        await send(response_start(started['status'], started['headers']))
+        while chunk is not None:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            chunk = await loop.run_in_executor(wsgi_pool, next, chunks, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(wsgi_pool, iterable.close)
+
+
+# ============= ASGI APPLICATION =============
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return bytes(body)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_engine.dispose()
+                wsgi_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive)
+    native = NATIVE_ROUTES.get(scope['path']) if scope['method'] == 'GET' else None
+    if scope['method'] == 'GET' and scope['path'] == EVENTS_ROUTE:
+        await serve_events(scope, body, receive, send)
+    elif native:
+        await serve_native(scope, body, send, *native)
+    else:
+        await serve_wsgi(scope, body, send)
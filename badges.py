@@ -0,0 +1,58 @@
+"""Badge registry and rule engine.
+
+Every badge owns one bit of `Gamification.badges_mask`, so a user's badges are
+a single integer: awarding is `mask | bit` in SQL and listing them is a scan of
+the registry. Rules are checked together in one pass over a small dict of facts
+(xp, level, streak, minutes and subject counts) after each write.
+
+Bits are assigned by position in BADGES: only ever append new badges.
+"""
+
+# (id, display name, rule over facts); rule None means the client awards it
+BADGES = [
+    ('level_up', '⭐ Level Up', lambda f: f['level'] >= 2),
+    ('streak_7', '🔥 7-Day Streak', lambda f: f['streak'] >= 7),
+    ('subject_complete', '🎓 Subject Master', lambda f: f['subjects_completed'] >= 1),
+    ('night_owl', '🌙 Night Owl', None),
+    ('early_bird', '🌅 Early Bird', None),
+    ('first_subject', 'Pioneer', lambda f: f['subject_count'] >= 1),
+    ('five_subjects', 'Scholar', lambda f: f['subject_count'] >= 5),
+    ('level_5', 'Ambitious', lambda f: f['level'] >= 5),
+    ('level_10', 'Master', lambda f: f['level'] >= 10),
+    ('seven_day_streak', 'Consistent', lambda f: f['streak'] >= 7),
+    ('thirty_day_streak', 'Unstoppable', lambda f: f['streak'] >= 30),
+    ('one_hour', 'Focused', lambda f: f['total_minutes_studied'] >= 60),
+    ('ten_hours', 'Dedicated', lambda f: f['total_minutes_studied'] >= 600),
+    ('complete_subject', 'Finisher', lambda f: f['subjects_completed'] >= 1),
+    ('all_subjects_50', 'Halfway', lambda f: f['subject_count'] > 0 and f['subjects_half_done'] == f['subject_count']),
+]
+
+BADGE_BITS = {badge_id: 1 << index for index, (badge_id, name, rule) in enumerate(BADGES)}
+RULES = [(1 << index, rule) for index, (badge_id, name, rule) in enumerate(BADGES) if rule is not None]
+
+
+def evaluate(facts):
+    """Mask of every rule-based badge the facts qualify for"""
+    mask = 0
+    for bit, rule in RULES:
+        if rule(facts):
+            mask |= bit
+    return mask
+
+
+def encode(badge_ids):
+    """(mask, unknown ids) for a list of badge ids"""
+    mask = 0
+    unknown = []
+    for badge_id in badge_ids:
+        bit = BADGE_BITS.get(badge_id)
+        if bit is None:
+            unknown.append(badge_id)
+        else:
+            mask |= bit
+    return mask, unknown
+
+
+def decode(mask):
+    """Badge ids set in `mask`, in registry order"""
+    return [badge_id for badge_id, bit in BADGE_BITS.items() if mask & bit]
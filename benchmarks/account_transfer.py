@@ -0,0 +1,128 @@
+"""Account export and import throughput and memory on a large account.
+
+Seeds one user with --subjects subjects and --rows rows split evenly across
+study sessions, moods and reflections (1M by default). Per format (ndjson, csv):
+- export: GET /api/v1/export streamed to a scratch file through the test client
+- import: POST of that file into a fresh account, read from disk as it uploads
+
+Reports records per second, file size, and rss_growth_mb: the peak resident
+anonymous memory seen while the request ran, minus the amount before it
+(sampled every few milliseconds from /proc/self/statm, so Linux only; pages of
+the memory-mapped database file are left out). With server-side cursors and
+batched commits it should stay flat as --rows grows.
+
+    python -m benchmarks.account_transfer --rows 1000000
+    python -m benchmarks.account_transfer --rows 100000 --batch-size 1000
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import auth_headers, load_app, print_table, seed_users
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_bytes():
+    """Resident memory not backed by a file"""
+    with open('/proc/self/statm') as f:
+        _, resident, shared = f.read().split()[:3]
+    return (int(resident) - int(shared)) * PAGE_SIZE
+
+
+class PeakRSS:
+    """Highest anonymous resident memory seen while the block runs, relative to its start"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.growth = 0
+
+    def __enter__(self):
+        self.start = self.peak = rss_bytes()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def _sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        self.growth = max(self.peak, rss_bytes()) - self.start
+
+
+def export_to(client, headers, fmt, path):
+    with PeakRSS() as memory:
+        started = time.perf_counter()
+        response = client.get(f'/api/v1/export?format={fmt}', headers=headers, buffered=False)
+        assert response.status_code == 200, response.status_code
+        with open(path, 'wb') as f:
+            for chunk in response.response:
+                f.write(chunk)
+        response.close()
+        elapsed = time.perf_counter() - started
+    return elapsed, memory.growth
+
+
+def import_from(client, headers, fmt, path):
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    with PeakRSS() as memory, open(path, 'rb') as f:
+        started = time.perf_counter()
+        response = client.post('/api/v1/import', input_stream=f, content_type=content_type,
+                               headers={**headers, 'Content-Length': str(os.path.getsize(path))})
+        elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_json()
+    return elapsed, memory.growth, sum(response.get_json()['imported'].values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='sessions + moods + reflections')
+    parser.add_argument('--subjects', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, help='IMPORT_BATCH_SIZE (default: the app setting)')
+    parser.add_argument('--formats', nargs='+', choices=['ndjson', 'csv'], default=['ndjson', 'csv'])
+    args = parser.parse_args()
+
+    m = load_app()
+    if args.batch_size:
+        m.app.config['IMPORT_BATCH_SIZE'] = args.batch_size
+    per_table = args.rows // 3
+    user_ids = seed_users(m, users=1 + len(args.formats), subjects=args.subjects, sessions=per_table,
+                          moods=per_table, reflections=per_table)
+    # The import targets start empty apart from their gamification row
+    with m.app.app_context():
+        for model in (m.StudySession, m.StudyMood, m.Reflection, m.Subject):
+            model.query.filter(model.user_id.in_(user_ids[1:])).delete()
+        m.db.session.commit()
+    source = auth_headers(m, user_ids[0])
+    client = m.app.test_client()
+    scratch = tempfile.mkdtemp(prefix='ssp-bench-')
+
+    rows = []
+    for fmt, target in zip(args.formats, user_ids[1:]):
+        path = os.path.join(scratch, f'export.{fmt}')
+        seconds, growth = export_to(client, source, fmt, path)
+        records = args.subjects + 3 * per_table + 1
+        size_mb = os.path.getsize(path) / 2 ** 20
+        rows.append({'step': f'export {fmt}', 'records': records, 'seconds': round(seconds, 1),
+                     'records_per_s': round(records / seconds), 'file_mb': round(size_mb, 1),
+                     'rss_growth_mb': round(growth / 2 ** 20, 1)})
+
+        seconds, growth, imported = import_from(client, auth_headers(m, target), fmt, path)
+        rows.append({'step': f'import {fmt}', 'records': imported, 'seconds': round(seconds, 1),
+                     'records_per_s': round(imported / seconds), 'file_mb': round(size_mb, 1),
+                     'rss_growth_mb': round(growth / 2 ** 20, 1)})
+
+    print(f'{args.subjects} subjects + {3 * per_table} sessions/moods/reflections, '
+          f'import batches of {m.app.config["IMPORT_BATCH_SIZE"]}\n')
+    print_table(rows, ['step', 'records', 'seconds', 'records_per_s', 'file_mb', 'rss_growth_mb'])
+
+
+if __name__ == '__main__':
+    main()
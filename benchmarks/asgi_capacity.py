@@ -0,0 +1,126 @@
+"""Compare concurrent-connection capacity of the WSGI (app.run) and ASGI (asgi.py) servers.
+
+Seeds a database, starts each server in its own process, then opens
+--connections concurrent keep-alive clients that poll GET /api/subjects for
+--seconds at each level. It reports throughput, latency and failed requests
+(refused or reset connections, timeouts, non-200 answers).
+
+    pip install uvicorn aiosqlite
+    python -m benchmarks.asgi_capacity --connections 50 200 1000 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import ROOT, auth_headers, load_app, print_table, seed_users, summarize, wait_for_port
+
+# Both servers run with rate limits off, which would otherwise throttle the load
+SERVERS = [
+    ('WSGI app.run(threaded=True)', [
+        sys.executable, '-c',
+        'import app; app.limiter.enabled = False; app.app.run(port={port}, threaded=True)'
+    ]),
+    ('ASGI uvicorn asgi:application', [
+        sys.executable, '-c',
+        'import app, uvicorn; app.limiter.enabled = False; '
+        'uvicorn.run("asgi:application", port={port}, log_level="warning")'
+    ]),
+]
+
+
+async def fetch(reader, writer, request):
+    """Send one request on an open connection; returns (status, server keeps the connection)"""
+    writer.write(request)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {k.strip().lower(): v.strip() for k, v in (line.split(':', 1) for line in lines[1:] if ':' in line)}
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    keep_alive = lines[0].startswith('HTTP/1.1') and headers.get('connection', '').lower() != 'close'
+    return status, keep_alive
+
+
+async def client(port, request, deadline, timeout, latencies, failures):
+    connection = None
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            status, keep_alive = await asyncio.wait_for(fetch(*connection, request), timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            failures.append(1)
+            if connection:
+                connection[1].close()
+            connection = None
+            await asyncio.sleep(0.05)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status != 200:
+            failures.append(1)
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+    if connection:
+        connection[1].close()
+
+
+async def load(port, headers, connections, seconds, timeout):
+    request = (
+        f'GET /api/subjects HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+        f'Authorization: {headers["Authorization"]}\r\n\r\n'
+    ).encode()
+    latencies, failures = [], []
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(client(port, request, deadline, timeout, latencies, failures) for _ in range(connections)))
+    return latencies, len(failures)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--timeout', type=float, default=10, help='per-request timeout in seconds')
+    parser.add_argument('--port', type=int, default=5057)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='ssp-bench-'), 'bench.db')
+    m = load_app(db_path)
+    (user_id,) = seed_users(m, users=1, subjects=30, sessions=0, moods=0, reflections=0)
+    headers = auth_headers(m, user_id)
+    env = {**os.environ, 'DATABASE_URL': f'sqlite:///{db_path}', 'PYTHONWARNINGS': 'ignore'}
+
+    rows = []
+    for name, command in SERVERS:
+        command = [part.format(port=args.port) for part in command]
+        process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            try:
+                wait_for_port(args.port, process)
+            except RuntimeError as e:
+                print(f'{name}: could not start ({str(e).strip().splitlines()[-1] if str(e).strip() else e})')
+                continue
+            for connections in args.connections:
+                latencies, failed = asyncio.run(load(args.port, headers, connections, args.seconds, args.timeout))
+                stats = summarize(latencies) if latencies else {}
+                rows.append({
+                    'server': name, 'connections': connections,
+                    'req_per_s': round(len(latencies) / args.seconds, 1),
+                    'p50_ms': stats.get('p50_ms', '-'), 'p99_ms': stats.get('p99_ms', '-'), 'failed': failed
+                })
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f'GET /api/subjects, {args.seconds:g}s per level\n')
+    print_table(rows, ['server', 'connections', 'req_per_s', 'p50_ms', 'p99_ms', 'failed'])
+
+
+if __name__ == '__main__':
+    main()
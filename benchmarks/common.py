@@ -0,0 +1,227 @@
+"""Shared helpers for the benchmark scripts: scratch database, synthetic data, timing"""
+
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MOODS = ['tired', 'normal', 'energetic']
+DIFFICULTIES = ['easy', 'medium', 'hard']
+PRIORITIES = ['low', 'medium', 'high']
+
+
+# Every /api route as (name, method, url, json body). {subject_id} and {session_cursor} are filled in
+# with the caller's seeded data, and {n} makes the registered email unique per call.
+ROUTES = [
+    ('register', 'POST', '/api/register', {'name': 'Plan Check', 'email': 'plan-check{n}@example.com', 'password': 'pw'}),
+    ('login', 'POST', '/api/login', {'email': 'plan-check@example.com', 'password': 'pw'}),
+    ('get_user', 'GET', '/api/user', None),
+    ('get_subjects', 'GET', '/api/subjects', None),
+    ('add_subject', 'POST', '/api/subjects', {'name': 'New', 'chapters': 10, 'difficulty': 'hard', 'priority': 'high', 'deadline': '2030-01-01T00:00:00'}),
+    ('update_subject', 'PUT', '/api/subjects/{subject_id}', {'completed_chapters': 3, 'priority': 'low'}),
+    ('get_gamification', 'GET', '/api/gamification', None),
+    ('add_xp', 'POST', '/api/gamification/xp', {'xp': 40}),
+    ('update_streak', 'POST', '/api/gamification/streak', None),
+    ('award_badge', 'POST', '/api/gamification/badges', {'badge_id': 'night_owl'}),
+    ('set_mode', 'POST', '/api/gamification/mode', {'mode': 'exam'}),
+    ('get_sessions', 'GET', '/api/sessions', None),
+    ('get_sessions_page', 'GET', '/api/sessions?limit=20&before={session_cursor}', None),
+    ('record_session', 'POST', '/api/sessions', {'subject_id': '{subject_id}', 'duration_minutes': 25}),
+    ('get_reflections', 'GET', '/api/reflections', None),
+    ('record_reflection', 'POST', '/api/reflections', {'subject_id': '{subject_id}', 'reason_idx': 4}),
+    ('get_analytics_summary', 'GET', '/api/analytics/summary', None),
+    ('get_study_heatmap', 'GET', '/api/analytics/heatmap', None),
+    ('record_mood', 'POST', '/api/v1/moods', {'mood': 'normal', 'effectiveness': 4}),
+    ('get_moods', 'GET', '/api/v1/moods?days=365', None),
+    ('ingest_batch', 'POST', '/api/v1/batch', {
+        'sessions': [{'key': f'plan-s{i}', 'duration_minutes': 25} for i in range(20)],
+        'moods': [{'key': 'plan-m1', 'mood': 'tired', 'session_key': 'plan-s0'}],
+        'reflections': [{'key': 'plan-r1', 'reason_idx': 2, 'date': '2024-01-15T19:30:00+05:30'}]
+    }),
+    ('get_failure_analytics', 'GET', '/api/v1/analytics/failure', None),
+    ('generate_weekly_plan', 'POST', '/api/v1/planner/generate', None),
+    ('get_weekly_plan', 'GET', '/api/v1/planner', None),
+    ('get_sync_status', 'GET', '/api/v1/sync/status', None),
+    ('get_sync_changes', 'GET', '/api/v1/sync/changes?since=0', None),
+    ('wait_for_changes', 'GET', '/api/v1/sync/wait?since=0&timeout=0', None),
+    ('sync_events', 'GET', '/api/v1/sync/events?since=0', None),
+    ('get_leaderboard', 'GET', '/api/v1/leaderboard?limit=5', None),
+    ('get_leaderboard_week', 'GET', '/api/v1/leaderboard?period=week&limit=5', None),
+    ('get_my_rank', 'GET', '/api/v1/leaderboard/me', None),
+    ('api_info', 'GET', '/api/v1/info', None),
+    ('get_metrics', 'GET', '/api/v1/metrics', None),
+    ('export_account', 'GET', '/api/v1/export', None),
+    ('export_account_csv', 'GET', '/api/v1/export?format=csv', None),
+    ('import_account', 'POST', '/api/v1/import', {'type': 'sessions', 'subject_id': None, 'duration_minutes': 25}),
+    ('delete_subject', 'DELETE', '/api/subjects/{subject_id}', None),
+]
+
+
+def load_app(db_path=None):
+    """Import app.py against a scratch SQLite database with rate limits disabled"""
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='ssp-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    # ROUTES scrapes /api/v1/metrics with a user's token, like any other route
+    os.environ.setdefault('METRICS_PUBLIC', 'true')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    
+    import app as app_module
+    app_module.limiter.enabled = False
+    with app_module.app.app_context():
+        app_module.init_db()
+    return app_module
+
+
+def seed_users(app_module, users=1, subjects=10, sessions=100, moods=100, reflections=100,
+               days=365, seed=0, batch_size=10000):
+    """Bulk-insert synthetic accounts and return their user ids.
+    
+    Rows bypass the ORM unit of work, so each user's rollups are dropped
+    afterwards and rebuilt lazily from the raw tables on first read. Each user
+    gets the single change-log row registration would have written, which
+    gives them a data version (ETag) from the start.
+    """
+    m = app_module
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    
+    def when():
+        return now - timedelta(seconds=rng.randrange(days * 86400))
+    
+    def insert(model, rows):
+        for start in range(0, len(rows), batch_size):
+            m.db.session.execute(model.__table__.insert(), rows[start:start + batch_size])
+    
+    with m.app.app_context():
+        first_id = (m.db.session.query(m.func.max(m.User.id)).scalar() or 0) + 1
+        user_ids = list(range(first_id, first_id + users))
+        password = m.generate_password_hash('benchmark')
+        
+        insert(m.User, [
+            {'id': uid, 'name': f'Bench {uid}', 'email': f'bench{uid}@example.com', 'password': password, 'created_at': now}
+            for uid in user_ids
+        ])
+        insert(m.Gamification, [
+            {'user_id': uid, 'xp': rng.randrange(5000), 'level': 1, 'streak': rng.randrange(30),
+             'total_minutes_studied': 0, 'badges_earned': '[]', 'current_mode': 'normal', 'last_study_date': when()}
+            for uid in user_ids
+        ])
+        gamification_ids = m.db.session.query(m.Gamification.user_id, m.Gamification.id).filter(
+            m.Gamification.user_id.in_(user_ids))
+        insert(m.ChangeLogEntry, [
+            {'user_id': uid, 'entity': 'gamification', 'entity_id': gid, 'op': 'upsert', 'changed_at': now}
+            for uid, gid in gamification_ids
+        ])
+        
+        for uid in user_ids:
+            subject_rows = []
+            for i in range(subjects):
+                chapters = rng.randint(1, 40)
+                subject_rows.append({
+                    'user_id': uid, 'name': f'Subject {i}', 'chapters': chapters,
+                    'completed_chapters': rng.randint(0, chapters), 'difficulty': rng.choice(DIFFICULTIES),
+                    'priority': rng.choice(PRIORITIES), 'deadline': now + timedelta(days=rng.randint(1, 180)),
+                    'sessions_completed': 0, 'total_time_minutes': 0, 'is_deleted': False,
+                    'created_at': now, 'updated_at': now
+                })
+            insert(m.Subject, subject_rows)
+            subject_ids = [sid for (sid,) in m.db.session.query(m.Subject.id).filter_by(user_id=uid)]
+            
+            insert(m.StudySession, [
+                {'user_id': uid, 'subject_id': rng.choice(subject_ids) if subject_ids else None,
+                 'duration_minutes': rng.choice([25, 25, 50, 15]), 'date': when(), 'pomodoro_count': 1}
+                for _ in range(sessions)
+            ])
+            insert(m.StudyMood, [
+                {'user_id': uid, 'mood': rng.choice(MOODS), 'time': when(),
+                 'duration_minutes': 25, 'effectiveness': rng.randint(1, 5)}
+                for _ in range(moods)
+            ])
+            insert(m.Reflection, [
+                {'user_id': uid, 'subject_id': rng.choice(subject_ids) if subject_ids else None,
+                 'reason_idx': rng.randrange(6), 'reason_text': '', 'date': when()}
+                for _ in range(reflections)
+            ])
+        
+        m.UserStats.query.filter(m.UserStats.user_id.in_(user_ids)).delete()
+        m.StudyHeatmapBucket.query.filter(m.StudyHeatmapBucket.user_id.in_(user_ids)).delete()
+        m.db.session.commit()
+    
+    return user_ids
+
+
+def fill(value, params):
+    """Substitute params into a ROUTES url or body; placeholders that fill a whole value become ints"""
+    if isinstance(value, str):
+        filled = value.format_map(params)
+        return int(filled) if filled.isdigit() and value != filled else filled
+    if isinstance(value, dict):
+        return {k: fill(v, params) for k, v in value.items()}
+    return value
+
+
+def auth_headers(app_module, user_id):
+    """Bearer token for a seeded user, minted without going through /api/login"""
+    m = app_module
+    with m.app.app_context():
+        user = m.db.session.get(m.User, user_id)
+        return {'Authorization': f'Bearer {m.issue_access_token(user)}'}
+
+
+def wait_for_port(port, process, timeout=30):
+    """Block until a server subprocess accepts connections on `port`"""
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(process.stderr.read().decode()[-2000:] if process.stderr
+                               else f'server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def measure(fn, runs=50, warmup=5):
+    """Call fn repeatedly and return per-call latencies in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        'runs': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3)
+    }
+
+
+def print_table(rows, columns):
+    """Print a list of dicts as an aligned text table"""
+    widths = {c: max(len(c), *(len(str(r.get(c, ''))) for r in rows)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print('  '.join(str(row.get(c, '')).ljust(widths[c]) for c in columns))
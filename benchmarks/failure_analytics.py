@@ -0,0 +1,60 @@
+"""Benchmark /api/v1/analytics/failure on an account with a large reflection history.
+
+    python -m benchmarks.failure_analytics --reflections 100000 --moods 100000
+"""
+
+import argparse
+
+from sqlalchemy import event
+
+from benchmarks.common import auth_headers, load_app, measure, print_table, seed_users, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reflections', type=int, default=100000)
+    parser.add_argument('--moods', type=int, default=100000)
+    parser.add_argument('--history-days', type=int, default=365)
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+    
+    m = load_app()
+    (user_id,) = seed_users(m, users=1, subjects=20, sessions=0, moods=args.moods,
+                            reflections=args.reflections, days=args.history_days)
+    client = m.app.test_client()
+    headers = auth_headers(m, user_id)
+    
+    rows = []
+    for window in (7, 30, args.history_days):
+        url = f'/api/v1/analytics/failure?days={window}'
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.json
+        samples = measure(lambda: client.get(url, headers=headers), runs=args.runs)
+        rows.append({'window_days': window, **summarize(samples)})
+    
+    print(f'{args.reflections} reflections, {args.moods} moods for one user over {args.history_days} days')
+    print_table(rows, ['window_days', 'runs', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+    
+    # Re-run the route once, capturing its SQL, and show how SQLite plans each statement
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    
+    with m.app.app_context():
+        for engine in m.db.engines.values():
+            event.listen(engine, 'before_cursor_execute', capture)
+        client.get(f'/api/v1/analytics/failure?days={args.history_days}', headers=headers)
+        for engine in m.db.engines.values():
+            event.remove(engine, 'before_cursor_execute', capture)
+        
+        connection = m.db.engine.raw_connection()
+        for statement, parameters in statements:
+            if 'reflections' in statement or 'study_moods' in statement:
+                plan = connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+                table = 'reflections' if 'reflections' in statement else 'study_moods'
+                print(f'{table}: {" | ".join(row[-1] for row in plan)}')
+        connection.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Stress gamification writes from parallel threads and check that no increment is lost.
+
+Every thread hammers one user's /api/gamification/xp, /api/sessions and
+/api/gamification/badges routes. Afterwards the stored xp, minutes and badge
+list must account for every successful request. The same load is replayed
+against the previous read-modify-write code path for comparison.
+
+    python -m benchmarks.gamification_concurrency --threads 8 --requests 100
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+from benchmarks.common import auth_headers, load_app, print_table, seed_users
+
+BADGE_IDS = ['night_owl', 'early_bird', 'streak_7', 'level_10', 'thirty_day_streak']
+XP_PER_REQUEST = 7
+MINUTES_PER_SESSION = 5
+
+
+def run_threads(threads, target):
+    workers = [threading.Thread(target=target, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def atomic_load(m, user_id, threads, requests):
+    """Drive the real routes; returns what succeeded and the elapsed time"""
+    headers = auth_headers(m, user_id)
+    lock = threading.Lock()
+    totals = {'xp': 0, 'minutes': 0, 'badges': set(), 'errors': 0}
+
+    def worker(index):
+        client = m.app.test_client()
+        xp = minutes = errors = 0
+        badges = set()
+        for i in range(requests):
+            response = client.post('/api/gamification/xp', json={'xp': XP_PER_REQUEST}, headers=headers)
+            if response.status_code == 200:
+                xp += XP_PER_REQUEST
+            else:
+                errors += 1
+            response = client.post('/api/sessions', json={'duration_minutes': MINUTES_PER_SESSION}, headers=headers)
+            if response.status_code == 201:
+                minutes += MINUTES_PER_SESSION
+            else:
+                errors += 1
+            if i % 10 == 0:
+                badge = BADGE_IDS[(index + i // 10) % len(BADGE_IDS)]
+                response = client.post('/api/gamification/badges', json={'badge_id': badge}, headers=headers)
+                if response.status_code == 200:
+                    badges.add(badge)
+                else:
+                    errors += 1
+        with lock:
+            totals['xp'] += xp
+            totals['minutes'] += minutes
+            totals['badges'] |= badges
+            totals['errors'] += errors
+
+    return totals, run_threads(threads, worker)
+
+
+def legacy_load(m, user_id, threads, requests):
+    """The previous add_xp body: read xp into Python, add, commit"""
+    applied = [0] * threads
+
+    def worker(index):
+        with m.app.app_context():
+            for _ in range(requests):
+                gamif = m.Gamification.query.filter_by(user_id=user_id).one()
+                gamif.xp += XP_PER_REQUEST
+                gamif.level = gamif.xp // 100 + 1
+                try:
+                    m.db.session.commit()
+                    applied[index] += XP_PER_REQUEST
+                except Exception:
+                    m.db.session.rollback()
+
+    elapsed = run_threads(threads, worker)
+    return sum(applied), elapsed
+
+
+def stored(m, user_id):
+    with m.app.app_context():
+        gamif = m.Gamification.query.filter_by(user_id=user_id).one()
+        return gamif.xp, gamif.level, gamif.total_minutes_studied, set(gamif.get_badges())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='iterations per thread')
+    args = parser.parse_args()
+
+    m = load_app()
+    atomic_user, legacy_user = seed_users(m, users=2, subjects=1, sessions=0, moods=0, reflections=0)
+
+    xp0, _, minutes0, _ = stored(m, atomic_user)
+    totals, atomic_elapsed = atomic_load(m, atomic_user, args.threads, args.requests)
+    xp, level, minutes, badges = stored(m, atomic_user)
+
+    legacy_xp0 = stored(m, legacy_user)[0]
+    legacy_applied, legacy_elapsed = legacy_load(m, legacy_user, args.threads, args.requests)
+    legacy_xp = stored(m, legacy_user)[0]
+
+    lost_badges = totals['badges'] - badges
+    rows = [
+        {'path': 'atomic routes', 'counter': 'xp', 'acknowledged': totals['xp'], 'stored': xp - xp0,
+         'lost': totals['xp'] - (xp - xp0), 'seconds': round(atomic_elapsed, 2)},
+        {'path': 'atomic routes', 'counter': 'minutes', 'acknowledged': totals['minutes'],
+         'stored': minutes - minutes0, 'lost': totals['minutes'] - (minutes - minutes0)},
+        {'path': 'atomic routes', 'counter': 'badges', 'acknowledged': len(totals['badges']),
+         'stored': len(totals['badges'] & badges), 'lost': len(lost_badges)},
+        {'path': 'read-modify-write', 'counter': 'xp', 'acknowledged': legacy_applied,
+         'stored': legacy_xp - legacy_xp0, 'lost': legacy_applied - (legacy_xp - legacy_xp0),
+         'seconds': round(legacy_elapsed, 2)},
+    ]
+    print(f'{args.threads} threads x {args.requests} iterations, {totals["errors"]} failed requests\n')
+    print_table(rows, ['path', 'counter', 'acknowledged', 'stored', 'lost', 'seconds'])
+
+    failures = []
+    if xp - xp0 != totals['xp']:
+        failures.append('xp increments were lost')
+    if level != xp // 100 + 1:
+        failures.append(f'level {level} does not match xp {xp}')
+    if minutes - minutes0 != totals['minutes']:
+        failures.append('session minutes were lost')
+    if lost_badges:
+        failures.append(f'{len(lost_badges)} awarded badges are missing')
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        return 1
+    print('\nNo acknowledged gamification update was lost')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""Benchmark leaderboard rank lookups against counting rows ahead of the user.
+
+Seeds --rows gamification rows, then times /api/v1/leaderboard/me and the
+top-N route while another user keeps earning XP, next to the COUNT query a
+rank lookup would need without the in-process standings.
+
+It then checks that a refresh keeps every writer's XP when more than
+XpLeaderboard.MAX_INCREMENTAL changes land between two reads. In both cases one
+busy user writes MAX_INCREMENTAL times first. Then either a few hundred other
+users write (the refresh applies them one by one), or more than
+MAX_INCREMENTAL users do (the refresh reloads everything).
+
+    python -m benchmarks.leaderboard --rows 1000000
+"""
+
+import argparse
+import random
+import sys
+import time
+
+from sqlalchemy import text
+
+from benchmarks.common import auth_headers, load_app, measure, print_table, seed_users, summarize
+
+COUNT_AHEAD = text(
+    'SELECT count(*) FROM gamification WHERE xp > :xp OR (xp = :xp AND user_id < :user_id)'
+)
+
+
+def seed_gamification(m, rows, first_user_id, seed=0, batch_size=50000):
+    """Insert bare gamification rows with random xp for ids after the seeded accounts"""
+    rng = random.Random(seed)
+    table = m.Gamification.__table__
+    with m.app.app_context():
+        for start in range(first_user_id, first_user_id + rows, batch_size):
+            m.db.session.execute(table.insert(), [
+                {'user_id': user_id, 'xp': rng.randrange(50000), 'level': 1, 'streak': 0, 'total_minutes_studied': 0,
+                 'badges_earned': '[]', 'badges_mask': 0, 'current_mode': 'normal', 'utc_offset_minutes': 0}
+                for user_id in range(start, min(first_user_id + rows, start + batch_size))
+            ])
+        m.db.session.commit()
+
+
+def stale_writers(m, writes):
+    """Give XP to each user in `writes` (in order), refresh once, and count standings that disagree"""
+    with m.app.app_context():
+        m.xp_leaderboard.refresh()
+        for user_id in writes:
+            m.write_gamification(m.db.session, user_id, xp=m.Gamification.xp + 1000)
+        m.db.session.commit()
+        m.xp_leaderboard.refresh()
+        stored = m.db.session.query(m.Gamification.user_id, m.Gamification.xp).filter(
+            m.Gamification.user_id.in_(set(writes))
+        ).all()
+        return sum(m.xp_leaderboard._standings.rank(user_id)[1] != xp for user_id, xp in stored)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    m = load_app()
+    reader, writer = seed_users(m, users=2, subjects=0, sessions=0, moods=0, reflections=0)
+    seed_gamification(m, args.rows, writer + 1)
+    client = m.app.test_client()
+    reader_headers = auth_headers(m, reader)
+    writer_headers = auth_headers(m, writer)
+
+    with m.app.app_context():
+        started = time.perf_counter()
+        m.xp_leaderboard.refresh()
+        load_seconds = time.perf_counter() - started
+
+    def rank_after_write():
+        client.post('/api/gamification/xp', json={'xp': 25}, headers=writer_headers)
+        response = client.get('/api/v1/leaderboard/me', headers=reader_headers)
+        assert response.status_code == 200, response.json
+
+    def top_after_write():
+        client.post('/api/gamification/xp', json={'xp': 25}, headers=writer_headers)
+        response = client.get('/api/v1/leaderboard?limit=100', headers=reader_headers)
+        assert response.status_code == 200, response.json
+
+    def write_only():
+        client.post('/api/gamification/xp', json={'xp': 25}, headers=writer_headers)
+
+    with m.app.app_context():
+        xp = m.Gamification.query.filter_by(user_id=reader).one().xp
+
+        def count_ahead():
+            m.db.session.execute(COUNT_AHEAD, {'xp': xp, 'user_id': reader}).scalar()
+
+        rows = [
+            {'path': 'add_xp only', **summarize(measure(write_only, runs=args.runs))},
+            {'path': 'add_xp + /leaderboard/me', **summarize(measure(rank_after_write, runs=args.runs))},
+            {'path': 'add_xp + /leaderboard?limit=100', **summarize(measure(top_after_write, runs=args.runs))},
+            {'path': 'COUNT rows ahead (SQL)', **summarize(measure(count_ahead, runs=min(args.runs, 20), warmup=1))},
+        ]
+        expected = m.db.session.execute(COUNT_AHEAD, {'xp': xp, 'user_id': reader}).scalar() + 1
+
+    rank = client.get('/api/v1/leaderboard/me', headers=reader_headers).json['rank']
+    print(f'{args.rows + 2} ranked users, initial standings load {load_seconds:.2f}s\n')
+    print_table(rows, ['path', 'runs', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+    print(f'\nReader rank {rank}, COUNT query says {expected}' + ('' if rank == expected else '  MISMATCH'))
+
+    limit = m.XpLeaderboard.MAX_INCREMENTAL
+    others = list(range(writer + 1, writer + 1 + min(args.rows, limit + 1)))
+    failed = False
+    for name, writers in [('incremental', others[:500]), ('reload', others[:limit + 1])]:
+        if name == 'reload' and len(writers) <= limit:
+            print(f'{name} refresh: skipped, needs --rows above {limit}')
+            continue
+        stale = stale_writers(m, [writer] * limit + writers)
+        failed |= bool(stale)
+        print(f'{name} refresh after {limit} writes by one user and 1 by each of {len(writers)} others: '
+              f'{stale} stale standings')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+"""Latency percentiles and throughput for every /api route, with saved baselines.
+
+Seeds --users users, each with --subjects subjects and --rows study sessions,
+moods and reflections, into a scratch SQLite database. Every route in
+benchmarks.common.ROUTES is then driven in two phases:
+
+- client: --runs sequential requests per route through the Flask test client
+  (app code only, no HTTP server or network stack)
+- http: --threads threads, each on its own connection, send requests to the app
+  in a server subprocess (--server wsgi runs app.run, asgi runs uvicorn
+  asgi:application) for --seconds, cycling through every route
+
+Each phase reports p50/p95/p99 latency, requests per second and error
+responses (status >= 400) per route. Registration gets a fresh email on every
+call, and each delete removes a subject created just before it (untimed).
+Password hashing makes register/login far slower than the rest by design.
+
+--save-baseline writes the results to --baseline. Later runs compare against
+that file and exit non-zero when a route's p95 grows by more than --tolerance
+(and by at least --min-delta-ms), or when total HTTP throughput drops by more
+than --tolerance. Baselines only compare runs on the same
+machine with the same options, so they are not committed.
+
+    python -m benchmarks.load_test --users 20 --subjects 30 --rows 2000 --save-baseline
+    python -m benchmarks.load_test --users 20 --subjects 30 --rows 2000   # after a change
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.common import (
+    ROOT, ROUTES, auth_headers, fill, load_app, print_table, seed_users, summarize, wait_for_port
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_baseline.json')
+
+SERVERS = {
+    'wsgi': [sys.executable, '-c', 'import app; app.limiter.enabled = False; app.app.run(port={port}, threaded=True)'],
+    'asgi': [
+        sys.executable, '-c',
+        'import app, uvicorn; app.limiter.enabled = False; '
+        'uvicorn.run("asgi:application", port={port}, log_level="warning")'
+    ],
+}
+
+# Shared by every driver so registered emails stay unique across threads and phases
+serials = itertools.count(1)
+
+COLUMNS = ['route', 'runs', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'req_per_s']
+
+
+class RouteDriver:
+    """Sends ROUTES requests through `send(method, url, body)`, filling in per-call parameters"""
+
+    def __init__(self, params, send):
+        self.params = params
+        self.send = send
+
+    def call_params(self, name):
+        """Parameters for one call of route `name`; setup requests here are not timed"""
+        if name == 'register':
+            return {**self.params, 'n': f'-{next(serials)}'}
+        if name == 'delete_subject':
+            status, body = self.send('POST', '/api/subjects', {
+                'name': 'Disposable', 'chapters': 1, 'difficulty': 'easy', 'priority': 'low',
+                'deadline': '2030-01-01T00:00:00'
+            })
+            return {**self.params, 'subject_id': json.loads(body)['subject']['id']}
+        return self.params
+
+    def call(self, route):
+        """Time one request; returns (milliseconds, status)"""
+        name, method, url, body = route
+        params = self.call_params(name)
+        started = time.perf_counter()
+        status, _ = self.send(method, fill(url, params), fill(body, params))
+        return (time.perf_counter() - started) * 1000, status
+
+
+def client_sender(client, headers):
+    def send(method, url, body):
+        response = client.open(url, method=method, json=body, headers=headers)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+    return send
+
+
+def http_sender(port, headers):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+
+    def send(method, url, body):
+        payload = json.dumps(body).encode() if body is not None else None
+        request_headers = {**headers, 'Content-Type': 'application/json'} if payload else headers
+        connection.request(method, url, body=payload, headers=request_headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    return send
+
+
+def report_rows(samples, errors, seconds=None):
+    """Table rows per route; throughput is calls per wall-clock second when `seconds` is given"""
+    rows = []
+    for name, latencies in samples.items():
+        stats = summarize(latencies)
+        rate = len(latencies) / seconds if seconds else 1000 / stats['mean_ms']
+        rows.append({'route': name, 'runs': len(latencies), 'errors': errors[name], 'p50_ms': stats['p50_ms'],
+                     'p95_ms': stats['p95_ms'], 'p99_ms': stats['p99_ms'], 'req_per_s': round(rate, 1)})
+    return rows
+
+
+def run_client(m, routes, params, headers, runs, warmup):
+    driver = RouteDriver(params, client_sender(m.app.test_client(), headers))
+    samples, errors = defaultdict(list), defaultdict(int)
+    for route in routes:
+        for i in range(warmup + runs):
+            elapsed, status = driver.call(route)
+            if i >= warmup:
+                samples[route[0]].append(elapsed)
+                errors[route[0]] += status >= 400
+    return report_rows(samples, errors)
+
+
+def run_http(port, routes, params, headers, threads, seconds):
+    samples, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def worker(offset):
+        driver = RouteDriver(params, http_sender(port, headers))
+        local_samples, local_errors = defaultdict(list), defaultdict(int)
+        # Threads start at different routes so every route is in flight at once
+        for i in itertools.count(offset):
+            if time.monotonic() >= deadline:
+                break
+            route = routes[i % len(routes)]
+            elapsed, status = driver.call(route)
+            local_samples[route[0]].append(elapsed)
+            local_errors[route[0]] += status >= 400
+        with lock:
+            for name, latencies in local_samples.items():
+                samples[name].extend(latencies)
+                errors[name] += local_errors[name]
+
+    workers = [threading.Thread(target=worker, args=(i * len(routes) // threads,)) for i in range(threads)]
+    started = time.monotonic()
+    for each in workers:
+        each.start()
+    for each in workers:
+        each.join()
+    elapsed = time.monotonic() - started
+    rows = report_rows({name: samples[name] for name, _, _, _ in routes if samples[name]}, errors, elapsed)
+    total = sum(len(latencies) for latencies in samples.values())
+    rows.append({'route': 'TOTAL', 'runs': total, 'errors': sum(errors.values()), 'req_per_s': round(total / elapsed, 1)})
+    return rows
+
+
+def regressions(results, baseline, tolerance, min_delta_ms):
+    found = []
+    for phase, rows in results.items():
+        before = {row['route']: row for row in baseline.get(phase, [])}
+        for row in rows:
+            old = before.get(row['route'])
+            if not old:
+                continue
+            if 'p95_ms' not in row:
+                if row['req_per_s'] < old['req_per_s'] * (1 - tolerance):
+                    found.append(f'{phase} {row["route"]}: {old["req_per_s"]} -> {row["req_per_s"]} req/s')
+                continue
+            delta = row['p95_ms'] - old['p95_ms']
+            if delta > min_delta_ms and row['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                found.append(f'{phase} {row["route"]}: p95 {old["p95_ms"]} -> {row["p95_ms"]} ms')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--subjects', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=2000, help='sessions, moods and reflections per user')
+    parser.add_argument('--runs', type=int, default=50, help='test-client requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=8, help='HTTP load generator threads')
+    parser.add_argument('--seconds', type=float, default=20, help='HTTP phase duration')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='wsgi')
+    parser.add_argument('--port', type=int, default=5058)
+    parser.add_argument('--phases', nargs='+', choices=['client', 'http'], default=['client', 'http'])
+    parser.add_argument('--routes', nargs='+', help='route names to run (default: all)')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative p95 growth')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore p95 growth smaller than this')
+    args = parser.parse_args()
+
+    routes = [route for route in ROUTES if not args.routes or route[0] in args.routes]
+    db_path = os.path.join(tempfile.mkdtemp(prefix='ssp-bench-'), 'bench.db')
+    m = load_app(db_path)
+    user_ids = seed_users(m, users=args.users, subjects=args.subjects, sessions=args.rows,
+                          moods=args.rows, reflections=args.rows)
+    user_id = user_ids[len(user_ids) // 2]
+    headers = auth_headers(m, user_id)
+    with m.app.app_context():
+        subject_id = m.db.session.query(m.Subject.id).filter_by(user_id=user_id).first()[0]
+        newest = m.StudySession.query.filter_by(user_id=user_id).order_by(m.StudySession.date.desc()).first()
+        params = {'n': '', 'subject_id': subject_id, 'session_cursor': m.encode_cursor(newest.date, newest.id)}
+    # The login route signs in as the account the unnumbered register call creates
+    client_sender(m.app.test_client(), {})('POST', '/api/register', fill(ROUTES[0][3], params))
+    # Event streams end straight after the retry line, so no thread waits on them
+    m.app.config['SYNC_EVENTS_MAX_SECONDS'] = 0
+
+    config = {key: getattr(args, key) for key in ('users', 'subjects', 'rows', 'runs', 'threads', 'seconds', 'server')}
+    print(f'{args.users} users x {args.subjects} subjects x {args.rows} sessions/moods/reflections')
+    results = {}
+
+    if 'client' in args.phases:
+        results['client'] = run_client(m, routes, params, headers, args.runs, args.warmup)
+        print(f'\nFlask test client, {args.runs} sequential requests per route\n')
+        print_table(results['client'], COLUMNS)
+
+    if 'http' in args.phases:
+        env = {**os.environ, 'DATABASE_URL': f'sqlite:///{db_path}', 'PYTHONWARNINGS': 'ignore',
+               'SYNC_EVENTS_MAX_SECONDS': '0'}
+        command = [part.format(port=args.port) for part in SERVERS[args.server]]
+        # The server logs every request; a file (unlike an unread pipe) never fills up and blocks it
+        log_path = os.path.join(os.path.dirname(db_path), 'server.log')
+        with open(log_path, 'wb') as log:
+            process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_for_port(args.port, process)
+            results['http'] = run_http(args.port, routes, params, headers, args.threads, args.seconds)
+        except RuntimeError as e:
+            print(f'\n{e}; server output is in {log_path}')
+            return 1
+        finally:
+            process.terminate()
+            process.wait()
+        print(f'\nHTTP ({args.server} server), {args.threads} threads for {args.seconds:g}s\n')
+        print_table(results['http'], COLUMNS)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, **results}, f, indent=2)
+            f.write('\n')
+        print(f'\nSaved baseline to {args.baseline}')
+        return 0
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        print(f'\nBaseline {args.baseline} was recorded with {baseline.get("config")}; not comparing')
+        return 0
+    found = regressions(results, baseline, args.tolerance, args.min_delta_ms)
+    if found:
+        print('\n' + '\n'.join(f'REGRESSION {line}' for line in found))
+        return 1
+    print(f'\nNo p95 regressions beyond {args.tolerance:.0%} against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Measure /api/subjects latency while a storm of logins hashes passwords.
+
+A reader thread polls /api/subjects while --login-threads threads keep posting
+to /api/login. The storm runs twice: once with one hashing thread per login
+thread (what hashing inline on every request thread amounts to), and once with
+the bounded pool from PASSWORD_HASH_WORKERS / PASSWORD_HASH_QUEUE_MAX. Logins
+the pool turns away with 503 are counted as shed.
+
+    python -m benchmarks.login_storm --login-threads 16 --seconds 10
+"""
+
+import argparse
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import auth_headers, load_app, print_table, seed_users, summarize
+
+
+def storm(m, hasher, email, reader_headers, login_threads, seconds):
+    """Run the reader against `login_threads` login loops; returns (read latencies, login status counts)"""
+    m.password_hasher = hasher
+    stop = threading.Event()
+    statuses = Counter()
+    lock = threading.Lock()
+    latencies = []
+
+    def login_loop():
+        client = m.app.test_client()
+        counts = Counter()
+        while not stop.is_set():
+            response = client.post('/api/login', json={'email': email, 'password': 'benchmark'})
+            counts[response.status_code] += 1
+        with lock:
+            statuses.update(counts)
+
+    def read_loop():
+        client = m.app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.get('/api/subjects', headers=reader_headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.json
+            time.sleep(0.005)
+
+    workers = [threading.Thread(target=login_loop) for _ in range(login_threads)]
+    workers.append(threading.Thread(target=read_loop))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    return latencies, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    m = load_app()
+    login_user, reader = seed_users(m, users=2, subjects=20, sessions=0, moods=0, reflections=0)
+    email = f'bench{login_user}@example.com'
+    reader_headers = auth_headers(m, reader)
+    method = m.app.config['PASSWORD_HASH_METHOD']
+    workers = m.app.config['PASSWORD_HASH_WORKERS']
+    queue_max = m.app.config['PASSWORD_HASH_QUEUE_MAX']
+
+    scenarios = [
+        ('no logins', None, 0),
+        ('hash on every request thread', m.PasswordHasher(method, args.login_threads, 0), args.login_threads),
+        (f'pool ({workers} workers, queue {queue_max})', m.PasswordHasher(method, workers, queue_max), args.login_threads),
+    ]
+    rows = []
+    for name, hasher, threads in scenarios:
+        latencies, statuses = storm(m, hasher or m.password_hasher, email, reader_headers, threads, args.seconds)
+        rows.append({
+            'scenario': name, **summarize(latencies),
+            'logins_per_s': round(statuses[200] / args.seconds, 1),
+            'shed_503': statuses[503]
+        })
+
+    print(f'{method}, {args.login_threads} login threads, {args.seconds:g}s per scenario\n')
+    print_table(rows, ['scenario', 'runs', 'p50_ms', 'p95_ms', 'p99_ms', 'logins_per_s', 'shed_503'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Request metrics overhead per request, and whether any route trips N+1 detection.
+
+Each route is requested alternately with request metrics recording and with
+the request_started receiver disconnected (no record, so the after_request
+hook and cursor events return at once). The two sides interleave request by
+request, and overhead_us is the difference of their medians. `statements` is
+the route's mean SQL statement count from the metrics themselves, and
+`n_plus_one` counts its requests that repeated one statement at least
+METRICS_N_PLUS_ONE_THRESHOLD times.
+
+    python -m benchmarks.metrics_overhead --subjects 50 --sessions 2000 --runs 2000
+"""
+
+import argparse
+import statistics
+import time
+
+from flask import request_started
+
+from benchmarks.common import auth_headers, load_app, print_table, seed_users
+
+ROUTES = [
+    '/api/v1/info',
+    '/api/user',
+    '/api/subjects',
+    '/api/sessions?limit=50',
+    '/api/gamification',
+    '/api/analytics/summary',
+]
+
+
+def overhead_us(m, client, url, headers, runs):
+    samples = {False: [], True: []}
+    for i in range(2 * runs):
+        recording = bool(i % 2)
+        if recording:
+            request_started.connect(m.request_metrics.start, m.app)
+        started = time.perf_counter()
+        response = client.get(url, headers=headers)
+        elapsed = time.perf_counter() - started
+        request_started.disconnect(m.request_metrics.start, m.app)
+        assert response.status_code == 200, (url, response.status_code)
+        samples[recording].append(elapsed)
+    base = statistics.median(samples[False])
+    return (statistics.median(samples[True]) - base) * 1e6, base * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--runs', type=int, default=2000, help='requests per route and side')
+    args = parser.parse_args()
+
+    m = load_app()
+    if not m.app.config['METRICS_ENABLED']:
+        parser.error('METRICS_ENABLED is off')
+    (user_id,) = seed_users(m, users=1, subjects=args.subjects, sessions=args.sessions)
+    headers = auth_headers(m, user_id)
+    client = m.app.test_client()
+
+    rows = []
+    for url in ROUTES:
+        extra_us, base_us = overhead_us(m, client, url, headers, args.runs)
+        endpoint = m.app.url_map.bind('').match(url.split('?')[0])[0]
+        statements = m.request_metrics._statements[endpoint]
+        rows.append({
+            'route': url, 'base_us': round(base_us), 'overhead_us': round(extra_us, 1),
+            'overhead_pct': round(extra_us / base_us * 100, 1),
+            'statements': round(statements.sum / max(1, sum(statements.counts)), 1),
+            'n_plus_one': m.request_metrics._n_plus_one[endpoint],
+        })
+
+    print(f'{args.subjects} subjects and {args.sessions} sessions, {args.runs} requests per route and side\n')
+    print_table(rows, ['route', 'base_us', 'overhead_us', 'overhead_pct', 'statements', 'n_plus_one'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark the weekly planner engine against the previous round-robin planner.
+
+    python -m benchmarks.planner --subjects 10 100 500 1000
+"""
+
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from benchmarks.common import ROOT, auth_headers, load_app, measure, print_table, seed_users, summarize
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import planner  # noqa: E402
+
+
+def legacy_plan(subjects):
+    """The pre-engine algorithm from generate_weekly_plan, kept verbatim for comparison"""
+    def subject_score(subj):
+        days_left = max(1, (subj.deadline - datetime.utcnow()).days)
+        chapters_left = subj.chapters - subj.completed_chapters
+        difficulty_weight = {'easy': 1, 'medium': 2, 'hard': 3}.get(subj.difficulty, 2)
+        priority_weight = {'low': 1, 'medium': 2, 'high': 3}.get(subj.priority, 2)
+        urgency = chapters_left / days_left
+        return urgency * difficulty_weight * priority_weight
+    
+    sorted_subjects = sorted(subjects, key=subject_score, reverse=True)
+    plan = {day: [] for day in planner.DAYS}
+    days_list = list(plan.keys())
+    for idx, subject in enumerate(sorted_subjects):
+        chapters_left = subject.chapters - subject.completed_chapters
+        if chapters_left <= 0:
+            continue
+        day_idx = idx % 6
+        daily_chapters = max(1, chapters_left // 2)
+        plan[days_list[day_idx]].append({
+            'subject_name': subject.name,
+            'subject_id': subject.id,
+            'chapters': daily_chapters,
+            'difficulty': subject.difficulty,
+            'priority': subject.priority,
+            'recommended_duration_mins': daily_chapters * 30
+        })
+    return plan
+
+
+def synthetic_subjects(count, seed=0):
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    rows = []
+    for i in range(count):
+        chapters = rng.randint(1, 40)
+        rows.append((i + 1, f'Subject {i}', chapters, rng.randint(0, chapters), rng.choice(['easy', 'medium', 'hard']),
+                     rng.choice(['low', 'medium', 'high']), now + timedelta(days=rng.randint(-3, 120))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, nargs='+', default=[10, 100, 500, 1000])
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+    
+    today = datetime.utcnow().date()
+    budgets = [180] * 6 + [0]
+    rows = []
+    for count in args.subjects:
+        subjects = synthetic_subjects(count)
+        objects = [SimpleNamespace(id=s[0], name=s[1], chapters=s[2], completed_chapters=s[3],
+                                   difficulty=s[4], priority=s[5], deadline=s[6]) for s in subjects]
+        legacy = summarize(measure(lambda: legacy_plan(objects), runs=args.runs))
+        engine = summarize(measure(lambda: planner.build_weekly_plan(subjects, today, budgets), runs=args.runs))
+        exam = summarize(measure(lambda: planner.build_weekly_plan(subjects, today, [300] * 7, mode='exam'), runs=args.runs))
+        rows.append({'subjects': count, 'legacy_p50_ms': legacy['p50_ms'], 'engine_p50_ms': engine['p50_ms'],
+                     'engine_p99_ms': engine['p99_ms'], 'exam_p50_ms': exam['p50_ms']})
+    
+    print('Planner computation only (no database)')
+    print_table(rows, ['subjects', 'legacy_p50_ms', 'engine_p50_ms', 'engine_p99_ms', 'exam_p50_ms'])
+    
+    # End to end through the route, including the subject query and JSON encoding
+    m = load_app()
+    route_rows = []
+    for count in args.subjects:
+        (user_id,) = seed_users(m, users=1, subjects=count, sessions=0, moods=0, reflections=0)
+        client = m.app.test_client()
+        headers = auth_headers(m, user_id)
+        samples = measure(lambda: client.post('/api/v1/planner/generate', headers=headers, json={}), runs=args.runs)
+        route_rows.append({'subjects': count, **summarize(samples)})
+    
+    print('\nPOST /api/v1/planner/generate')
+    print_table(route_rows, ['subjects', 'runs', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'])
+
+
+if __name__ == '__main__':
+    main()
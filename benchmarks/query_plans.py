@@ -0,0 +1,179 @@
+"""Query-plan regression check: every route must hit an index and stay within its query budget.
+
+Seeds a synthetic database, calls every /api route once through the Flask test
+client, captures the SQL each one emits and runs EXPLAIN QUERY PLAN on it.
+Exits non-zero when a statement full-scans a watched table, when a route issues
+more statements than recorded in query_budgets.json, when a route is not
+exercised at all, or when a route that sends an ETag needs more than one
+statement to answer the matching If-None-Match with 304.
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --update-budgets   # after an intended change
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+
+from sqlalchemy import event, text
+
+from benchmarks.common import ROUTES, auth_headers, fill, load_app, seed_users
+
+BUDGETS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_budgets.json')
+
+WATCHED_TABLES = {
+    'users', 'subjects', 'gamification', 'study_sessions', 'reflections', 'study_moods',
+    'user_stats', 'study_heatmap'
+}
+
+SCAN = re.compile(r'^SCAN (\w+)')
+
+# Row count every table's statistics claim, whatever the seed size. Real ANALYZE
+# numbers from a small seed make a full scan the cheaper plan, so the check
+# would depend on --users and --rows rather than on the queries themselves.
+STAT_ROWS = 1000000
+# Below this many rows per user the per-user index looks so selective that a
+# grouped full-index scan wins even at STAT_ROWS, so such seeds are rejected
+MIN_ROWS = 100
+
+
+def pin_table_sizes(session):
+    """Scale the ANALYZE row counts up to STAT_ROWS, keeping each index's selectivity"""
+    for tbl, idx, stat in session.execute(text('SELECT tbl, idx, stat FROM sqlite_stat1')).all():
+        rows, _, rest = stat.partition(' ')
+        if int(rows) < STAT_ROWS:
+            session.execute(
+                text('UPDATE sqlite_stat1 SET stat = :stat WHERE tbl = :tbl AND idx IS :idx'),
+                {'stat': f'{STAT_ROWS} {rest}'.strip(), 'tbl': tbl, 'idx': idx}
+            )
+    # Reloads the statistics into the planner
+    session.execute(text('ANALYZE sqlite_schema'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--subjects', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=2000, help='sessions, moods and reflections per user')
+    parser.add_argument('--update-budgets', action='store_true')
+    args = parser.parse_args()
+    if args.users < 1 or args.subjects < 1 or args.rows < MIN_ROWS:
+        parser.error(f'needs at least one user and subject and --rows {MIN_ROWS} or more')
+    
+    m = load_app()
+    user_ids = seed_users(m, users=args.users, subjects=args.subjects, sessions=args.rows,
+                          moods=args.rows, reflections=args.rows)
+    user_id = user_ids[len(user_ids) // 2]
+    headers = auth_headers(m, user_id)
+    client = m.app.test_client()
+    
+    with m.app.app_context():
+        # Let the planner see realistic table statistics, as a long-lived database would
+        m.db.session.execute(text('ANALYZE'))
+        pin_table_sizes(m.db.session)
+        m.db.session.commit()
+        subject_id = m.db.session.query(m.Subject.id).filter_by(user_id=user_id).first()[0]
+        newest = m.StudySession.query.filter_by(user_id=user_id).order_by(m.StudySession.date.desc()).first()
+        params = {'n': '', 'subject_id': subject_id, 'session_cursor': m.encode_cursor(newest.date, newest.id)}
+        engine = m.db.engine
+        engines = list(m.db.engines.values())  # GET routes read through the read engine
+        # The XP standings load once per process (an index-order scan); routes only see incremental refreshes
+        m.xp_leaderboard.refresh()
+        # Event streams end straight after the retry line, so the run does not wait on them
+        m.app.config['SYNC_EVENTS_MAX_SECONDS'] = 0
+    
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+    
+    for each in engines:
+        event.listen(each, 'before_cursor_execute', capture)
+    
+    counts = {}
+    captured = {}
+    exercised = set()
+    revalidation_failures = []
+    for name, method, url, body in ROUTES:
+        statements.clear()
+        response = client.open(fill(url, params), method=method, json=fill(body, params), headers=headers)
+        if response.status_code >= 400:
+            print(f'FAIL {name}: {method} {url} returned {response.status_code} {response.get_data(as_text=True)[:200]}')
+            return 1
+        response.get_data()  # streamed responses run their queries while the body is read
+        response.close()
+        counts[name] = len(statements)
+        captured[name] = list(statements)
+        exercised.add(m.app.url_map.bind('localhost').match(url.split('?')[0].format_map(params), method=method)[0])
+        
+        # Conditional GETs must revalidate with a single indexed lookup
+        etag = response.headers.get('ETag')
+        if method == 'GET' and etag:
+            statements.clear()
+            response = client.get(fill(url, params), headers={**headers, 'If-None-Match': etag})
+            if response.status_code != 304 or len(statements) > 1:
+                revalidation_failures.append(f'{name}: revalidation returned {response.status_code} '
+                                             f'after {len(statements)} statements')
+            captured[f'{name} (304)'] = list(statements)
+    
+    for each in engines:
+        event.remove(each, 'before_cursor_execute', capture)
+    
+    failures = list(revalidation_failures)
+    missing = {
+        rule.endpoint for rule in m.app.url_map.iter_rules()
+        if rule.rule.startswith('/api/') and rule.endpoint not in exercised
+    }
+    for endpoint in sorted(missing):
+        failures.append(f'{endpoint}: route is not exercised by this check')
+    
+    connection = engine.raw_connection()
+    scans = defaultdict(set)
+    for name, route_statements in captured.items():
+        for statement, parameters in route_statements:
+            if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                continue
+            for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall():
+                match = SCAN.match(row[-1])
+                if match and match.group(1) in WATCHED_TABLES:
+                    scans[name].add(f'{row[-1]}  <-  {" ".join(statement.split())[:160]}')
+    connection.close()
+    for name, details in scans.items():
+        for detail in sorted(details):
+            failures.append(f'{name}: full scan: {detail}')
+    
+    budgets = {}
+    if os.path.exists(BUDGETS_PATH):
+        with open(BUDGETS_PATH) as f:
+            budgets = json.load(f)
+    
+    if args.update_budgets:
+        with open(BUDGETS_PATH, 'w') as f:
+            json.dump(counts, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Recorded query budgets for {len(counts)} routes in {BUDGETS_PATH}')
+    else:
+        for name, count in counts.items():
+            if name not in budgets:
+                failures.append(f'{name}: no recorded query budget (run with --update-budgets)')
+            elif count > budgets[name]:
+                failures.append(f'{name}: {count} statements, budget is {budgets[name]}')
+    
+    for name, count in counts.items():
+        print(f'{name:28} {count:3} statements  budget {budgets.get(name, "-")}')
+    revalidated = [name[:-len(' (304)')] for name in captured if name.endswith(' (304)')]
+    print(f'\nConditional GET revalidated with 304: {", ".join(revalidated) or "none"}')
+    
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        return 1
+    print('\nAll routes use indexes and stay within their query budgets')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Rate-limiter overhead per request, and whether limits hold across worker processes.
+
+Per storage backend (memory:// and the SQLite file store in rate_limits.py):
+- hit_us: cost of one sliding-window-counter hit (a request under the default
+  limits pays two, "200 per day" and "50 per hour")
+- route_us: median GET /api/v1/info with the limiter on, minus the median with
+  it off. Each request comes from a new client address, so none is refused.
+- --processes forked workers then race for a "--limit per hour" key.
+  `allowed` is how many hits got through in total; a shared store allows --limit.
+
+    python -m benchmarks.rate_limit_storage --hits 20000 --processes 4 --limit 1000
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+
+from benchmarks.common import load_app, print_table
+
+
+def hit_cost_us(uri, hits):
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    item = parse('1000000 per hour')
+    started = time.perf_counter()
+    for i in range(hits):
+        limiter.hit(item, 'bench', str(i % 1000))
+    return (time.perf_counter() - started) / hits * 1e6
+
+
+def route_cost_us(m, uri, runs):
+    """Extra microseconds per request with the limiter on, using storage `uri`"""
+    m.limiter._storage = storage_from_string(uri)
+    m.limiter._limiter = SlidingWindowCounterRateLimiter(m.limiter._storage)
+    client = m.app.test_client()
+    addresses = iter(range(10 ** 9))
+
+    def call():
+        n = next(addresses)
+        client.get('/api/v1/info', environ_base={'REMOTE_ADDR': f'10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}'})
+
+    # Alternate limiter off/on request by request so drift hits both sides equally
+    samples = {False: [], True: []}
+    for i in range(2 * runs):
+        m.limiter.enabled = bool(i % 2)
+        started = time.perf_counter()
+        call()
+        samples[m.limiter.enabled].append(time.perf_counter() - started)
+    m.limiter.enabled = False
+    return (statistics.median(samples[True]) - statistics.median(samples[False])) * 1e6
+
+
+def race(uri, limit, attempts, results):
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    item = parse(f'{limit} per hour')
+    results.put(sum(limiter.hit(item, 'race') for _ in range(attempts)))
+
+
+def allowed_across_processes(uri, processes, limit):
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [context.Process(target=race, args=(uri, limit, limit, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    allowed = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    return allowed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hits', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=2000, help='requests per route measurement')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--limit', type=int, default=1000)
+    args = parser.parse_args()
+
+    m = load_app()
+    scratch = tempfile.mkdtemp(prefix='ssp-bench-')
+    storages = [('memory://', lambda name: 'memory://'),
+                ('sqlite (rate_limits.py)', lambda name: f'sqlite:///{os.path.join(scratch, name)}.db')]
+
+    rows = []
+    for name, uri in storages:
+        rows.append({
+            'storage': name,
+            'hit_us': round(hit_cost_us(uri('hits'), args.hits), 1),
+            'route_us': round(route_cost_us(m, uri('route'), args.runs), 1),
+            'allowed': allowed_across_processes(uri('race'), args.processes, args.limit),
+        })
+
+    print(f'{args.processes} processes racing for "{args.limit} per hour" ({args.processes * args.limit} attempts)\n')
+    print_table(rows, ['storage', 'hit_us', 'route_us', 'allowed'])
+
+
+if __name__ == '__main__':
+    main()
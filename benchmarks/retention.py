@@ -0,0 +1,87 @@
+"""Analytics cost before and after compacting old history into study_summaries.
+
+Seeds one user with --rows study sessions and --rows moods spread over --days
+days, then times the analytics that read raw history:
+- failure: GET /api/v1/analytics/failure?days=<--days> (best study hours)
+- heatmap_backfill: compute_heatmap_buckets over the whole history
+- stats_backfill: compute_user_stats
+Then it runs compact_history with --retention days kept raw and times the same
+calls again. Their results must not change; their cost should now follow the
+retention window (plus at most 24 summary rows per day) instead of the history.
+
+    python -m benchmarks.retention --rows 300000 --days 1095 --retention 90
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import auth_headers, load_app, measure, print_table, seed_users, summarize
+
+
+def analytics(m, client, user_id, headers, days):
+    """Named (callable, result) pairs for every analytics path that reads raw history"""
+    def failure():
+        response = client.get(f'/api/v1/analytics/failure?days={days}', headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()['best_study_hours']
+
+    def heatmap_backfill():
+        with m.app.app_context():
+            return sorted(m.compute_heatmap_buckets(user_id))
+
+    def stats_backfill():
+        with m.app.app_context():
+            return m.compute_user_stats(user_id)
+
+    return {'failure': failure, 'heatmap_backfill': heatmap_backfill, 'stats_backfill': stats_backfill}
+
+
+def archive_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=300000, help='sessions and moods each')
+    parser.add_argument('--days', type=int, default=1095, help='history length')
+    parser.add_argument('--retention', type=int, default=90, help='days kept as raw rows')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    m = load_app()
+    (user_id,) = seed_users(m, users=1, subjects=20, sessions=args.rows, moods=args.rows, reflections=100,
+                            days=args.days)
+    headers = auth_headers(m, user_id)
+    client = m.app.test_client()
+    calls = analytics(m, client, user_id, headers, args.days + 1)
+
+    before = {name: (call(), summarize(measure(call, runs=args.runs, warmup=1))) for name, call in calls.items()}
+
+    archive_dir = tempfile.mkdtemp(prefix='ssp-archive-')
+    with m.app.app_context():
+        started = time.perf_counter()
+        compacted = m.compact_history(args.retention, archive_dir, args.chunk_size)
+        seconds = time.perf_counter() - started
+        summaries = m.StudySummary.query.filter_by(user_id=user_id).count()
+
+    rows = []
+    for name, call in calls.items():
+        result, timing = call(), summarize(measure(call, runs=args.runs, warmup=1))
+        rows.append({
+            'call': name, 'before_ms': before[name][1]['p50_ms'], 'after_ms': timing['p50_ms'],
+            'speedup': round(before[name][1]['p50_ms'] / timing['p50_ms'], 1),
+            'same_result': result == before[name][0],
+        })
+
+    total = sum(compacted.values())
+    print(f'{args.rows} sessions + {args.rows} moods over {args.days} days, {args.retention} days kept raw\n')
+    print(f'compacted {total} rows in {seconds:.1f}s ({total / seconds:.0f} rows/s) into {summaries} summary rows; '
+          f'archive {archive_bytes(archive_dir) / 2 ** 20:.1f} MB\n')
+    print_table(rows, ['call', 'before_ms', 'after_ms', 'speedup', 'same_result'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Rows serialized per second by the list routes, per JSON provider.
+
+Seeds one user with --rows subjects and --rows study sessions, then times
+GET /api/subjects (every subject in one response), GET /api/sessions at the
+largest page size, and the NDJSON stream of every session. Each route runs
+once per provider in --providers ('stdlib' is Flask's json module, 'orjson'
+needs `pip install orjson`).
+
+    python -m benchmarks.serialization --rows 10000
+"""
+
+import argparse
+
+from benchmarks.common import auth_headers, load_app, measure, print_table, seed_users, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--providers', nargs='+', default=['stdlib', 'orjson'])
+    args = parser.parse_args()
+
+    m = load_app()
+    (user_id,) = seed_users(m, users=1, subjects=args.rows, sessions=args.rows, moods=0, reflections=0)
+    headers = auth_headers(m, user_id)
+    client = m.app.test_client()
+    page = m.app.config['PAGE_SIZE_MAX']
+    routes = [
+        ('/api/subjects', args.rows),
+        (f'/api/sessions?limit={page}', min(page, args.rows)),
+        ('/api/sessions?format=ndjson', args.rows),
+    ]
+
+    rows = []
+    for provider in args.providers:
+        if provider not in m.JSON_PROVIDERS or (provider == 'orjson' and m.orjson is None):
+            print(f'skipping {provider}: not available')
+            continue
+        m.app.json = m.JSON_PROVIDERS[provider](m.app)
+        for url, count in routes:
+            def call():
+                response = client.get(url, headers=headers)
+                assert response.status_code == 200, response.status_code
+                response.get_data()
+
+            stats = summarize(measure(call, runs=args.runs))
+            rows.append({
+                'provider': provider, 'route': url, 'rows': count,
+                'mean_ms': stats['mean_ms'], 'rows_per_s': round(count / stats['mean_ms'] * 1000)
+            })
+
+    print(f'{args.rows} subjects and sessions for one user, {args.runs} runs per route\n')
+    print_table(rows, ['provider', 'route', 'rows', 'mean_ms', 'rows_per_s'])
+
+
+if __name__ == '__main__':
+    main()
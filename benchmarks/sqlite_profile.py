@@ -0,0 +1,114 @@
+"""Read throughput under concurrent writes: SQLite defaults vs. the tuned profile.
+
+Each profile runs in a fresh process with its own database (the settings are
+read when app.py is imported). --readers threads poll /api/subjects and
+/api/analytics/summary while --writers threads record study sessions, for
+--seconds. Failed requests (e.g. "database is locked") are counted as errors.
+
+    python -m benchmarks.sqlite_profile --readers 8 --writers 2 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import auth_headers, load_app, print_table, seed_users, summarize
+
+PROFILES = [
+    ('rollback journal, defaults', {
+        'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_CACHE_SIZE': '-2000', 'DATABASE_READ_ENGINE': 'false'
+    }),
+    ('WAL + pragmas, one engine', {'DATABASE_READ_ENGINE': 'false'}),
+    ('WAL + pragmas, read engine', {}),
+]
+
+READ_URLS = ['/api/subjects', '/api/analytics/summary']
+
+
+def run_profile(args):
+    """Drive the load in this process and return one result row"""
+    m = load_app()
+    user_ids = seed_users(m, users=args.readers + args.writers, subjects=20, sessions=2000, moods=0, reflections=0)
+    headers = {user_id: auth_headers(m, user_id) for user_id in user_ids}
+    stop = threading.Event()
+    lock = threading.Lock()
+    reads, writes, errors = [], [], []
+
+    def reader(user_id):
+        client = m.app.test_client()
+        samples, failed, i = [], 0, 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.get(READ_URLS[i % len(READ_URLS)], headers=headers[user_id])
+            samples.append((time.perf_counter() - started) * 1000)
+            failed += response.status_code != 200
+            i += 1
+        with lock:
+            reads.extend(samples)
+            errors.append(failed)
+
+    def writer(user_id):
+        client = m.app.test_client()
+        samples, failed = [], 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = client.post('/api/sessions', json={'duration_minutes': 25}, headers=headers[user_id])
+            samples.append((time.perf_counter() - started) * 1000)
+            failed += response.status_code != 201
+        with lock:
+            writes.extend(samples)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=reader, args=(user_id,)) for user_id in user_ids[:args.readers]]
+    threads += [threading.Thread(target=writer, args=(user_id,)) for user_id in user_ids[args.readers:]]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    read_stats = summarize(reads)
+    return {
+        'reads_per_s': round(len(reads) / args.seconds, 1),
+        'read_p50_ms': read_stats['p50_ms'],
+        'read_p99_ms': read_stats['p99_ms'],
+        'writes_per_s': round(len(writes) / args.seconds, 1),
+        'write_p99_ms': summarize(writes)['p99_ms'] if writes else '-',
+        'errors': sum(errors)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--run-profile', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        print(json.dumps(run_profile(args)))
+        return 0
+
+    rows = []
+    for name, env in PROFILES:
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.sqlite_profile', '--run-profile', '--readers', str(args.readers),
+             '--writers', str(args.writers), '--seconds', str(args.seconds)],
+            env={**os.environ, **env}, capture_output=True, text=True, check=True
+        )
+        rows.append({'profile': name, **json.loads(result.stdout.strip().splitlines()[-1])})
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile\n')
+    print_table(rows, ['profile', 'reads_per_s', 'read_p50_ms', 'read_p99_ms', 'writes_per_s', 'write_p99_ms', 'errors'])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
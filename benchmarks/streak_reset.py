@@ -0,0 +1,113 @@
+"""Benchmark the nightly streak reset on a large gamification table.
+
+Seeds --rows gamification rows spread over several UTC offsets, runs
+reset_expired_streaks() (what `flask reset-streaks` calls) and checks its
+result against the same rule evaluated in Python. For comparison, it also
+times the per-user ORM approach (load, check, commit) on a sample and
+extrapolates the result.
+
+    python -m benchmarks.streak_reset --rows 1000000
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import load_app, print_table
+
+OFFSETS = [-480, -300, -180, 0, 60, 120, 330, 480, 540, 600, 780]
+
+
+def seed_gamification(m, rows, now, seed=0, batch_size=50000):
+    """Insert bare gamification rows; returns the number whose streak has lapsed"""
+    rng = random.Random(seed)
+    table = m.Gamification.__table__
+    expected = 0
+    with m.app.app_context():
+        for start in range(0, rows, batch_size):
+            batch = []
+            for user_id in range(start + 1, min(rows, start + batch_size) + 1):
+                offset = rng.choice(OFFSETS)
+                streak = rng.choice([0, 1, 3, 7, 12, 30])
+                last = now - timedelta(minutes=rng.randrange(4 * 24 * 60)) if streak else None
+                if streak and last < m.local_day_start(now, offset) - timedelta(days=1):
+                    expected += 1
+                batch.append({
+                    'user_id': user_id, 'xp': 0, 'level': 1, 'streak': streak, 'total_minutes_studied': 0,
+                    'last_study_date': last, 'badges_earned': '[]', 'badges_mask': 0, 'current_mode': 'normal',
+                    'utc_offset_minutes': offset
+                })
+            m.db.session.execute(table.insert(), batch)
+        m.db.session.commit()
+    return expected
+
+
+def legacy_reset(m, sample, now):
+    """One ORM round trip per user, as the job would look without set-based SQL"""
+    with m.app.app_context():
+        started = time.perf_counter()
+        for user_id in range(1, sample + 1):
+            gamif = m.Gamification.query.filter_by(user_id=user_id).first()
+            local_today = (now + timedelta(minutes=gamif.utc_offset_minutes)).date()
+            last = gamif.last_study_date
+            if gamif.streak and (last is None or (last + timedelta(minutes=gamif.utc_offset_minutes)).date() < local_today - timedelta(days=1)):
+                gamif.streak = 0
+            m.db.session.commit()
+        return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=50000)
+    parser.add_argument('--legacy-sample', type=int, default=5000, help='users timed on the per-user ORM path')
+    args = parser.parse_args()
+
+    m = load_app()
+    now = datetime.utcnow()
+
+    started = time.perf_counter()
+    expected = seed_gamification(m, args.rows, now)
+    print(f'Seeded {args.rows} gamification rows in {time.perf_counter() - started:.1f}s')
+
+    legacy_seconds = legacy_reset(m, min(args.legacy_sample, args.rows), now)
+
+    # The sample above was reset too; reseed so both paths start from the same data
+    with m.app.app_context():
+        m.Gamification.query.delete()
+        m.ChangeLogEntry.query.delete()
+        m.db.session.commit()
+    seed_gamification(m, args.rows, now)
+
+    with m.app.app_context():
+        started = time.perf_counter()
+        reset = m.reset_expired_streaks(now=now, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - started
+
+        stale = 0
+        for offset in OFFSETS:
+            stale += m.Gamification.query.filter(
+                m.Gamification.utc_offset_minutes == offset,
+                m.Gamification.streak > 0,
+                m.Gamification.last_study_date < m.local_day_start(now, offset) - timedelta(days=1)
+            ).count()
+
+    sample = min(args.legacy_sample, args.rows)
+    print_table([
+        {'path': 'set-based chunks', 'rows': args.rows, 'reset': reset, 'seconds': round(elapsed, 2),
+         'rows_per_s': int(args.rows / elapsed)},
+        {'path': 'per-user ORM (extrapolated)', 'rows': args.rows, 'seconds': round(legacy_seconds / sample * args.rows, 1),
+         'rows_per_s': int(sample / legacy_seconds)},
+    ], ['path', 'rows', 'reset', 'seconds', 'rows_per_s'])
+
+    if reset != expected or stale:
+        print(f'\nFAIL expected {expected} resets, got {reset}; {stale} lapsed streaks remain')
+        return 1
+    print(f'\nAll {expected} lapsed streaks reset')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
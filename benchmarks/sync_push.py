@@ -0,0 +1,100 @@
+"""Idle-client cost and change latency: polling /sync/status vs. the /sync/wait long-poll.
+
+--clients threads each stand in for an open app that waits for its own
+user's data to change. They either poll GET /api/v1/sync/status every
+--poll-interval seconds or hold GET /api/v1/sync/wait open. The script first
+measures process CPU time while nothing changes for --seconds. It then records
+--writes study sessions for random clients and times how long each client
+takes to notice its write.
+
+    python -m benchmarks.sync_push --clients 200 --seconds 10 --writes 50
+"""
+
+import argparse
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.common import auth_headers, load_app, print_table, seed_users, summarize
+
+
+def run(m, mode, headers, seconds, writes, poll_interval, seed=0):
+    """Returns (process CPU ms per idle second, change-notice latencies in ms)"""
+    stop = threading.Event()
+    noticed = {user_id: queue.Queue() for user_id in headers}
+
+    def watch(user_id):
+        client = m.app.test_client()
+        cursor = client.get('/api/v1/sync/status', headers=headers[user_id]).json['cursor']
+        while not stop.is_set():
+            if mode == 'poll':
+                latest = client.get('/api/v1/sync/status', headers=headers[user_id]).json['cursor']
+            else:
+                latest = client.get(f'/api/v1/sync/wait?since={cursor}', headers=headers[user_id]).json['cursor']
+            if latest > cursor:
+                cursor = latest
+                noticed[user_id].put(time.perf_counter())
+            if mode == 'poll':
+                stop.wait(poll_interval)
+
+    threads = [threading.Thread(target=watch, args=(user_id,)) for user_id in headers]
+    for thread in threads:
+        thread.start()
+    time.sleep(min(2.0, poll_interval))  # let every client make its first request
+
+    cpu = time.process_time()
+    time.sleep(seconds)
+    idle_cpu_ms = (time.process_time() - cpu) * 1000 / seconds
+
+    rng = random.Random(seed)
+    writer = m.app.test_client()
+    latencies = []
+    for _ in range(writes):
+        user_id = rng.choice(list(headers))
+        started = time.perf_counter()
+        writer.post('/api/sessions', json={'duration_minutes': 25}, headers=headers[user_id])
+        latencies.append((noticed[user_id].get(timeout=poll_interval + 30) - started) * 1000)
+
+    stop.set()
+    # Wake the long-polls with one change each so they return now rather than at their timeout
+    with m.app.app_context():
+        m.db.session.execute(m.ChangeLogEntry.__table__.insert(), [
+            {'user_id': user_id, 'entity': 'sessions', 'entity_id': 0, 'op': 'upsert', 'changed_at': datetime.utcnow()}
+            for user_id in headers
+        ])
+        m.db.session.commit()
+    m.change_notifier.publish(headers)
+    for thread in threads:
+        thread.join()
+    return idle_cpu_ms, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--writes', type=int, default=50)
+    parser.add_argument('--poll-interval', type=float, default=5)
+    args = parser.parse_args()
+
+    m = load_app()
+    user_ids = seed_users(m, users=args.clients, subjects=5, sessions=0, moods=0, reflections=0)
+    headers = {user_id: auth_headers(m, user_id) for user_id in user_ids}
+
+    rows = []
+    for name, mode in [(f'poll /sync/status every {args.poll_interval:g}s', 'poll'), ('long-poll /sync/wait', 'wait')]:
+        idle_cpu_ms, latencies = run(m, mode, headers, args.seconds, args.writes, args.poll_interval)
+        stats = summarize(latencies)
+        rows.append({
+            'mode': name, 'idle_cpu_ms_per_s': round(idle_cpu_ms, 1),
+            'notice_p50_ms': stats['p50_ms'], 'notice_p99_ms': stats['p99_ms']
+        })
+
+    print(f'{args.clients} idle clients, {args.seconds:g}s idle, {args.writes} writes\n')
+    print_table(rows, ['mode', 'idle_cpu_ms_per_s', 'notice_p50_ms', 'notice_p99_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Per-endpoint request and SQL metrics, rendered in the Prometheus text format.
+
+A request is timed from Flask's request_started signal to its after_request
+hook. SQLAlchemy cursor events add every statement it runs to the request's
+record. A record lives in a ContextVar, so statements on other threads
+(watchers, pools) are never attributed to a request. Finished records are
+folded into per-endpoint counters and histograms under one lock.
+
+When a single request runs the same SELECT `n_plus_one_threshold` times or
+more, that is the N+1 shape: a query per row of an earlier result. (Repeated
+INSERTs are not: that is how SQLAlchemy writes rows whose ids it needs back in
+order.) The first occurrence per endpoint and statement is logged as a
+warning, and every occurrence is counted.
+
+Counters are per process; with several workers, scrape each one or sum them.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+PREFIX = 'study_planner'
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot: above every bound
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class RequestRecord:
+    __slots__ = ('started', 'statements', 'sql_seconds', 'statement_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = {}  # statement text -> executions
+        self.sql_seconds = 0.0
+        self.statement_started = 0.0
+
+
+current_record = ContextVar('current_record', default=None)
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestMetrics:
+    """Registry behind /api/v1/metrics"""
+
+    def __init__(self, n_plus_one_threshold, logger):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._requests = Counter()  # (endpoint, method, status) -> requests
+        self._latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._statements = defaultdict(lambda: Histogram(STATEMENT_BUCKETS))
+        self._sql_seconds = Counter()
+        self._n_plus_one = Counter()
+        self._warned = set()
+
+    # ---- request hooks ----
+
+    def start(self, *args, **kwargs):
+        """request_started receiver"""
+        current_record.set(RequestRecord())
+
+    def finish(self, endpoint, method, status):
+        record = current_record.get()
+        if record is None:
+            return
+        current_record.set(None)
+        elapsed = time.perf_counter() - record.started
+        endpoint = endpoint or 'unmatched'
+        repeated = [(statement, count) for statement, count in record.statements.items()
+                    if count >= self.n_plus_one_threshold and statement.lstrip()[:6].upper() == 'SELECT']
+        with self._lock:
+            self._requests[endpoint, method, status] += 1
+            self._latency[endpoint].observe(elapsed)
+            self._statements[endpoint].observe(sum(record.statements.values()))
+            self._sql_seconds[endpoint] += record.sql_seconds
+            if repeated:
+                self._n_plus_one[endpoint] += 1
+                repeated = [(statement, count) for statement, count in repeated
+                            if (endpoint, statement) not in self._warned]
+                self._warned.update((endpoint, statement) for statement, count in repeated)
+        for statement, count in repeated:
+            self.logger.warning('Possible N+1 query in %s: ran %d times in one request: %s',
+                                endpoint, count, ' '.join(statement.split())[:300])
+
+    # ---- SQLAlchemy engine events ----
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        record = current_record.get()
+        if record is not None:
+            record.statements[statement] = record.statements.get(statement, 0) + 1
+            record.statement_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        record = current_record.get()
+        if record is not None:
+            record.sql_seconds += time.perf_counter() - record.statement_started
+
+    # ---- exposition ----
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            latency = {endpoint: (list(h.counts), h.sum) for endpoint, h in self._latency.items()}
+            statements = {endpoint: (list(h.counts), h.sum) for endpoint, h in self._statements.items()}
+            sql_seconds = sorted(self._sql_seconds.items())
+            n_plus_one = sorted(self._n_plus_one.items())
+
+        lines = [
+            f'# HELP {PREFIX}_http_requests_total Requests handled, by endpoint, method and status.',
+            f'# TYPE {PREFIX}_http_requests_total counter',
+        ]
+        lines += [f'{PREFIX}_http_requests_total{{{_labels(endpoint=e, method=m, status=s)}}} {n}'
+                  for (e, m, s), n in requests]
+        lines += self._histogram(f'{PREFIX}_http_request_duration_seconds',
+                                 'Time from request start to response, in seconds.', LATENCY_BUCKETS, latency)
+        lines += self._histogram(f'{PREFIX}_sql_statements_per_request',
+                                 'SQL statements executed per request.', STATEMENT_BUCKETS, statements)
+        lines += [
+            f'# HELP {PREFIX}_sql_duration_seconds_total Time spent executing SQL, by endpoint.',
+            f'# TYPE {PREFIX}_sql_duration_seconds_total counter',
+        ]
+        lines += [f'{PREFIX}_sql_duration_seconds_total{{{_labels(endpoint=e)}}} {_format(s)}' for e, s in sql_seconds]
+        lines += [
+            f'# HELP {PREFIX}_n_plus_one_requests_total Requests that repeated one SELECT at least '
+            f'{self.n_plus_one_threshold} times.',
+            f'# TYPE {PREFIX}_n_plus_one_requests_total counter',
+        ]
+        lines += [f'{PREFIX}_n_plus_one_requests_total{{{_labels(endpoint=e)}}} {n}' for e, n in n_plus_one]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram(name, help_text, bounds, series):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for endpoint in sorted(series):
+            counts, total = series[endpoint]
+            cumulative = 0
+            for bound, count in zip((*bounds, '+Inf'), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format(float(bound))
+                lines.append(f'{name}_bucket{{{_labels(endpoint=endpoint, le=le)}}} {cumulative}')
+            lines.append(f'{name}_sum{{{_labels(endpoint=endpoint)}}} {_format(float(total))}')
+            lines.append(f'{name}_count{{{_labels(endpoint=endpoint)}}} {cumulative}')
+        return lines
@@ -0,0 +1,139 @@
+"""Weekly study planner engine.
+
+Spreads each subject's remaining chapters over the next seven days in
+proportion to urgency, without exceeding each day's minute budget and without
+scheduling a subject on or after its deadline, except that one due today is
+planned today. Scoring and allocation run as NumPy array operations over all
+subjects at once, so plans for hundreds of subjects take milliseconds.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DIFFICULTY_WEIGHTS = {'easy': 1, 'medium': 2, 'hard': 3}
+PRIORITY_WEIGHTS = {'low': 1, 'medium': 2, 'high': 3}
+MINUTES_PER_CHAPTER = 30
+EXAM_MODE_PACE = 1.5  # exam mode plans this much more than the steady pace
+
+
+def score_subjects(chapters, completed, difficulty, priority, days_left):
+    """Urgency per subject: chapters_left / days_left * difficulty_weight * priority_weight"""
+    chapters_left = np.maximum(chapters - completed, 0)
+    return chapters_left / np.maximum(days_left, 1) * difficulty * priority
+
+
+def _fill(capacity, weights, limits):
+    """Split `capacity` whole chapters across subjects in proportion to `weights`, capped at `limits`"""
+    alloc = np.zeros_like(limits)
+    while capacity > 0:
+        room = limits - alloc
+        active = (room > 0) & (weights > 0)
+        if not active.any():
+            break
+        active_weights = np.where(active, weights, 0.0)
+        step = np.minimum(np.floor(capacity * active_weights / active_weights.sum()), room).astype(limits.dtype)
+        if step.sum() == 0:
+            # Shares below one chapter go to the most urgent subjects first
+            order = np.argsort(-active_weights, kind='stable')[:capacity]
+            step = np.zeros_like(limits)
+            step[order[active[order]]] = 1
+        alloc += step
+        capacity -= int(step.sum())
+    return alloc
+
+
+def build_weekly_plan(subjects, today, daily_minutes, mode='normal', minutes_per_chapter=MINUTES_PER_CHAPTER):
+    """Plan the seven days starting at `today`.
+
+    subjects: sequence of (id, name, chapters, completed_chapters, difficulty, priority, deadline)
+    daily_minutes: seven minute budgets, one per plan day starting at `today`
+
+    Returns (plan, plan_dates, overflow): plan maps weekday name to the day's items,
+    plan_dates maps weekday name to its ISO date, and overflow lists chapters that
+    are due this week but did not fit into the budgets.
+    """
+    plan = {day: [] for day in DAYS}
+    dates = [today + timedelta(days=offset) for offset in range(7)]
+    plan_dates = {DAYS[d.weekday()]: d.isoformat() for d in dates}
+    if not subjects:
+        return plan, plan_dates, []
+
+    ids, names, chapters, completed, difficulties, priorities, deadlines = zip(*subjects)
+    chapters = np.array(chapters, dtype=np.int64)
+    completed = np.array([c or 0 for c in completed], dtype=np.int64)
+    difficulty = np.array([DIFFICULTY_WEIGHTS.get(d, 2) for d in difficulties], dtype=np.float64)
+    priority = np.array([PRIORITY_WEIGHTS.get(p, 2) for p in priorities], dtype=np.float64)
+    deadline_offset = np.array([(d.date() - today).days for d in deadlines], dtype=np.int64)
+
+    chapters_left = np.maximum(chapters - completed, 0)
+    urgency = score_subjects(chapters, completed, difficulty, priority, deadline_offset)
+
+    # Work due this week: everything for deadlines inside the horizon, otherwise the steady pace
+    horizon = np.clip(deadline_offset, 1, None)
+    pace = np.ceil(chapters_left * np.minimum(7, horizon) / horizon)
+    if mode == 'exam':
+        pace = np.ceil(pace * EXAM_MODE_PACE)
+    remaining = np.minimum(chapters_left, pace).astype(np.int64)
+    due_this_week = remaining.copy()
+
+    # Subjects stop the day before their deadline, or study today when it is due today;
+    # overdue ones may use the whole week
+    last_day = np.where(deadline_offset < 0, 7, np.clip(deadline_offset, 1, 7))
+    deadline_bound = deadline_offset <= 7
+    capacity = np.array(daily_minutes, dtype=np.int64) // minutes_per_chapter
+    # study_days[n]: days among the first n with any capacity, so rest days do not count towards the pace
+    study_days = np.concatenate(([0], np.cumsum(capacity > 0)))
+    schedule = np.zeros((7, len(subjects)), dtype=np.int64)
+
+    for offset in range(7):
+        eligible = (last_day > offset) & (remaining > 0)
+        if not eligible.any() or capacity[offset] <= 0:
+            continue
+
+        # Even pace to finish before the deadline; deadlines inside the week claim capacity
+        # first, then extra capacity (exam mode) pulls later work forward
+        days_available = np.maximum(study_days[last_day] - study_days[offset], 1)
+        required = np.where(eligible, np.ceil(remaining / days_available), 0).astype(np.int64)
+        bound_required = np.where(deadline_bound, required, 0)
+        alloc = _fill(int(capacity[offset]), urgency * bound_required, bound_required)
+        open_required = required - bound_required
+        alloc += _fill(int(capacity[offset] - alloc.sum()), urgency * open_required, open_required)
+        if mode == 'exam':
+            spare = int(capacity[offset] - alloc.sum())
+            alloc += _fill(spare, np.where(eligible, urgency, 0.0), remaining - alloc)
+
+        schedule[offset] = alloc
+        remaining -= alloc
+
+    # Work the even pace left over (rounding, rest days) takes whatever capacity is still free
+    # before it counts as overflow
+    for offset in range(7):
+        spare = int(capacity[offset] - schedule[offset].sum())
+        eligible = (last_day > offset) & (remaining > 0)
+        if spare <= 0 or not eligible.any():
+            continue
+        alloc = _fill(spare, np.where(eligible, urgency, 0.0), np.where(eligible, remaining, 0))
+        schedule[offset] += alloc
+        remaining -= alloc
+
+    by_urgency = np.argsort(-urgency, kind='stable')
+    for offset, day_date in enumerate(dates):
+        day_items = plan[DAYS[day_date.weekday()]]
+        for i in by_urgency[schedule[offset, by_urgency] > 0]:
+            day_chapters = int(schedule[offset, i])
+            day_items.append({
+                'subject_name': names[i],
+                'subject_id': ids[i],
+                'chapters': day_chapters,
+                'difficulty': difficulties[i],
+                'priority': priorities[i],
+                'recommended_duration_mins': day_chapters * minutes_per_chapter
+            })
+
+    overflow = [
+        {'subject_id': ids[i], 'subject_name': names[i], 'chapters': int(remaining[i]), 'due_this_week': int(due_this_week[i])}
+        for i in by_urgency if remaining[i] > 0
+    ]
+    return plan, plan_dates, overflow
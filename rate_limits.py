@@ -0,0 +1,158 @@
+"""SQLite storage for Flask-Limiter, shared by every worker process on a host.
+
+Importing this module registers the `sqlite` scheme with the `limits` library:
+
+    RATELIMIT_STORAGE_URI=sqlite:////var/lib/smart-study-planner/ratelimits.db
+
+Counters live in one WITHOUT ROWID table of (key, count, expires_at). The file
+runs in WAL mode with synchronous=OFF: losing the last few hits on a power cut
+is harmless, and a hit costs one short write instead of an fsync. A sliding
+window hit is checked and counted by a single UPSERT statement, which SQLite
+runs atomically, so concurrent workers cannot both take the last slot.
+
+Supports the fixed-window and sliding-window-counter strategies.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+'''
+
+# Add `amount` to a live counter, or restart an expired one with a fresh expiry
+UPSERT = '''
+INSERT INTO rate_limits (key, count, expires_at) VALUES (?1, ?2, ?3)
+ON CONFLICT (key) DO UPDATE SET
+    count = CASE WHEN expires_at > ?4 THEN count + ?2 ELSE ?2 END,
+    expires_at = CASE WHEN expires_at > ?4 THEN expires_at ELSE ?3 END
+RETURNING count
+'''
+
+# Sliding window hit: count it in the current window only if the weighted total stays within the
+# limit. ?5 is the previous window's weight and ?6 its key. The row comes back only when counted.
+ACQUIRE = '''
+INSERT INTO rate_limits (key, count, expires_at)
+SELECT ?1, ?2, ?3
+WHERE CAST(?5 * (SELECT coalesce(sum(count), 0) FROM rate_limits WHERE key = ?6 AND expires_at > ?4) AS INTEGER)
+      + ?2 <= ?7
+ON CONFLICT (key) DO UPDATE SET
+    count = CASE WHEN expires_at > ?4 THEN count + ?2 ELSE ?2 END,
+    expires_at = CASE WHEN expires_at > ?4 THEN expires_at ELSE ?3 END
+WHERE CAST(?5 * (SELECT coalesce(sum(count), 0) FROM rate_limits WHERE key = ?6 AND expires_at > ?4) AS INTEGER)
+      + CASE WHEN expires_at > ?4 THEN count ELSE 0 END + ?2 <= ?7
+RETURNING count
+'''
+
+PURGE_INTERVAL = 60  # seconds between sweeps of expired counters
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """`limits` storage over a local SQLite file (`sqlite:///relative.db` or `sqlite:////absolute.db`)"""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, busy_timeout=5.0, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split('://', 1)[1][1:] or ':memory:'
+        self.busy_timeout = float(busy_timeout)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        self._next_purge = 0.0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self):
+        # One connection per process (a forked worker must not reuse its parent's)
+        if self._pid != os.getpid():
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _execute(self, sql, params):
+        """Run one statement (each is its own transaction) and fetch its rows"""
+        with self._lock:
+            connection = self._connect()
+            rows = connection.execute(sql, params).fetchall()
+            now = time.time()
+            if now >= self._next_purge:
+                connection.execute('DELETE FROM rate_limits WHERE expires_at <= ?', (now,))
+                self._next_purge = now + PURGE_INTERVAL
+            return rows
+
+    # ---- fixed window ----
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        return self._execute(UPSERT, (key, amount, now + expiry, now))[0][0]
+
+    def get(self, key):
+        rows = self._execute('SELECT count FROM rate_limits WHERE key = ? AND expires_at > ?', (key, time.time()))
+        return rows[0][0] if rows else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        rows = self._execute('SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?', (key, now))
+        return rows[0][0] if rows else now
+
+    def clear(self, key):
+        self._execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+    def check(self):
+        try:
+            self._execute('SELECT 1', ())
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self._lock:
+            return self._connect().execute('DELETE FROM rate_limits').rowcount
+
+    # ---- sliding window counter ----
+
+    @staticmethod
+    def _window(previous_count, current_count, expiry, now):
+        """(previous count, previous TTL, current count, current TTL), as limits' own storages report them"""
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_weight = 1 - (((now - expiry) / expiry) % 1)
+        # The current window's counter is still read as "previous" during the next window
+        return bool(self._execute(ACQUIRE, (current_key, amount, now + 2 * expiry, now, previous_weight,
+                                            previous_key, limit)))
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        counts = dict(self._execute('SELECT key, count FROM rate_limits WHERE key IN (?, ?) AND expires_at > ?',
+                                    (previous_key, current_key, now)))
+        return self._window(counts.get(previous_key, 0), counts.get(current_key, 0), expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._execute('DELETE FROM rate_limits WHERE key IN (?, ?)', (previous_key, current_key))